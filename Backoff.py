@@ -0,0 +1,56 @@
+import random
+from Exceptions import InvalidArgError
+
+
+class Backoff:
+    """
+    Delays between websocket reconnect attempts.
+
+    The first retry after a drop is immediate, most drops are one off and the
+    feed is back in a round trip. If that fails, delays double from `base` up to
+    `cap`, each jittered between half and all of it so reconnects don't line up.
+    `reset` once the feed is back to start over from an immediate retry.
+
+    Parameters:
+
+    `base: float`
+        secs to wait before the second retry. default 0.25
+
+    `cap: float`
+        max secs to wait between retries. default 30
+
+    Attributes:
+
+    `attempts: int`
+        retries since the last reset
+
+    Methods:
+
+    `next`
+        get secs to wait before the next retry
+
+    `reset`
+        start over from an immediate retry
+
+    """
+    def __init__(self, base=0.25, cap=30):
+        if base <= 0 or cap < base:
+            raise InvalidArgError([base, cap], "base must be positive and cap at least base.")
+        self.base = base
+        self.cap = cap
+        self.attempts = 0
+
+
+    def next(self):
+        """Returns secs to wait before the next retry."""
+        attempts = self.attempts
+        self.attempts += 1
+        if attempts == 0:
+            return 0
+        delay = min(self.cap, self.base * 2 ** (attempts - 1))
+        return delay / 2 + random.random() * delay / 2
+
+
+    def reset(self):
+        """Next retry is immediate again."""
+        self.attempts = 0
@@ -0,0 +1,434 @@
+import csv
+import json
+import logging
+import numpy as np
+from Capture import read_frames, BITMEX, TOKEN_ANALYST
+from TradeTape import parse_timestamps
+from SignalRules import EXCHANGES, EXCHANGE_BITS
+from Exceptions import InvalidArgError
+
+INFLOW = 1
+OUTFLOW = -1
+
+
+def exchange_mask(exchanges):
+    """Returns bitmask of exchange names, unknown names are ignored."""
+    mask = 0
+    for name in exchanges:
+        mask |= EXCHANGE_BITS.get(name, 0)
+    return mask
+
+
+def to_epoch_ms(timestamps):
+    """Returns array of epoch ms from ISO strs, epoch secs, or epoch ms."""
+    if len(timestamps) and isinstance(timestamps[0], str):
+        return parse_timestamps([t.replace('D', 'T') for t in timestamps])
+    ts = np.asarray(timestamps, dtype=np.int64)
+    # epoch secs are < 1e11 till the year 5138
+    if len(ts) and ts.max() < 1e11:
+        ts = ts * 1000
+    return ts
+
+
+
+class FlowData:
+    """
+    Token Analyst exchange flows as columns, sorted by time.
+
+    Columns - ts ( epoch ms ), value, flow ( 1 Inflow, -1 Outflow ), to and frm ( exchange bitmasks ).
+
+    Load with from_records, from_json_lines, from_csv, or from_capture.
+    """
+    def __init__(self, ts, value, flow, to, frm):
+        order = np.argsort(ts, kind='stable')
+        self.ts = np.asarray(ts, dtype=np.int64)[order]
+        self.value = np.asarray(value, dtype=np.float64)[order]
+        self.flow = np.asarray(flow, dtype=np.int8)[order]
+        self.to = np.asarray(to, dtype=np.int32)[order]
+        self.frm = np.asarray(frm, dtype=np.int32)[order]
+
+
+    def __len__(self):
+        return len(self.ts)
+
+
+    @classmethod
+    def from_records(cls, records):
+        """Returns FlowData from Token Analyst websocket data dicts."""
+        return cls(
+            to_epoch_ms([r['timestamp'] for r in records]),
+            [r['value'] for r in records],
+            [INFLOW if r['flowType'] == 'Inflow' else OUTFLOW for r in records],
+            [exchange_mask(r['to']) for r in records],
+            [exchange_mask(r['from']) for r in records]
+        )
+
+
+    @classmethod
+    def from_json_lines(cls, path):
+        """Returns FlowData from a file of one Token Analyst data dict per line."""
+        with open(path) as f:
+            return cls.from_records([json.loads(line) for line in f if line.strip()])
+
+
+    @classmethod
+    def from_csv(cls, path):
+        """Returns FlowData from csv with timestamp, flowType, value, to, and from columns, multiple exchanges split by '|'."""
+        with open(path, newline='') as f:
+            records = [
+                dict(row, value=float(row['value']), to=row['to'].split('|'), **{'from': row['from'].split('|')})
+                for row in csv.DictReader(f)
+            ]
+        return cls.from_records(records)
+
+
+    @classmethod
+    def from_capture(cls, path):
+        """Returns FlowData from Token Analyst data frames in a capture file."""
+        records = []
+        for feed, received, frame in read_frames(path):
+            if feed != TOKEN_ANALYST:
+                continue
+            msg = json.loads(frame)
+            if msg.get('event') == 'data':
+                records.append(msg['data'])
+        return cls.from_records(records)
+
+
+
+class TradeData:
+    """
+    Bitmex trades as columns, sorted by time.
+
+    Columns - ts ( epoch ms ), price, size, side ( 1 Buy, -1 Sell ).
+
+    Load with from_arrays, from_tape, from_csv ( public.bitmex.com trade dumps ), or from_capture.
+    """
+    def __init__(self, ts, price, size, side):
+        order = np.argsort(ts, kind='stable')
+        self.ts = np.asarray(ts, dtype=np.int64)[order]
+        self.price = np.asarray(price, dtype=np.float64)[order]
+        self.size = np.asarray(size, dtype=np.int64)[order]
+        self.side = np.asarray(side, dtype=np.int8)[order]
+
+
+    def __len__(self):
+        return len(self.ts)
+
+
+    @classmethod
+    def from_arrays(cls, ts, price, size, side):
+        return cls(ts, price, size, side)
+
+
+    @classmethod
+    def from_tape(cls, tape):
+        """Returns TradeData from a TradeTape."""
+        return cls(*tape.columns())
+
+
+    @classmethod
+    def from_csv(cls, path, symbol='XBTUSD'):
+        """Returns TradeData of symbol from a Bitmex trade csv ( timestamp, symbol, side, size, price, ... )."""
+        ts, price, size, side = [], [], [], []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                if symbol and row['symbol'] != symbol:
+                    continue
+                ts.append(row['timestamp'])
+                price.append(float(row['price']))
+                size.append(int(row['size']))
+                side.append(1 if row['side'] == 'Buy' else -1)
+        return cls(to_epoch_ms(ts), price, size, side)
+
+
+    @classmethod
+    def from_capture(cls, path, symbol='XBTUSD'):
+        """Returns TradeData of symbol from Bitmex trade frames in a capture file."""
+        ts, price, size, side = [], [], [], []
+        for feed, received, frame in read_frames(path):
+            if feed != BITMEX:
+                continue
+            msg = json.loads(frame)
+            if msg.get('table') != 'trade':
+                continue
+            for t in msg['data']:
+                if symbol and t['symbol'] != symbol:
+                    continue
+                ts.append(t['timestamp'])
+                price.append(t['price'])
+                size.append(t['size'])
+                side.append(1 if t['side'] == 'Buy' else -1)
+        return cls(to_epoch_ms(ts), price, size, side)
+
+
+
+class BacktestResult:
+    """
+    Per order results of a backtest, as arrays with one entry per signal.
+
+    Attributes:
+
+    `signal_ts, fill_ts, exit_ts: array<int>`
+        epoch ms, -1 if not filled
+
+    `qty: array<int>`
+        signed contracts, positive is long
+
+    `fill_price, exit_price: array<float>`
+        nan if not filled
+
+    `maker: array<bool>`
+        True if filled as maker
+
+    `fees, pnl: array<float>`
+        fees paid and pnl net of fees, in XBT for inverse contracts
+
+    Methods:
+
+    `summary`
+        get totals
+
+    """
+    def __init__(self, signal_ts, qty, fill_ts, fill_price, maker, exit_ts, exit_price, fees, pnl):
+        self.signal_ts = signal_ts
+        self.qty = qty
+        self.fill_ts = fill_ts
+        self.fill_price = fill_price
+        self.maker = maker
+        self.exit_ts = exit_ts
+        self.exit_price = exit_price
+        self.fees = fees
+        self.pnl = pnl
+
+
+    def __len__(self):
+        return len(self.signal_ts)
+
+
+    def summary(self):
+        """Returns dict of signals, orders filled, maker fills, fees, net pnl, and win rate."""
+        filled = self.fill_ts >= 0
+        return {
+            'signals': len(self),
+            'filled': int(filled.sum()),
+            'maker_fills': int(self.maker[filled].sum()),
+            'fees': float(self.fees[filled].sum()),
+            'pnl': float(self.pnl[filled].sum()),
+            'win_rate': float((self.pnl[filled] > 0).mean()) if filled.any() else 0.0
+        }
+
+
+
+class Backtester:
+    """
+    Vectorized backtester for flow triggered strategies.
+
+    Flow rules are evaluated over every flow at once, orders built for each signal
+    ( ie with the Trade class ) are filled against the trade history with latency and fees.
+
+    Attributes:
+
+    `flows: FlowData`
+        Token Analyst flows
+
+    `trades: TradeData`
+        Bitmex trades
+
+    `latency: float`
+        secs from flow to order reaching Bitmex, default 0.25
+
+    `taker_fee: float`
+        default 0.00075
+
+    `maker_fee: float`
+        negative is a rebate, default -0.00025
+
+    `inverse: boolean`
+        inverse contract ( pnl in XBT ) like XBTUSD, default True
+
+    Methods:
+
+    `signals`
+        get indexes of flows matching a rule
+
+    `last_prices`
+        get last trade price before each time
+
+    `run`
+        fill orders for signals and get results
+
+    """
+    def __init__(self, flows, trades, latency=0.25, taker_fee=0.00075, maker_fee=-0.00025, inverse=True):
+        self.flows = flows
+        self.trades = trades
+        self.latency = latency
+        self.taker_fee = taker_fee
+        self.maker_fee = maker_fee
+        self.inverse = inverse
+
+
+    def signals(self, flowType='Outflow', threshold=None, exchange='Bitmex', max_value=None):
+        """
+        Returns indexes of flows matching the rule, same rule as TokenAnalyst.check_for_inflow / check_for_outflow.
+
+        Parameters:
+
+        `flowType: str`
+            Inflow or Outflow
+
+        `threshold: float`
+            only flows with value >= threshold
+
+        `exchange: str or array<str>`
+            only flows to any of these exchanges, 'All' for any
+
+        `max_value: float`
+            only flows with value <= max_value
+        """
+        if flowType not in ('Inflow', 'Outflow'):
+            raise InvalidArgError(flowType, "flowType must be Inflow or Outflow.")
+
+        flows = self.flows
+        match = flows.flow == (INFLOW if flowType == 'Inflow' else OUTFLOW)
+        if threshold:
+            match &= flows.value >= threshold
+        if max_value is not None:
+            match &= flows.value <= max_value
+        if exchange != 'All':
+            exchanges = [exchange] if isinstance(exchange, str) else exchange
+            match &= (flows.to & exchange_mask(exchanges)) != 0
+        return np.flatnonzero(match)
+
+
+    def last_prices(self, ts):
+        """Returns last trade price at or before each epoch ms in ts, nan if none."""
+        i = np.searchsorted(self.trades.ts, ts, 'right') - 1
+        prices = np.full(len(i), np.nan)
+        ok = i >= 0
+        prices[ok] = self.trades.price[i[ok]]
+        return prices
+
+
+    def run(self, signals, make_order, hold=None, expire=None):
+        """
+        Builds an order for each signal and fills it against the trade history.
+
+        Market orders fill at the first trade after latency as taker.
+        Limit orders fill as taker if marketable after latency,
+        else as maker at their price once a trade prints through it.
+
+        Parameters:
+
+        `signals: array<int>`
+            flow indexes, from `signals`
+
+        `make_order: func`
+            called with (flow dict, last trade price), returns an order dict ( ie trade.limit_buy(...) ) or None
+
+        `hold: float`
+            secs to hold a fill before closing at market, if None pnl is marked at the last trade
+
+        `expire: float`
+            secs an unfilled limit order stays open, if None it stays open till the end
+
+        Returns:
+
+        `result: BacktestResult`
+        """
+        trades = self.trades
+        flows = self.flows
+        n = len(signals)
+        last = self.last_prices(flows.ts[signals])
+        latency_ms = int(self.latency * 1000)
+
+        signal_ts = flows.ts[signals]
+        qty = np.zeros(n, dtype=np.int64)
+        fill_idx = np.full(n, -1, dtype=np.int64)
+        fill_price = np.full(n, np.nan)
+        maker = np.zeros(n, dtype=bool)
+
+        for k, i in enumerate(signals):
+            flow = {
+                'timestamp': int(flows.ts[i]),
+                'value': float(flows.value[i]),
+                'flowType': 'Inflow' if flows.flow[i] == INFLOW else 'Outflow',
+                'to': [e for e in EXCHANGES if flows.to[i] & EXCHANGE_BITS[e]],
+                'from': [e for e in EXCHANGES if flows.frm[i] & EXCHANGE_BITS[e]]
+            }
+            order = make_order(flow, None if np.isnan(last[k]) else float(last[k]))
+            if not order:
+                continue
+            if order.get('stopPx') or order.get('execInst') == 'Close':
+                logging.warning("Backtester only fills market and limit orders, skipping %s" % order)
+                continue
+
+            side = 1 if order.get('side', 'Buy') == 'Buy' else -1
+            qty[k] = side * abs(order['orderQty'])
+            start = int(np.searchsorted(trades.ts, signal_ts[k] + latency_ms, 'left'))
+            if start >= len(trades):
+                continue
+
+            price = order.get('price')
+            if not price:
+                fill_idx[k], fill_price[k] = start, trades.price[start]
+                continue
+
+            # marketable limit, taker at the trade price
+            if trades.price[start] * side <= price * side:
+                fill_idx[k], fill_price[k] = start, trades.price[start]
+                continue
+
+            stop = len(trades)
+            if expire is not None:
+                stop = int(np.searchsorted(trades.ts, signal_ts[k] + latency_ms + int(expire * 1000), 'right'))
+            j = _first_through(trades.price, start, stop, price, side)
+            if j >= 0:
+                fill_idx[k], fill_price[k], maker[k] = j, price, True
+
+        filled = fill_idx >= 0
+        fill_ts = np.where(filled, trades.ts[np.maximum(fill_idx, 0)], -1)
+
+        # exits, market close after hold, or marked at the last trade
+        exit_price = np.full(n, np.nan)
+        exit_ts = np.full(n, -1, dtype=np.int64)
+        if len(trades):
+            if hold is None:
+                exit_idx = np.full(n, len(trades) - 1)
+            else:
+                exit_idx = np.minimum(np.searchsorted(trades.ts, fill_ts + int(hold * 1000), 'left'), len(trades) - 1)
+            exit_price[filled] = trades.price[exit_idx[filled]]
+            exit_ts[filled] = trades.ts[exit_idx[filled]]
+
+        fee_rate = np.where(maker, self.maker_fee, self.taker_fee)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.inverse:
+                entry_value = np.abs(qty) / fill_price
+                exit_value = np.abs(qty) / exit_price
+                gross = qty * (1 / fill_price - 1 / exit_price)
+            else:
+                entry_value = np.abs(qty) * fill_price
+                exit_value = np.abs(qty) * exit_price
+                gross = qty * (exit_price - fill_price)
+            fees = entry_value * fee_rate
+            if hold is not None:
+                fees = fees + exit_value * self.taker_fee
+
+        fees = np.where(filled, fees, 0.0)
+        pnl = np.where(filled, gross - fees, 0.0)
+        return BacktestResult(signal_ts, qty, fill_ts, fill_price, maker, exit_ts, exit_price, fees, pnl)
+
+
+
+def _first_through(prices, start, stop, limit, side):
+    """Returns first index in [start, stop) where price trades through limit ( below for Buy, above for Sell ), or -1."""
+    chunk = 1024
+    i = start
+    while i < stop:
+        seg = prices[i:min(i + chunk, stop)]
+        hits = np.flatnonzero(seg < limit if side == 1 else seg > limit)
+        if hits.size:
+            return i + int(hits[0])
+        i += chunk
+        chunk *= 4
+    return -1
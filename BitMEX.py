@@ -4,14 +4,23 @@ import asyncio
 import hashlib
 import hmac
 import time
-import requests
+import aiohttp
 import datetime
 import base64
 import uuid
 import logging
-import urllib
+import urllib.parse
+import fast_json
+from yarl import URL
 from colors import c
-from collections import deque
+from TableStore import TableStore
+from OrderBook import OrderBookL2
+from TradeTape import TradeTape, parse_timestamps
+from OrderManager import OrderManager
+from Metrics import metrics
+from Backoff import Backoff
+from Watchdog import Watchdog
+from Capture import BITMEX as CAPTURE_FEED
 from Exceptions import WebSocketError, InvalidArgError
 
 
@@ -32,7 +41,7 @@ class BitMEX:
         Bitmex API secret 
     
     `symbol: str`
-        trade symbol
+        default trade symbol
     
     `base_url: str` 
         base url for Bitmex REST API
@@ -46,11 +55,45 @@ class BitMEX:
     `timeout: int`
         timeout time, default is 8
 
+    `pool_size: int`
+        max number of pooled keep-alive HTTP connections, default is 10
+
+    `keepalive_timeout: int`
+        seconds an idle pooled connection is kept open, default is 30
+
+    `trade_capacity: int`
+        number of trades kept in the trade tape, default is 100000
+
+    `rate_limiter: RateLimiter`
+        optional, if supplied every REST call waits on it and syncs it from the rate limit headers
+
+    `recorder: FrameRecorder`
+        optional, if supplied every raw websocket frame is recorded to it
+
+    `dry_run: boolean`
+        if True, REST calls are logged but not sent, ie when replaying a capture. default False
+
+    `symbols: array<str>`
+        symbols to subscribe to trades and order book of, each gets its own trade tape and order book.
+        default is [symbol]
+
+    `journal: OrderJournal`
+        optional, if supplied every order sent, REST order response, and execution is journaled to it
+
+    `reconnect: Backoff`
+        optional, delays between websocket reconnect attempts. default Backoff()
+
+    `watchdog: Watchdog`
+        optional, pings the websocket and drops it when it goes quiet. default Watchdog('bitmex')
+
     Methods:
 
     `connect`
         connect to Bitmex websocket, subscribes to get position, margin, order, wallet, and trade data.
 
+    `close`
+        close websocket connection and HTTP connection pool
+
     `place_order`
         place an order on the Bitmex exchange
 
@@ -84,9 +127,12 @@ class BitMEX:
     `risk_limit`
         Update your risk limit. 
 
-    `get_positions`
+    `get_position_data`
         get your position data
 
+    `get_position`
+        get position data for a symbol
+
     `get_last_position`
         get last position data
 
@@ -96,6 +142,9 @@ class BitMEX:
     `get_last_margin_data`
         get last margin data
 
+    `get_order`
+        get order data by orderID
+
     `get_last_order_data`
         get last order data
 
@@ -105,78 +154,185 @@ class BitMEX:
     `get_last_trade_price`
         get last trade price
 
+    `get_order_book`
+        get L2 order book
+
+    `get_orders`
+        get our orders, indexed by clOrdID and orderID, by state
+
+    `is_stale`
+        check if market data may be out of date, don't trade on it if so
+
     """
-    def __init__(self, key, secret, symbol, base_url, ws_url, orderIDPrefex="traderbot_", timeout=8):
+    def __init__(self, key, secret, symbol, base_url, ws_url, orderIDPrefex="traderbot_", timeout=8, pool_size=10, keepalive_timeout=30, trade_capacity=100000, rate_limiter=None, recorder=None, dry_run=False, symbols=None, journal=None, reconnect=None, watchdog=None):
         self.name = "Bitmex"
         self._key = key
         self._secret = secret
         self.base_url = base_url
         self.symbol = symbol
+        self.symbols = list(symbols) if symbols else [symbol]
+        if symbol not in self.symbols:
+            self.symbols.insert(0, symbol)
         self._ws = None
         self._ws_url = ws_url
-        self._inflow_average = 0
-        self._inflow_total = 0
-        self._inflow_count = 0
-        self._session = requests.Session()
-        #self._session.headers.update({'user-agent': 'trader-bot9000b'})
-        self._session.headers.update({'content-type': 'application/json'})
-        self._session.headers.update({'accept': 'application/json'})
+        # HTTP session is created lazily, aiohttp needs a running event loop
+        self._session = None
+        self._session_headers = {
+            #'user-agent': 'trader-bot9000b',
+            'content-type': 'application/json',
+            'accept': 'application/json'
+        }
+        self._auth = BitmexHeaders(key, secret)
+        self._pool_size = pool_size
+        self._keepalive_timeout = keepalive_timeout
         self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.recorder = recorder
+        self.journal = journal
+        self.reconnect = reconnect or Backoff()
+        self.watchdog = watchdog or Watchdog('bitmex')
+        self.dry_run = dry_run
         self._orderIDPrefix = orderIDPrefex # cannot be longer than 13 chars long
-        self._order_IDs = []
         self.retries = 0 
-        # user / trade data
-        self.wallet_data = None
-        self.position_data = deque(maxlen=100)
-        self.margin_data = deque(maxlen=100)
-        self.order_data = deque(maxlen=100)
-        self.trade_data = deque(maxlen=100)
-        self.execution_data = deque(maxlen=100)
+        # True while the cancel from a 429 is being sent, so its own 429s don't cancel again
+        self._rate_limit_cancel = False
+        # user / trade data, kept up to date from websocket table messages
+        self.tables = TableStore(maxlen=1000, indexes={'position': ['symbol'], 'order': ['symbol'], 'execution': ['symbol']})
+        # market data per symbol, order_book and trade_tape are the default symbol's
+        self.order_books = dict((s, OrderBookL2(s)) for s in self.symbols)
+        self.trade_tapes = dict((s, TradeTape(capacity=trade_capacity)) for s in self.symbols)
+        self.order_book = self.order_books[symbol]
+        self.trade_tape = self.trade_tapes[symbol]
+        # our orders, from REST responses and the order and execution tables
+        self.orders = OrderManager(prefix=orderIDPrefex)
+        # websocket frame routing, table name -> handler, other tables go to _on_table
+        self._table_routes = {
+            'orderBookL2': self._on_order_book,
+            'trade': self._on_trade,
+            'order': self._on_order,
+            'execution': self._on_execution
+        }
+        # ( key in frame, msg type, handler ), checked in order, table data is left to the caller
+        self._msg_routes = (
+            ('table', 'TABLE', None),
+            ('info', 'INFO', self._on_info),
+            ('success', 'SUCCESS', self._on_success),
+            ('error', 'ERROR', self._on_error)
+        )
+
+        # stage latencies and counts, served by Metrics
+        self._frames = metrics.counter('traderbot_feed_messages_total', "websocket messages received", feed='bitmex')
+        self._frame_latency = metrics.histogram('traderbot_frame_seconds', "time to decode and handle a websocket frame", feed='bitmex')
+        self._reconnects = metrics.counter('traderbot_feed_reconnects_total', "websocket reconnects", feed='bitmex')
+        self._ack_latency = metrics.histogram('traderbot_order_ack_seconds', "order sent to its first websocket order update")
+        self._rate_limit_wait = metrics.histogram('traderbot_rate_limit_wait_seconds', "time waiting for a rate limit token")
+        self._gaps = metrics.counter('traderbot_feed_gaps_total', "gaps in data found after a reconnect", feed='bitmex')
+        self._outage = metrics.histogram('traderbot_feed_outage_seconds', "disconnect to state rebuilt on a new connection", feed='bitmex')
+        metrics.per_second(self._frames, 'traderbot_feed_messages_per_second', "websocket messages per second", feed='bitmex')
+        # clOrdID -> time.perf_counter_ns() it was sent, till the websocket tells us about it
+        self._ack_pending = {}
+        # time.perf_counter_ns() the websocket dropped, till every table has its new partial
+        self._down_since = None
+        # recent execIDs, so a resubscribe's execution partial isn't applied or journaled twice
+        self._exec_ids = {}
 
 
     # getters for Bitmex Data stored from websocket stream
     def get_position_data(self):
         """Returns all position data."""
-        return self.position_data
+        return self.tables['position'].values()
 
     
+    def get_position(self, symbol=None):
+        """Returns position data for symbol or None, uses default symbol if not supplied."""
+        if symbol == None:
+            symbol = self.symbol
+        positions = self.tables['position'].get_by('symbol', symbol)
+        if positions:
+            return positions[0]
+        return None
+
+
     def get_last_position(self):
         """Returns latest position data or None."""
-        if self.position_data:
-            return self.position_data[-1]
-        return None
+        return self.tables['position'].last()
 
 
     def get_wallet_data(self):
         """Returns all Bitmex wallet data."""
-        return self.wallet_data
+        return self.tables['wallet'].last()
+
+
+    def get_wallet_amount(self):
+        """Returns amount in wallet or None."""
+        wallet = self.get_wallet_data()
+        if wallet:
+            return wallet['amount']
+        return None
 
 
     def get_margin_data(self):
         """Returns margin data."""
-        return self.margin_data
+        return self.tables['margin'].values()
+
+
+    def get_last_margin_data(self):
+        """Returns latest margin data or None."""
+        return self.tables['margin'].last()
+
 
+    def get_order_data(self, symbol=None):
+        """Returns all order data, or only orders for symbol if supplied."""
+        if symbol == None:
+            return self.tables['order'].values()
+        return self.tables['order'].get_by('symbol', symbol)
+
+
+    def get_order(self, orderID):
+        """Returns order data for orderID or None."""
+        return self.tables['order'].get(orderID)
 
-    def get_order_data(self):
-        """Returns all order data."""
-        return self.order_data
+
+    def get_last_order_data(self):
+        """Returns latest order data or None."""
+        return self.tables['order'].last()
         
 
-    def get_trade_data(self):
-        """Returns all trade data."""
-        return self.trade_data
+    def get_trade_data(self, symbol=None):
+        """Returns trade tape for symbol, uses default symbol if not supplied. Use vwap, volume, count, stats, etc on it."""
+        return self._symbol_data(self.trade_tapes, symbol)
 
 
-    def get_last_trade_price(self):
-        """Returns price from last trade on Bitmex or None."""
-        if self.trade_data:
-            return self.trade_data[-1]['price']
-        return None
+    def get_last_trade_data(self, symbol=None):
+        """Returns latest trade data ( timestamp, price, size, side ) for symbol or None, uses default symbol if not supplied."""
+        return self._symbol_data(self.trade_tapes, symbol).last()
+
+
+    def get_last_trade_price(self, symbol=None):
+        """Returns price from last trade on Bitmex for symbol or None, uses default symbol if not supplied."""
+        return self._symbol_data(self.trade_tapes, symbol).last_price()
 
     
-    def get_execution_data(self):
-        """Returns all execution data."""
-        return self.execution_data
+    def get_execution_data(self, symbol=None):
+        """Returns all execution data, or only executions for symbol if supplied."""
+        if symbol == None:
+            return self.tables['execution'].values()
+        return self.tables['execution'].get_by('symbol', symbol)
+
+
+    def get_order_book(self, symbol=None):
+        """Returns L2 order book for symbol, uses default symbol if not supplied. Use best_bid, best_ask, spread, depth, etc on it."""
+        return self._symbol_data(self.order_books, symbol)
+
+
+    def get_orders(self):
+        """Returns our orders, use get_by_clOrdID, state, pending, open, filled, etc on it."""
+        return self.orders
+
+
+    def is_stale(self):
+        """Returns True while market data may be out of date - the websocket is down, resubscribing, or went quiet."""
+        return self.watchdog.stale
 
 
     # REST API 
@@ -197,7 +353,10 @@ class BitMEX:
                 bitmex response
         '''
         endpoint = "order"
-        return await self._http_request(path=endpoint, postdict=order, verb="POST")
+        self._on_sent(order)
+        response = await self._http_request(path=endpoint, postdict=order, verb="POST")
+        self._on_response(response)
+        return response
 
 
     async def place_bulk_order(self, orders):
@@ -221,7 +380,10 @@ class BitMEX:
 
         endpoint = "order/bulk"
         allOrders = {'orders': orders}
-        return await self._http_request(path=endpoint, postdict=allOrders, verb="POST")
+        self._on_sent(orders)
+        response = await self._http_request(path=endpoint, postdict=allOrders, verb="POST")
+        self._on_response(response)
+        return response
         
 
     async def cancel_order(self, orderID=None, clOrdID=None, text=None):
@@ -256,7 +418,9 @@ class BitMEX:
         elif clOrdID: postdict['clOrdID'] = clOrdID
         if text:      postdict['text'] = text
 
-        return await self._http_request(path=path, postdict=postdict, verb="DELETE")
+        response = await self._http_request(path=path, postdict=postdict, verb="DELETE")
+        self._on_response(response)
+        return response
 
 
     async def cancel_all_orders(self, symbol=None, cancel_filter=None, text=None):
@@ -289,9 +453,11 @@ class BitMEX:
         if text:            postdict['text']   = text
 
         if postdict: 
-            return await self._http_request(path=path, postdict=postdict, verb="DELETE")
+            response = await self._http_request(path=path, postdict=postdict, verb="DELETE")
         else: 
-            return await self._http_request(path=path, verb="DELETE")
+            response = await self._http_request(path=path, verb="DELETE")
+        self._on_response(response)
+        return response
 
 
 
@@ -371,7 +537,9 @@ class BitMEX:
         if pegOffsetValue:  postdict['pegOffsetValue']  = pegOffsetValue
         if text:            postdict['text']            = text
 
-        return await self._http_request(path=path, postdict=postdict, verb='PUT')
+        response = await self._http_request(path=path, postdict=postdict, verb='PUT')
+        self._on_response(response)
+        return response
 
 
     async def amend_bulk_order(self, orders):
@@ -394,7 +562,9 @@ class BitMEX:
         postdict = {
             'orders': orders
         }
-        return await self._http_request(path=path, postdict=postdict, verb='PUT')
+        response = await self._http_request(path=path, postdict=postdict, verb='PUT')
+        self._on_response(response)
+        return response
 
 
     async def update_leverage(self, leverage, symbol=None):
@@ -555,62 +725,85 @@ class BitMEX:
 
         WS_VERB = "GET"
         WS_ENDPOINT = "/realtime"
-        EXPIRES = int(round(time.time()) + 100)
         uri = str(self._ws_url + WS_ENDPOINT)
-        # we need to generate a signiture to connect, see bitmex docs for more info on this
-        signature = generate_signature(self._secret, WS_VERB, WS_ENDPOINT, EXPIRES)
         id = "bitMEX_stream"
 
-        payload = {
-            "op": "authKeyExpires",
-            "args": [
-                self._key, 
-                EXPIRES, 
-                signature
-            ]
-        }
-
         while True:
+            # we need to generate a signiture to connect, see bitmex docs for more info on this
+            # signed on every attempt, one made before a long outage has expired
+            expires = int(round(time.time()) + 100)
+            signature = self._auth.sign(WS_VERB, WS_ENDPOINT, expires)
+            payload = {
+                "op": "authKeyExpires",
+                "args": [
+                    self._key, 
+                    expires, 
+                    signature
+                ]
+            }
+
             try:
-                # connect to websocket with no timeout time
+                # connect to websocket with no timeout time, the watchdog's pings stand in for one
                 async with websockets.connect(uri, ping_timeout=None) as websocket:
                     self._ws = websocket
-                    await websocket.send(json.dumps(payload))
-
-                    # check data in the init response from websocket
-                    async for raw_msg in websocket: 
-                        msg_type = await self._interpret_msg_type(json.loads(raw_msg),id)
-                        if msg_type == 'INFO':
-                            pass
-                        elif msg_type == 'SUCCESS':
-                            # we are connected, subscribe to channels we want
-                            args = await self._get_all_info() 
-                            await self._ws_subscribe(args)
-                        elif msg_type == 'ERROR':
-                            raise WebSocketError(json.loads(raw_msg),"ERROR CONNECTING TO BITMEX WEBSOCKET")
-            except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
-                print(c[2] + "\n\nBitmex websocket connection error, trying to reconnect in 5 secs\n\n" + c[0])
-                await asyncio.sleep(5)
-                continue
-                        
-         
+                    watch = asyncio.ensure_future(self.watchdog.watch(websocket))
+                    try:
+                        await websocket.send(fast_json.dumps(payload))
+
+                        # check data in the init response from websocket
+                        async for raw_msg in websocket: 
+                            if self._is_pong(raw_msg):
+                                continue
+                            if self.recorder:
+                                self.recorder.write(CAPTURE_FEED, raw_msg)
+                            msg_type, msg = self._handle_frame(raw_msg, id)
+                            if msg_type == 'INFO':
+                                pass
+                            elif msg_type == 'SUCCESS':
+                                # we are connected, subscribe to channels we want
+                                args = await self._get_all_info() 
+                                await self._ws_subscribe(args)
+                            elif msg_type == 'ERROR':
+                                raise WebSocketError(msg,"ERROR CONNECTING TO BITMEX WEBSOCKET")
+                    finally:
+                        watch.cancel()
+                error = "closed by server"
+            except (asyncio.TimeoutError, websockets.exceptions.WebSocketException, OSError) as e:
+                error = e
+
+            await asyncio.sleep(self._disconnected(error))
+
+
+    async def close(self):
+        """Close Bitmex websocket and HTTP connection pool.
+
+        async func - use await."""
+
+        if self._ws:
+            await self._ws.close()
+        if self._session and not self._session.closed:
+            await self._session.close()
+        print(c[3] + '\nBitmex connection closed' + c[0])
+
+
 
     async def _get_all_info(self):
-        """Returns websocket args to subscribe to position, margin, order, wallet, and trade.
+        """Returns websocket args to subscribe to position, margin, order, wallet, trade, and order book.
         
         If you want to subscribe to more Bitmex endpoints, add it here. 
         """
-        # only subscribes to trades of same symbol 
-        trade = "trade:" + self.symbol
-
+        # account tables cover every symbol, trades and order book for each of our symbols
         args = [
             "position",
             "margin",
             "wallet",
             "order",
-            str(trade),
             "execution"]
 
+        for symbol in self.symbols:
+            args.append("trade:" + symbol)
+            args.append("orderBookL2:" + symbol)
+
         return args 
        
 
@@ -623,7 +816,7 @@ class BitMEX:
         Revc's msgs and gets it's type, either
         Info, Success, Error or Table ( data we subscribed to )
 
-        Sends table data to _store_table_info
+        Sends table data to its handler in _table_routes
         """
         
         id = "bitMEX_stream"
@@ -633,72 +826,251 @@ class BitMEX:
         }
 
         # send our subscribe args 
-        await self._ws.send(json.dumps(payload))
-        # look at responses back, and store table data 
+        await self._ws.send(fast_json.dumps(payload))
+        # each subscription starts with a partial that rebuilds its table
+        awaiting = len(args)
+        # look at responses back, table data is stored by _handle_frame
         async for raw_msg in self._ws:
-            msg_type = await self._interpret_msg_type(json.loads(raw_msg),id)
-            if msg_type == 'INFO':
-                pass
-            elif msg_type == 'SUCCESS':
-                pass
-            elif msg_type == 'ERROR':
-                raise WebSocketError(json.loads(raw_msg),"ERROR SUBSCRIBING TO BITMEX WEBSOCKET")
-            elif msg_type == 'TABLE':
-                await self._store_table_info(json.loads(raw_msg))
-            
+            if self._is_pong(raw_msg):
+                continue
+            if self.recorder:
+                self.recorder.write(CAPTURE_FEED, raw_msg)
+            msg_type, msg = self._handle_frame(raw_msg, id)
+            if msg_type == 'ERROR':
+                raise WebSocketError(msg,"ERROR SUBSCRIBING TO BITMEX WEBSOCKET")
+            if awaiting and msg_type == 'TABLE' and msg['action'] == 'partial':
+                awaiting -= 1
+                if not awaiting:
+                    self._resynced()
+
+
+    def _is_pong(self, raw_msg):
+        """Notes every frame with the watchdog, returns True for a 'pong' to its ping, it isn't JSON."""
+        watchdog = self.watchdog
+        watchdog.last_frame = time.perf_counter_ns()
+        if raw_msg == 'pong':
+            watchdog.pong()
+            return True
+        return False
+
+
+    def _disconnected(self, error):
+        """Counts a dropped websocket, returns secs to wait before reconnecting."""
+        self.watchdog.stale = True
+        self._reconnects.inc()
+        if self._down_since is None:
+            self._down_since = time.perf_counter_ns()
+        delay = self.reconnect.next()
+        logging.warning("Bitmex websocket disconnected ( %s ), reconnect attempt %d in %.2f secs" % (error, self.reconnect.attempts, delay))
+        print(c[2] + "\n\nBitmex websocket disconnected ( %s ), reconnecting in %.2f secs\n\n" % (error, delay) + c[0])
+        return delay
+
+
+    def _resynced(self):
+        """Every subscribed table has its partial, state is rebuilt."""
+        self.reconnect.reset()
+        self.watchdog.stale = False
+        if self._down_since is not None:
+            secs = (time.perf_counter_ns() - self._down_since) / 1e9
+            self._outage.since(self._down_since)
+            self._down_since = None
+            logging.warning("Bitmex websocket back after %.3f secs, tables rebuilt from partials" % secs)
+            print(c[3] + "\nBitmex websocket back after %.3f secs, tables rebuilt from partials" % secs + c[0])
+
+
+    def _handle_frame(self, raw_msg, id="bitMEX_stream"):
+        """
+        Decodes a raw websocket frame once, gets its type and stores table data.
+
+        Used by the live websocket and by Capture.replay.
+
+        Returns (msg_type, msg).
+        """
+        start = time.perf_counter_ns()
+        msg = fast_json.loads(raw_msg)
+        table = msg.get('table')
+        if table is not None:
+            # table data is nearly every frame, straight to its handler
+            self._table_routes.get(table, self._on_table)(msg)
+            msg_type = 'TABLE'
+        else:
+            msg_type = self._interpret_msg_type(msg, id)
+        self._frames.inc()
+        self._frame_latency.since(start)
+        return msg_type, msg
+
     
-    async def _interpret_msg_type(self, response, id):
+    def _interpret_msg_type(self, response, id):
         """
         Gets response from websocket and returns type of response, ie table, info, success, error.
         
         """
+        for key, msg_type, handler in self._msg_routes:
+            if key in response:
+                if handler is not None:
+                    handler(response)
+                return msg_type
+        return None
 
-        if 'info' in response:
-            print(c[1] + f"\n{response['info']} Limit : {response['limit']}" + c[0]) 
-            return 'INFO'
-        elif 'success' in response:
-            if 'subscribe' in response:
-                print(c[1] + f"\nBitMEX websocket successfully subscribed to {response['subscribe']}" + c[0])
-                return 'SUCCESS'
-            return 'SUCCESS'
-        elif 'error' in response:
-            print(c[2] + f"\n{response}" + c[0])
-            return 'ERROR'
-        elif 'table' in response:
-            return 'TABLE'
-        
 
-    async def _store_table_info(self, data):
-        """Stores bitmex table data on Position, Wallet, Margin, Order, execution, and Trade."""
-        
-        if(data['table'] == 'position'):
-            if(data['data']):
-                self.position_data.append(data['data'][0])
+    def _store_table_info(self, data):
+        """Applies bitmex table data on Position, Wallet, Margin, Order, execution, Trade, and order book."""
+        self._table_routes.get(data['table'], self._on_table)(data)
+
+
+    def _on_info(self, response):
+        print(c[1] + f"\n{response['info']} Limit : {response['limit']}" + c[0]) 
+
+
+    def _on_success(self, response):
+        if 'subscribe' in response:
+            print(c[1] + f"\nBitMEX websocket successfully subscribed to {response['subscribe']}" + c[0])
+
+
+    def _on_error(self, response):
+        print(c[2] + f"\n{response}" + c[0])
+
+
+    def _on_order_book(self, data):
+        book = self.order_books.get(self._msg_symbol(data))
+        if book is not None:
+            book.apply(data)
+
+
+    def _on_trade(self, data):
+        rows = data['data']
+        if rows and data['action'] == 'partial':
+            self._check_trade_gap(rows)
+        if rows and rows[0]['symbol'] != rows[-1]['symbol']:
+            # unfiltered trade subscription, split by symbol
+            for symbol, tape in self.trade_tapes.items():
+                tape.append([row for row in rows if row['symbol'] == symbol])
+        else:
+            tape = self.trade_tapes.get(self._msg_symbol(data))
+            if tape is not None:
+                tape.append(rows)
+
+
+    def _on_order(self, data):
+        """order table, kept in tables and in orders."""
+        self.tables.apply(data)
+        self.orders.apply(data)
+        if self._ack_pending:
+            for order in data['data']:
+                sent = self._ack_pending.pop(order.get('clOrdID'), None)
+                if sent is not None:
+                    self._ack_latency.since(sent)
+
+
+    def _on_execution(self, data):
+        """execution table, kept in tables and in orders, and journaled."""
+        self.tables.apply(data)
+        seen = self._exec_ids
+        rows = data['data']
+        if data['action'] == 'partial' and seen:
+            # resubscribed, only executions we haven't had, ie fills while disconnected
+            rows = [row for row in rows if row.get('execID') not in seen]
+            if rows:
+                logging.warning("Bitmex %d executions while disconnected" % len(rows))
+            data = dict(data, data=rows)
+        for row in rows:
+            seen[row.get('execID')] = None
+        while len(seen) > 1000:
+            del seen[next(iter(seen))]
+        self.orders.apply(data)
+        if self.journal is not None:
+            self.journal.apply(data)
+
+
+    def _check_trade_gap(self, rows):
+        """A trade partial when we already have trades is a resubscribe, reports trades that may have been missed."""
+        first = {}
+        for row in rows:
+            if row['symbol'] not in first or row['timestamp'] < first[row['symbol']]:
+                first[row['symbol']] = row['timestamp']
+        for symbol, timestamp in first.items():
+            tape = self.trade_tapes.get(symbol)
+            last = tape.last_timestamp() if tape is not None else None
+            if last is not None and int(parse_timestamps([timestamp])[0]) > last:
+                self._gaps.inc()
+                since = datetime.datetime.fromtimestamp(last / 1000, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+                logging.warning("Bitmex %s trade gap - trades between %s and %s may be missing" % (symbol, since, timestamp))
+
+
+    def _on_sent(self, orders):
+        """Tracks order(s) as they are sent."""
+        self.orders.submitted(orders)
+        sent = time.perf_counter_ns()
+        pending = self._ack_pending
+        for order in (orders if isinstance(orders, list) else [orders]):
+            if 'clOrdID' in order:
+                pending[order['clOrdID']] = sent
+        # orders the websocket never reports, ie rejected on send, aren't kept forever
+        while len(pending) > 1000:
+            del pending[next(iter(pending))]
+        if self.journal is not None:
+            self.journal.record_sent(orders)
+
+
+    def _on_response(self, response):
+        """Tracks REST order response(s)."""
+        self.orders.on_response(response)
+        if self.journal is not None:
+            self.journal.record_response(response)
+
+
+    def _on_table(self, data):
+        """position, margin, wallet, and any other table."""
+        self.tables.apply(data)
+
+
+    def _msg_symbol(self, data):
+        """Returns symbol a trade or orderBookL2 message is for, from its filter or first row."""
+        symbol = data.get('filter', {}).get('symbol')
+        if symbol is None and data['data']:
+            symbol = data['data'][0]['symbol']
+        return symbol
+
+
+    def _symbol_data(self, per_symbol, symbol):
+        """Returns symbol's trade tape or order book, uses default symbol if not supplied."""
+        if symbol == None:
+            symbol = self.symbol
+        try:
+            return per_symbol[symbol]
+        except KeyError:
+            raise InvalidArgError(symbol, "Not subscribed to %s, add it to symbols." % symbol)
 
-        elif(data['table'] == 'wallet'):
-            self.wallet_data = data['data'][0]
 
-        elif(data['table'] == 'margin'):
-            if(data['data']):
-                self.margin_data.append(data['data'][0])
+    def _get_session(self):
+        """Returns pooled HTTP session, creates it on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._pool_size, 
+                keepalive_timeout=self._keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, headers=self._session_headers)
+        return self._session
 
-        elif(data['table'] == 'order'):
-            if(data['data']):
-                self.order_data.append(data['data'][0])
 
-        elif(data['table'] == 'trade'):
-            if(data['data']):
-                self.trade_data.append(data['data'][0])
+    def _http_error(self, status):
+        """Counts a failed REST request by status, or 'timeout' / 'connection'."""
+        metrics.counter('traderbot_http_errors_total', "failed REST requests by status", status=status).inc()
+
+
+    def _prepare_request(self, path, query=None, postdict=None):
+        """Returns (url, body) for a request, encoded once so what we sign is exactly what we send."""
+        url = self.base_url + path
+        if query:
+            url = url + '?' + urllib.parse.urlencode(query)
+        body = fast_json.dumps_bytes(postdict) if postdict is not None else b''
+        # already encoded, a str url would be requoted by aiohttp ( ie %3A to : ) after it was signed
+        return URL(url, encoded=True), body
 
-        elif(data['table'] == 'execution'):
-            if(data['data']):
-                self.execution_data.append(data['data'][0])
-   
 
     async def _http_request(self, path, query=None, postdict=None, timeout=None, verb=None, rethrow_errors=False, max_retries=None):
         """Send a request to BitMEX Servers. Returns json response."""
-        # Handle URL
-        url = self.base_url + path
+        url, body = self._prepare_request(path, query, postdict)
 
         if timeout is None:
             timeout = self.timeout
@@ -711,8 +1083,9 @@ class BitMEX:
         if max_retries is None:
             max_retries = 0 if verb in ['POST', 'PUT'] else 3
 
-        # Create auth header for request
-        auth = BitmexHeaders(self._key, self._secret)
+        if self.dry_run:
+            logging.info("dry run, not sending %s to %s: %s", verb, url, body)
+            return postdict
 
         def exit_or_throw(e):
             if rethrow_errors:
@@ -726,32 +1099,73 @@ class BitMEX:
                 raise Exception("Max retries on %s (%s) hit, raising." % (path, json.dumps(postdict or '')))
             return await self._http_request(path, query, postdict, timeout, verb, rethrow_errors, max_retries)
 
+        # Wait for our turn under the rate limit
+        if self.rate_limiter:
+            waiting = time.perf_counter_ns()
+            await self.rate_limiter.acquire()
+            self._rate_limit_wait.since(waiting)
+
         # Make the request
         response = None
+        start = time.perf_counter_ns()
         try:
-            logging.info("sending req to %s: %s" % (url, json.dumps(postdict or query or '')))
-            req = requests.Request(method=verb, url=url, json=postdict, auth=auth, params=query)
-            prepped = self._session.prepare_request(req)
-            # send
-            response = self._session.send(prepped, timeout=timeout)
-            # Make non-200s throw
-            response.raise_for_status()
-
-        except requests.exceptions.HTTPError as e:
-            if response is None:
-                raise e
+            try:
+                # formatted by the log writer, not here before every send
+                logging.info("sending req to %s: %s", url, body or query or '')
+                # Create auth header for request
+                headers = self._auth(verb, url, body)
+                session = self._get_session()
+                # send, connection goes back to the pool once the body is read
+                async with session.request(
+                    verb, 
+                    url, 
+                    data=body or None, 
+                    headers=headers, 
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    content = await response.read()
+            finally:
+                # however the request ends, or its in flight slot is never given back
+                if self.rate_limiter:
+                    self.rate_limiter.done(response.headers if response is not None else None)
+
+        except asyncio.TimeoutError as e:
+            self._http_error('timeout')
+            # Timeout, re-run this request
+            logging.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(postdict or '')))
+            return await retry()
+
+        except aiohttp.ClientConnectionError as e:
+            self._http_error('connection')
+            logging.warning("Unable to contact the BitMEX API (%s). Please check the URL. Retrying. " % e +
+                                "Request: %s \n %s" % (url, json.dumps(postdict)))
+            await asyncio.sleep(1)
+            return await retry()
+
+        metrics.histogram('traderbot_http_request_seconds', "REST request round trip", verb=verb).since(start)
+
+        # Make non-200s throw
+        if response.status >= 400:
+            self._http_error(response.status)
+            e = aiohttp.ClientResponseError(
+                response.request_info, 
+                response.history, 
+                status=response.status, 
+                message=response.reason, 
+                headers=response.headers
+            )
 
             # 401 - Auth error. This is fatal.
-            if response.status_code == 401:
+            if response.status == 401:
                 logging.error("API Key or Secret incorrect, please check and restart.")
-                logging.error("Error: " + response.text)
+                logging.error("Error: " + content.decode('utf8'))
                 if postdict:
                     logging.error(postdict)
                 # Always exit, even if rethrow_errors, because this is fatal
                 exit(1)
 
             # 404, can be thrown if order canceled or does not exist.
-            elif response.status_code == 404:
+            elif response.status == 404:
                 if verb == 'DELETE':
                     logging.error("Order not found: %s" % postdict['orderID'])
                     return
@@ -760,7 +1174,7 @@ class BitMEX:
                 exit_or_throw(e)
 
             # 429, ratelimit; cancel orders & wait until X-RateLimit-Reset
-            elif response.status_code == 429:
+            elif response.status == 429:
                 logging.error("Ratelimited on current request. Sleeping, then trying again. Try fewer " +
                                   "order pairs or contact support@bitmex.com to raise your limits. " +
                                   "Request: %s \n %s" % (url, json.dumps(postdict)))
@@ -770,45 +1184,68 @@ class BitMEX:
                 to_sleep = int(ratelimit_reset) - int(time.time())
                 reset_str = datetime.datetime.fromtimestamp(int(ratelimit_reset)).strftime('%X')
 
+                # hold every other caller too, not just this one, the cancel below included
+                if self.rate_limiter:
+                    self.rate_limiter.block_until(int(ratelimit_reset))
+
                 # We're ratelimited, and we may be waiting for a long time. Cancel orders.
-                logging.warning("Canceling all known orders in the meantime.")
-                self.cancel_all_orders(text="RateLimited Cancel")
+                # once, the cancel goes through here too and can be rate limited itself
+                if not self._rate_limit_cancel:
+                    self._rate_limit_cancel = True
+                    try:
+                        logging.warning("Canceling all known orders in the meantime.")
+                        await self.cancel_all_orders(text="RateLimited Cancel")
+                    except Exception as cancel_error:
+                        logging.error("Rate limited cancel failed: %s" % cancel_error)
+                    finally:
+                        self._rate_limit_cancel = False
 
                 logging.error("Your ratelimit will reset at %s. Sleeping for %d seconds." % (reset_str, to_sleep))
-                await asyncio.sleep(to_sleep)
+                # the rate limiter holds the retry till then
+                if not self.rate_limiter:
+                    await asyncio.sleep(to_sleep)
 
                 # Retry the request.
                 return await retry()
 
             # 503 - BitMEX temporary downtime, likely due to a deploy. Try again
-            elif response.status_code == 503:
+            elif response.status == 503:
                 logging.warning("Unable to contact the BitMEX API (503), retrying. " +
                                     "Request: %s \n %s" % (url, json.dumps(postdict)))
-                asyncio.sleep(3)
+                await asyncio.sleep(3)
                 return await retry()
 
-            elif response.status_code == 400:
-                error = response.json()['error']
+            elif response.status == 400:
+                error = fast_json.loads(content)['error']
                 message = error['message'].lower() if error else ''
 
-                # Duplicate clOrdID: that's fine, probably a deploy, go get the order(s) and return it
+                # Duplicate clOrdID: that's fine, probably a deploy, get the order(s) and return it
                 if 'duplicate clordid' in message:
-                    orders = postdict['orders'] if 'orders' in postdict else postdict
-
-                    IDs = json.dumps({'clOrdID': [order['clOrdID'] for order in orders]})
-                    orderResults = await self._http_request('/order', query={'filter': IDs}, verb='GET')
-
-                    for i, order in enumerate(orderResults):
+                    orders = postdict['orders'] if 'orders' in postdict else [postdict]
+
+                    # the websocket has usually told us about them already, only ask Bitmex if not
+                    known = [self.orders.get_by_clOrdID(order['clOrdID']) for order in orders]
+                    if all(order is not None and order.get('orderID') for order in known):
+                        orderResults = [dict(order) for order in known]
+                    else:
+                        IDs = json.dumps({'clOrdID': [order['clOrdID'] for order in orders]})
+                        found = await self._http_request('order', query={'filter': IDs}, verb='GET')
+                        found = dict((order['clOrdID'], order) for order in found)
+                        orderResults = [found.get(order['clOrdID']) for order in orders]
+                        self._on_response([order for order in orderResults if order])
+
+                    for sent, order in zip(orders, orderResults):
                         if (
-                                order['orderQty'] != abs(postdict['orderQty']) or
-                                order['side'] != ('Buy' if postdict['orderQty'] > 0 else 'Sell') or
-                                order['price'] != postdict['price'] or
-                                order['symbol'] != postdict['symbol']):
+                                order is None or
+                                order['orderQty'] != abs(sent['orderQty']) or
+                                order['side'] != sent.get('side', 'Buy' if sent['orderQty'] > 0 else 'Sell') or
+                                order['price'] != sent.get('price') or
+                                order['symbol'] != sent['symbol']):
                             raise Exception('Attempted to recover from duplicate clOrdID, but order returned from API ' +
                                             'did not match POST.\nPOST data: %s\nReturned order: %s' % (
-                                                json.dumps(orders[i]), json.dumps(order)))
+                                                json.dumps(sent), json.dumps(order)))
                     # All good
-                    return orderResults
+                    return orderResults if 'orders' in postdict else orderResults[0]
 
                 elif 'insufficient available balance' in message:
                     logging.error('Account out of funds. The message: %s' % error['message'])
@@ -816,25 +1253,14 @@ class BitMEX:
 
 
             # If we haven't returned or re-raised yet, we get here.
-            logging.error("Unhandled Error: %s: %s" % (e, response.text))
+            logging.error("Unhandled Error: %s: %s" % (e, content.decode('utf8')))
             logging.error("Endpoint was: %s %s: %s" % (verb, path, json.dumps(postdict)))
             exit_or_throw(e)
 
-        except requests.exceptions.Timeout as e:
-            # Timeout, re-run this request
-            logging.warning("Timed out on request: %s (%s), retrying..." % (path, json.dumps(postdict or '')))
-            return await retry()
-
-        except requests.exceptions.ConnectionError as e:
-            logging.warning("Unable to contact the BitMEX API (%s). Please check the URL. Retrying. " +
-                                "Request: %s %s \n %s" % (e, url, json.dumps(postdict)))
-            asyncio.sleep(1)
-            return await retry()
-
         # Reset retry counter on success
         self.retries = 0
 
-        return response.json()
+        return fast_json.loads(content)
 
 
 """Taken from BitMEX market maker."""
@@ -861,19 +1287,51 @@ def generate_signature(secret, verb, url, nonce, data=''):
 
 
 """Taken from BitMEX market maker."""
-class BitmexHeaders(requests.auth.AuthBase):
-    """Attaches API Key Headers to requests."""
+class BitmexHeaders:
+    """
+    Makes API Key Headers for requests.
+
+    Keys the HMAC once ( RFC 2104 inner and outer sha256 states ) and copies
+    it per request, fills a header template, and signs the body bytes as sent,
+    so signing costs a couple of microseconds. Signatures are the same as generate_signature's.
+    """
 
     def __init__(self, key, secret):
         self._key = key
         self._secret = secret
-
-    def __call__(self, req):
-        """Generate API key headers."""
-        # modify and return the request
+        block = bytes(secret, 'utf8')
+        if len(block) > 64:
+            block = hashlib.sha256(block).digest()
+        block = block.ljust(64, b'\0')
+        self._inner = hashlib.sha256(bytes(b ^ 0x36 for b in block))
+        self._outer = hashlib.sha256(bytes(b ^ 0x5c for b in block))
+        self._template = {
+            'api-expires': None,
+            'api-key': key,
+            'api-signature': None
+        }
+        self._expires = None
+        self._expires_str = None
+
+    def sign(self, verb, path, expires, body=b''):
+        """Returns signature for verb, path ( with query ), expires and body bytes."""
+        inner = self._inner.copy()
+        inner.update(('%s%s%d' % (verb, path, expires)).encode('utf8'))
+        if body:
+            inner.update(body if isinstance(body, (bytes, bytearray)) else body.encode('utf8'))
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.hexdigest()
+
+    def __call__(self, verb, url, body=b''):
+        """Generate API key headers, url is the yarl.URL sent or a str."""
         expires = int(round(time.time()) + 5)  # 5s grace period in case of clock skew
-        req.headers['api-expires'] = str(expires)
-        req.headers['api-key'] = self._key
-        req.headers['api-signature'] = generate_signature(self._secret, req.method, req.url, expires, req.body or '')
-
-        return req
\ No newline at end of file
+        if expires != self._expires:
+            self._expires = expires
+            self._expires_str = str(expires)
+        # encoded path and query as sent, a str url is parsed the way aiohttp sends it
+        path = (url if isinstance(url, URL) else URL(url)).raw_path_qs
+        headers = self._template.copy()
+        headers['api-expires'] = self._expires_str
+        headers['api-signature'] = self.sign(verb, path, expires, body)
+        return headers
@@ -0,0 +1,546 @@
+import sys
+import time
+import uuid
+import json
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import datetime
+from aiohttp import web
+from BitMEX import generate_signature
+from colors import c
+
+
+def now_iso():
+    """Returns current time as a Bitmex timestamp, ie '2019-12-20T17:42:08.436Z'."""
+    return datetime.datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+
+
+
+class BitMEXServer:
+    """
+    Local stand-in for the Bitmex REST API and websocket, for benchmarks and tests with no network.
+
+    Implements the parts of /order, /order/bulk, /order/all, /position/* and /realtime
+    that the BitMEX class uses, and checks api signatures the same way generate_signature makes them.
+
+    Attributes:
+
+    `key: str`
+        accepted API key
+
+    `secret: str`
+        accepted API secret
+
+    `latency: float or (float, float)`
+        secs added to each REST response, or a (min, max) range. default 0
+
+    `rate_limit: int`
+        REST calls per minute before 429s, sent back in X-RateLimit headers. default 120
+
+    `error_rate: dict`
+        chance of injecting an error status per REST call, ie {429: 0.01, 503: 0.01}
+
+    `seed: int`
+        seed for latency and error injection, for repeatable runs
+
+    Methods:
+
+    `start`
+        start serving
+
+    `stop`
+        stop serving
+
+    `inject`
+        fail the next N REST calls with a status
+
+    `disconnect`
+        close every websocket connection
+
+    `stall`
+        stop sending on every open websocket without closing it
+
+    `push`
+        send a table message to websocket subscribers
+
+    `push_trade`
+        record a trade and send it to trade subscribers
+
+    `play`
+        send a script of trades at an interval
+
+    """
+    def __init__(self, key="standin_key", secret="standin_secret", latency=0, rate_limit=120, error_rate=None, seed=None, symbol="XBTUSD"):
+        self.key = key
+        self.secret = secret
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate or {}
+        self.symbol = symbol
+        self.account = 12345
+        self.base_url = None
+        self.ws_url = None
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._injected = []
+        self._tokens = float(rate_limit)
+        self._tokens_at = time.monotonic()
+        self._orders = {}
+        self._positions = {}
+        self._leverage = {}
+        self._last_price = {symbol: 7000.0}
+        self._subscribers = {}
+        self._sockets = set()
+        # open but silent, ie a connection stalled somewhere between us and the client
+        self._stalled = set()
+        self._runner = None
+
+        self._app = web.Application()
+        self._app.router.add_get('/realtime', self._realtime)
+        self._app.router.add_route('GET', '/api/v1/order', self._get_orders)
+        self._app.router.add_route('POST', '/api/v1/order', self._place_order)
+        self._app.router.add_route('PUT', '/api/v1/order', self._amend_order)
+        self._app.router.add_route('DELETE', '/api/v1/order', self._cancel_order)
+        self._app.router.add_route('POST', '/api/v1/order/bulk', self._place_bulk)
+        self._app.router.add_route('PUT', '/api/v1/order/bulk', self._amend_bulk)
+        self._app.router.add_route('DELETE', '/api/v1/order/all', self._cancel_all)
+        self._app.router.add_route('POST', '/api/v1/position/{endpoint}', self._position)
+
+
+    async def start(self, host='127.0.0.1', port=0):
+        """
+        Starts serving on host:port, port 0 picks a free port.
+
+        async func - use await
+
+        Returns:
+
+        `(base_url, ws_url): (str, str)`
+            urls to give the BitMEX class
+        """
+        sock = socket.socket()
+        sock.bind((host, port))
+        port = sock.getsockname()[1]
+        self._runner = web.AppRunner(self._app)
+        await self._runner.setup()
+        await web.SockSite(self._runner, sock).start()
+        self.base_url = "http://%s:%d/api/v1/" % (host, port)
+        self.ws_url = "ws://%s:%d" % (host, port)
+        return self.base_url, self.ws_url
+
+
+    async def stop(self):
+        """Stops serving.
+
+        async func - use await"""
+        for subscribers in self._subscribers.values():
+            for ws in list(subscribers):
+                await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+
+    async def disconnect(self):
+        """Closes every websocket connection, ie to try reconnects.
+
+        async func - use await"""
+        for ws in list(self._sockets):
+            await ws.close()
+
+
+    def stall(self):
+        """Stops sending anything, pongs included, on every open websocket and leaves them open, ie to try the stale feed watchdog.
+        New connections aren't stalled."""
+        self._stalled |= self._sockets
+
+
+    def inject(self, status, count=1):
+        """Fails the next `count` REST calls with `status`, ie 429 or 503."""
+        self._injected.extend([status] * count)
+
+
+    # ------------------ WEBSOCKET -------------------
+    async def push(self, table, action, data, keys=None):
+        """Sends a table message to everyone subscribed to `table`, or `table:symbol`."""
+        msg = {'table': table, 'action': action, 'data': data}
+        if keys is not None:
+            msg['keys'] = keys
+        raw = json.dumps(msg)
+        targets = set(self._subscribers.get(table, ()))
+        symbols = set(row.get('symbol') for row in data)
+        for symbol in symbols:
+            targets |= self._subscribers.get("%s:%s" % (table, symbol), set())
+        for ws in targets:
+            if not ws.closed and ws not in self._stalled:
+                await ws.send_str(raw)
+
+
+    async def push_trade(self, price, size=100, side='Buy', symbol=None):
+        """Records a trade at price and sends it to trade subscribers."""
+        symbol = symbol or self.symbol
+        self._last_price[symbol] = price
+        await self.push('trade', 'insert', [{
+            'timestamp': now_iso(),
+            'symbol': symbol,
+            'side': side,
+            'size': size,
+            'price': price,
+            'trdMatchID': str(uuid.uuid4())
+        }])
+
+
+    async def play(self, prices, interval=0.001, size=100, symbol=None):
+        """
+        Sends a trade for each price, `interval` secs apart.
+
+        async func - use await
+        """
+        for i, price in enumerate(prices):
+            await self.push_trade(price, size=size, side='Buy' if i % 2 else 'Sell', symbol=symbol)
+            await asyncio.sleep(interval)
+
+
+    async def _realtime(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.add(ws)
+        await ws.send_json({'info': 'Welcome to the BitMEX stand-in Realtime API.', 'limit': {'remaining': 39}})
+        authed = False
+
+        try:
+            async for frame in ws:
+                if frame.data == 'ping':
+                    if ws not in self._stalled:
+                        await ws.send_str('pong')
+                    continue
+                msg = json.loads(frame.data)
+                op, args = msg.get('op'), msg.get('args', [])
+
+                if op == 'authKeyExpires':
+                    key, expires, signature = args
+                    ok = key == self.key and int(expires) > time.time() and \
+                        signature == generate_signature(self.secret, 'GET', '/realtime', expires)
+                    if ok:
+                        authed = True
+                        await ws.send_json({'success': True, 'request': msg})
+                    else:
+                        await ws.send_json({'status': 401, 'error': 'Signature not valid.', 'request': msg})
+
+                elif op == 'subscribe':
+                    for topic in args:
+                        if topic.split(':')[0] in ('position', 'margin', 'wallet', 'order', 'execution') and not authed:
+                            await ws.send_json({'status': 401, 'error': 'Not authenticated.', 'request': msg})
+                            continue
+                        self._subscribers.setdefault(topic, set()).add(ws)
+                        await ws.send_json({'success': True, 'subscribe': topic, 'request': msg})
+                        await ws.send_json(self._partial(topic))
+
+                elif op == 'ping' and ws not in self._stalled:
+                    await ws.send_str('pong')
+        finally:
+            self._sockets.discard(ws)
+            self._stalled.discard(ws)
+            for subscribers in self._subscribers.values():
+                subscribers.discard(ws)
+        return ws
+
+
+    def _partial(self, topic):
+        table, _, symbol = topic.partition(':')
+        keys = {
+            'position': ['account', 'symbol', 'currency'],
+            'order': ['orderID'],
+            'execution': ['execID'],
+            'margin': ['account', 'currency'],
+            'wallet': ['account', 'currency'],
+            'orderBookL2': ['symbol', 'id', 'side'],
+        }.get(table, [])
+        if table == 'order':
+            data = list(self._orders.values())
+        elif table == 'position':
+            data = list(self._positions.values())
+        elif table in ('margin', 'wallet'):
+            data = [{'account': self.account, 'currency': 'XBt', 'amount': 100000000}]
+        else:
+            data = []
+        return {'table': table, 'action': 'partial', 'keys': keys, 'types': {}, 'filter': {'symbol': symbol} if symbol else {}, 'data': data}
+
+
+    # ------------------ REST -------------------
+    async def _check(self, request):
+        """Checks auth and rate limit, injects errors and latency. Returns (body, headers) or raises an HTTP error."""
+        self.requests += 1
+        body = await request.read()
+
+        # rate limit bucket, same headers Bitmex sends
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._tokens_at) * self.rate_limit / 60, float(self.rate_limit))
+        self._tokens_at = now
+        reset = int(time.time() + (self.rate_limit - self._tokens) * 60 / self.rate_limit) + 1
+
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = self._random.uniform(*latency)
+        if latency:
+            await asyncio.sleep(latency)
+
+        status = self._injected.pop(0) if self._injected else None
+        if status is None:
+            for code, rate in self.error_rate.items():
+                if self._random.random() < rate:
+                    status = code
+                    break
+        if status is None and self._tokens < 1:
+            status = 429
+        if status is None:
+            self._tokens -= 1
+
+        headers = {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(max(int(self._tokens), 0)),
+            'X-RateLimit-Reset': str(reset),
+        }
+
+        expires = request.headers.get('api-expires')
+        signature = generate_signature(self.secret, request.method, request.raw_path, expires or 0, body)
+        if request.headers.get('api-key') != self.key:
+            raise _error(web.HTTPUnauthorized, 'Invalid API Key.', headers)
+        if not expires or int(expires) < time.time():
+            raise _error(web.HTTPUnauthorized, 'This request has expired.', headers)
+        if request.headers.get('api-signature') != signature:
+            raise _error(web.HTTPUnauthorized, 'Signature not valid.', headers)
+
+        if status == 429:
+            raise _error(web.HTTPTooManyRequests, 'Rate limit exceeded, retry in 1 seconds.', headers)
+        if status == 503:
+            raise _error(web.HTTPServiceUnavailable, 'The system is currently overloaded. Please try again later.', headers)
+
+        return (json.loads(body) if body else {}), headers
+
+
+    async def _get_orders(self, request):
+        _, headers = await self._check(request)
+        orders = list(self._orders.values())
+        if 'filter' in request.query:
+            for field, values in json.loads(request.query['filter']).items():
+                values = values if isinstance(values, list) else [values]
+                orders = [o for o in orders if o.get(field) in values]
+        return web.json_response(orders, headers=headers)
+
+
+    async def _place_order(self, request):
+        postdict, headers = await self._check(request)
+        order = await self._new_order(postdict)
+        return web.json_response(order, headers=headers)
+
+
+    async def _place_bulk(self, request):
+        postdict, headers = await self._check(request)
+        orders = [await self._new_order(o) for o in postdict['orders']]
+        return web.json_response(orders, headers=headers)
+
+
+    async def _amend_order(self, request):
+        postdict, headers = await self._check(request)
+        order = await self._amend(postdict, headers)
+        return web.json_response(order, headers=headers)
+
+
+    async def _amend_bulk(self, request):
+        postdict, headers = await self._check(request)
+        orders = [await self._amend(o, headers) for o in postdict['orders']]
+        return web.json_response(orders, headers=headers)
+
+
+    async def _cancel_order(self, request):
+        postdict, headers = await self._check(request)
+        ids = postdict.get('orderID') or postdict.get('clOrdID')
+        ids = ids if isinstance(ids, list) else [ids]
+        field = 'orderID' if 'orderID' in postdict else 'clOrdID'
+        orders = [o for o in self._orders.values() if o[field] in ids]
+        if not orders:
+            raise _error(web.HTTPNotFound, 'Not Found', headers)
+        return web.json_response(await self._cancel(orders, postdict.get('text')), headers=headers)
+
+
+    async def _cancel_all(self, request):
+        postdict, headers = await self._check(request)
+        orders = [o for o in self._orders.values() if o['ordStatus'] in ('New', 'PartiallyFilled')]
+        if 'symbol' in postdict:
+            orders = [o for o in orders if o['symbol'] == postdict['symbol']]
+        for field, value in postdict.get('filter', {}).items():
+            orders = [o for o in orders if o.get(field) == value]
+        return web.json_response(await self._cancel(orders, postdict.get('text')), headers=headers)
+
+
+    async def _position(self, request):
+        postdict, headers = await self._check(request)
+        action = 'update' if postdict['symbol'] in self._positions else 'insert'
+        position = self._position_for(postdict['symbol'])
+        endpoint = request.match_info['endpoint']
+        if endpoint == 'leverage':
+            position['leverage'] = postdict['leverage']
+            position['crossMargin'] = postdict['leverage'] == 0
+        elif endpoint == 'isolate':
+            position['crossMargin'] = not postdict['enabled']
+        elif endpoint == 'riskLimit':
+            position['riskLimit'] = postdict['riskLimit']
+        elif endpoint == 'transferMargin':
+            position['posMargin'] = position.get('posMargin', 0) + postdict['amount']
+        else:
+            raise _error(web.HTTPNotFound, 'Not Found', headers)
+        await self.push('position', action, [dict(position)])
+        return web.json_response(position, headers=headers)
+
+
+    async def _new_order(self, postdict):
+        if postdict.get('clOrdID') and any(o['clOrdID'] == postdict['clOrdID'] for o in self._orders.values()):
+            raise _error(web.HTTPBadRequest, 'Duplicate clOrdID')
+        symbol = postdict.get('symbol', self.symbol)
+        qty = postdict.get('orderQty', 0)
+        if not isinstance(qty, (int, float)):
+            raise _error(web.HTTPBadRequest, 'orderQty is invalid')
+        side = postdict.get('side') or ('Buy' if qty > 0 else 'Sell')
+        price = postdict.get('price')
+        stamp = now_iso()
+        order = {
+            'orderID': str(uuid.uuid4()),
+            'clOrdID': postdict.get('clOrdID', ''),
+            'account': self.account,
+            'symbol': symbol,
+            'side': side,
+            'orderQty': abs(qty),
+            'price': price,
+            'stopPx': postdict.get('stopPx'),
+            'ordType': postdict.get('ordType') or ('Limit' if price else 'Market'),
+            'execInst': postdict.get('execInst', ''),
+            'ordStatus': 'New',
+            'leavesQty': abs(qty),
+            'cumQty': 0,
+            'avgPx': None,
+            'text': postdict.get('text', 'Submitted via API.'),
+            'transactTime': stamp,
+            'timestamp': stamp
+        }
+        self._orders[order['orderID']] = order
+        await self.push('order', 'insert', [dict(order)])
+
+        last = self._last_price.get(symbol)
+        crosses = price is None or (side == 'Buy' and price >= last) or (side == 'Sell' and price <= last)
+        if last is not None and crosses and not order['stopPx']:
+            await self._fill(order, last)
+        return dict(order)
+
+
+    async def _fill(self, order, price):
+        qty = order['leavesQty']
+        order.update(ordStatus='Filled', leavesQty=0, cumQty=order['orderQty'], avgPx=price, timestamp=now_iso())
+        await self.push('order', 'update', [{k: order[k] for k in ('orderID', 'symbol', 'ordStatus', 'leavesQty', 'cumQty', 'avgPx', 'timestamp')}])
+        await self.push('execution', 'insert', [{
+            'execID': str(uuid.uuid4()), 'orderID': order['orderID'], 'clOrdID': order['clOrdID'],
+            'symbol': order['symbol'], 'side': order['side'], 'lastQty': qty, 'lastPx': price,
+            'execType': 'Trade', 'ordStatus': 'Filled', 'timestamp': order['timestamp']
+        }])
+        action = 'update' if order['symbol'] in self._positions else 'insert'
+        position = self._position_for(order['symbol'])
+        position['currentQty'] += qty if order['side'] == 'Buy' else -qty
+        position['avgEntryPrice'] = price
+        position['isOpen'] = position['currentQty'] != 0
+        await self.push('position', action, [dict(position)])
+
+
+    async def _amend(self, postdict, headers):
+        order = self._orders.get(postdict.get('orderID'))
+        if order is None:
+            order = next((o for o in self._orders.values() if o['clOrdID'] == postdict.get('origClOrdID')), None)
+        if order is None:
+            raise _error(web.HTTPNotFound, 'Not Found', headers)
+        if order['ordStatus'] not in ('New', 'PartiallyFilled'):
+            raise _error(web.HTTPBadRequest, 'Invalid ordStatus', headers)
+        for field in ('price', 'stopPx', 'pegOffsetValue', 'text'):
+            if field in postdict:
+                order[field] = postdict[field]
+        if 'clOrdID' in postdict:
+            order['clOrdID'] = postdict['clOrdID']
+        if 'orderQty' in postdict:
+            order['orderQty'] = postdict['orderQty']
+            order['leavesQty'] = postdict['orderQty'] - order['cumQty']
+        if 'leavesQty' in postdict:
+            order['leavesQty'] = postdict['leavesQty']
+            order['orderQty'] = order['cumQty'] + postdict['leavesQty']
+        order['timestamp'] = now_iso()
+        await self.push('order', 'update', [dict(order)])
+        return dict(order)
+
+
+    async def _cancel(self, orders, text=None):
+        for order in orders:
+            order.update(ordStatus='Canceled', leavesQty=0, text=text or 'Canceled via API.', timestamp=now_iso())
+        if orders:
+            await self.push('order', 'update', [dict(o) for o in orders])
+        return [dict(o) for o in orders]
+
+
+    def _position_for(self, symbol):
+        position = self._positions.get(symbol)
+        if position is None:
+            position = {
+                'account': self.account, 'symbol': symbol, 'currency': 'XBt',
+                'currentQty': 0, 'avgEntryPrice': None, 'leverage': 100, 'crossMargin': True,
+                'isOpen': False, 'riskLimit': 20000000000
+            }
+            self._positions[symbol] = position
+        return position
+
+
+
+def _error(exc, message, headers=None):
+    """Returns aiohttp HTTP exception with a Bitmex style error body."""
+    return exc(
+        text=json.dumps({'error': {'message': message, 'name': 'HTTPError'}}),
+        content_type='application/json',
+        headers=headers
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Bitmex REST API and websocket.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--key', default="standin_key")
+    parser.add_argument('--secret', default="standin_secret")
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--error-429', type=float, default=0, help="chance of a 429 per REST call")
+    parser.add_argument('--error-503', type=float, default=0, help="chance of a 503 per REST call")
+    parser.add_argument('--trade-interval', type=float, default=0.1, help="secs between scripted trades, 0 for none")
+    args = parser.parse_args()
+
+    server = BitMEXServer(
+        key=args.key,
+        secret=args.secret,
+        latency=args.latency,
+        error_rate={429: args.error_429, 503: args.error_503}
+    )
+
+    async def run():
+        base_url, ws_url = await server.start(port=args.port)
+        print(c[3] + "\nBitmex stand-in at %s and %s/realtime" % (base_url, ws_url) + c[0])
+        price = 7000.0
+        while True:
+            if args.trade_interval:
+                price += random.choice((-0.5, 0, 0.5))
+                await server.push_trade(price)
+                await asyncio.sleep(args.trade_interval)
+            else:
+                await asyncio.sleep(3600)
+
+    try:
+        asyncio.get_event_loop().run_until_complete(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
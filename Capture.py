@@ -0,0 +1,189 @@
+import gzip
+import time
+import struct
+import asyncio
+import logging
+from colors import c
+
+# record header - feed id, receive time ( epoch secs ), frame length
+HEADER = struct.Struct('<BdI')
+
+TOKEN_ANALYST = 0
+BITMEX = 1
+
+FEEDS = {
+    TOKEN_ANALYST: 'token_analyst',
+    BITMEX: 'bitmex',
+}
+
+
+class FrameRecorder:
+    """
+    Records raw websocket frames to a gzip compressed, append only capture file.
+
+    Each record is a header ( feed id, receive time, length ) followed by the raw frame.
+    Opening an existing file appends to it.
+
+    Attributes:
+
+    `path: str`
+        capture file path
+
+    `compresslevel: int`
+        gzip level, default 1, fastest
+
+    `flush_every: float`
+        secs between flushes to disk, default 5
+
+    `count: int`
+        frames recorded
+
+    Methods:
+
+    `write`
+        record a frame
+
+    `flush`
+        flush buffered frames to disk
+
+    `close`
+        close capture file
+
+    """
+    def __init__(self, path, compresslevel=1, flush_every=5):
+        self.path = path
+        self.count = 0
+        self.flush_every = flush_every
+        self._file = gzip.open(path, 'ab', compresslevel=compresslevel)
+        self._flushed = time.time()
+
+
+    def write(self, feed, frame, received=None):
+        """
+        Records a raw frame.
+
+        Parameters:
+
+        `feed: int`
+            Capture.TOKEN_ANALYST or Capture.BITMEX
+
+        `frame: str or bytes`
+            raw websocket frame
+
+        `received: float`
+            receive time in epoch secs, default now
+        """
+        if received is None:
+            received = time.time()
+        if isinstance(frame, str):
+            frame = frame.encode('utf8')
+        self._file.write(HEADER.pack(feed, received, len(frame)))
+        self._file.write(frame)
+        self.count += 1
+        if received - self._flushed > self.flush_every:
+            self.flush()
+
+
+    def flush(self):
+        """Flushes buffered frames to disk."""
+        self._file.flush()
+        self._flushed = time.time()
+
+
+    def close(self):
+        """Closes capture file."""
+        self._file.close()
+        print(c[3] + "\nRecorded %d frames to %s" % (self.count, self.path) + c[0])
+
+
+
+def read_frames(path):
+    """
+    Yields (feed, received, frame) from a capture file, frame is bytes.
+
+    A capture cut off mid write, ie by a crash, is read up to the last whole frame.
+    """
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                feed, received, length = HEADER.unpack(header)
+                frame = f.read(length)
+                if len(frame) < length:
+                    return
+            except (EOFError, OSError) as e:
+                logging.warning("Capture %s ends early - %s" % (path, e))
+                return
+            yield feed, received, frame
+
+
+
+async def replay(path, bitmex=None, token_analyst=None, on_data=None, speed=1.0):
+    """
+    Feeds a capture file back through the same frame handlers as the live websockets.
+
+    Bitmex frames go to bitmex._handle_frame ( table handlers, _interpret_msg_type ),
+    Token Analyst frames go to token_analyst._handle_frame ( _interpret )
+    and any data is awaited with on_data, ie trader_bot or a SignalQueue's put.
+
+    async func - use await
+
+    Parameters:
+
+    `path: str`
+        capture file path
+
+    `bitmex: BitMEX`
+        optional, Bitmex frames are skipped if not supplied
+
+    `token_analyst: TokenAnalyst`
+        optional, Token Analyst frames are skipped if not supplied
+
+    `on_data: async func`
+        optional, called with Token Analyst on-chain data
+
+    `speed: float`
+        1 is real time, N is N times real time, 0 is as fast as possible
+
+    Returns:
+
+    `stats: dict`
+        frames, elapsed secs, and frames per sec
+    """
+    frames = 0
+    start = time.perf_counter()
+    first = None
+
+    for feed, received, frame in read_frames(path):
+        if speed:
+            if first is None:
+                first = received
+            wait = (received - first) / speed - (time.perf_counter() - start)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        if feed == BITMEX and bitmex is not None:
+            msg_type, msg = bitmex._handle_frame(frame)
+            # nothing resubscribes in a replay, the recorded trade partial stands in for a resync
+            if msg_type == 'TABLE' and msg['action'] == 'partial' and msg['table'] == 'trade' and bitmex.is_stale():
+                bitmex._resynced()
+        elif feed == TOKEN_ANALYST and token_analyst is not None:
+            data = token_analyst._handle_frame(frame)
+            if data is not None and on_data is not None:
+                await on_data(data)
+        frames += 1
+
+        # let other tasks, ie trader_bot workers, run when replaying flat out
+        if not speed and frames % 100 == 0:
+            await asyncio.sleep(0)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'frames': frames,
+        'elapsed': elapsed,
+        'frames_per_sec': frames / elapsed if elapsed else 0.0
+    }
+    print(c[3] + "\nReplayed %d frames in %.3f secs ( %.0f frames / sec )" % (frames, elapsed, stats['frames_per_sec']) + c[0])
+    return stats
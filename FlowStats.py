@@ -0,0 +1,181 @@
+import time
+import datetime
+from collections import deque
+import numpy as np
+
+# default windows in secs - 10 min, 1 hour, 24 hours
+WINDOWS = (600, 3600, 86400)
+
+# accumulator slots - inflow sum, sum of squares, count, then outflow
+IN_SUM, IN_SQ, IN_N, OUT_SUM, OUT_SQ, OUT_N = range(6)
+
+
+
+# epoch ms of each 'YYYY-MM-DDTHH:MM' seen, flows arrive in order so this stays tiny
+_minutes = {}
+
+
+def epoch_ms(timestamp):
+    """Returns epoch ms from a Token Analyst timestamp ( epoch secs, epoch ms, or ISO str ), or now if missing."""
+    if timestamp is None:
+        return time.time() * 1000
+    if isinstance(timestamp, str):
+        # parsing a whole ISO str with numpy is slow, parse 'YYYY-MM-DDTHH:MM' once per minute and add the secs
+        secs = timestamp[17:]
+        if secs.endswith('Z'):
+            secs = secs[:-1]
+        try:
+            secs = float(secs) if secs else 0.0
+        except ValueError:
+            # not plain UTC secs, ie an offset like +00:00
+            return _iso_ms(timestamp)
+        minute = timestamp[:16]
+        base = _minutes.get(minute)
+        if base is None:
+            if len(_minutes) > 1000:
+                _minutes.clear()
+            base = _minutes[minute] = int(np.datetime64(minute, 'ms').astype(np.int64))
+        return base + round(secs * 1000)
+    # epoch secs are < 1e11 till the year 5138
+    return timestamp * 1000 if timestamp < 1e11 else timestamp
+
+
+def _iso_ms(timestamp):
+    """Returns epoch ms from any ISO str, with or without a UTC offset, no offset is UTC."""
+    parsed = datetime.datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return round(parsed.timestamp() * 1000)
+
+
+
+class FlowStats:
+    """
+    Rolling inflow, outflow, and net flow stats per exchange over several time windows.
+
+    Each flow is added once per window and removed once when it ages out,
+    so updates are O(1) no matter how many flows are in a window.
+    Sums, sums of squares and counts are kept per exchange, mean and variance come from those.
+
+    Inflows count for the exchanges in the flow's `to`, outflows for the exchanges in its `from`,
+    and every flow counts for 'All'. Net flow is inflow value as positive and outflow value as negative.
+
+    Windows end at the latest flow timestamp seen, so replays and backfills give the same stats as live.
+
+    Attributes:
+
+    `windows: array<int>`
+        window lengths in secs. default 10 min, 1 hour, and 24 hours
+
+    Methods:
+
+    `update`
+        add a Token Analyst flow
+
+    `get`
+        get inflow, outflow and net stats for an exchange and window
+
+    `exchanges`
+        get exchanges seen in a window
+
+    """
+    def __init__(self, windows=WINDOWS):
+        self.windows = sorted(int(w) for w in windows)
+        # window -> deque of ( ts, exchanges, is_inflow, value ), oldest first
+        self._flows = {w: deque() for w in self.windows}
+        # window -> { exchange -> [ in_sum, in_sq, in_n, out_sum, out_sq, out_n ] }
+        self._totals = {w: {} for w in self.windows}
+        self._now = 0
+
+
+    def update(self, data):
+        """
+        Adds a Token Analyst flow to every window, and drops flows that have aged out.
+
+        Parameters:
+
+        `data: Token Analyst data`
+            data from Token Analyst websocket, flows that are not 'Inflow' or 'Outflow' only move the windows along
+        """
+        ts = epoch_ms(data.get('timestamp'))
+        if ts > self._now:
+            self._now = ts
+        flowType = data.get('flowType')
+        is_inflow = flowType == 'Inflow'
+        value = float(data.get('value') or 0)
+        exchanges = ('All',) + tuple(data.get('to' if is_inflow else 'from') or ())
+
+        for window in self.windows:
+            start = self._now - window * 1000
+            self._expire(window, start)
+            if ts < start or flowType not in ('Inflow', 'Outflow'):
+                continue
+            self._flows[window].append((ts, exchanges, is_inflow, value))
+            self._add(self._totals[window], exchanges, is_inflow, value, 1)
+
+
+    def get(self, exchange='Bitmex', window=600):
+        """
+        Returns stats for exchange over window.
+
+        Parameters:
+
+        `exchange: str`
+            exchange name, or 'All' for every flow. default Bitmex
+
+        `window: int`
+            window in secs, one of windows. default 600
+
+        Returns:
+
+        `stats: dict`
+            { 'inflow', 'outflow', 'net' }, each { 'sum', 'count', 'mean', 'var' }
+        """
+        if window not in self._totals:
+            raise KeyError("window %s secs not kept, windows are %s" % (window, self.windows))
+        t = self._totals[window].get(exchange) or [0.0, 0.0, 0, 0.0, 0.0, 0]
+        return {
+            'inflow': _stats(t[IN_SUM], t[IN_SQ], t[IN_N]),
+            'outflow': _stats(t[OUT_SUM], t[OUT_SQ], t[OUT_N]),
+            # outflows are negative, so their squares add
+            'net': _stats(t[IN_SUM] - t[OUT_SUM], t[IN_SQ] + t[OUT_SQ], t[IN_N] + t[OUT_N])
+        }
+
+
+    def exchanges(self, window=600):
+        """Returns exchanges with flows in window."""
+        return [name for name in self._totals[window] if name != 'All']
+
+
+    def _expire(self, window, start):
+        flows = self._flows[window]
+        totals = self._totals[window]
+        while flows and flows[0][0] < start:
+            ts, exchanges, is_inflow, value = flows.popleft()
+            self._add(totals, exchanges, is_inflow, value, -1)
+
+
+    @staticmethod
+    def _add(totals, exchanges, is_inflow, value, sign):
+        base = IN_SUM if is_inflow else OUT_SUM
+        for name in exchanges:
+            t = totals.get(name)
+            if t is None:
+                t = totals[name] = [0.0, 0.0, 0, 0.0, 0.0, 0]
+            t[base] += sign * value
+            t[base + 1] += sign * value * value
+            t[base + 2] += sign
+            if t[base + 2] == 0:
+                # reset so float error from adding and removing doesn't build up
+                t[base] = t[base + 1] = 0.0
+                if t[IN_N] == 0 and t[OUT_N] == 0:
+                    del totals[name]
+
+
+
+def _stats(total, squares, count):
+    if count == 0:
+        return {'sum': 0.0, 'count': 0, 'mean': 0.0, 'var': 0.0}
+    mean = total / count
+    # population variance, clamped since float error can leave it a hair below 0
+    return {'sum': total, 'count': count, 'mean': mean, 'var': max(squares / count - mean * mean, 0.0)}
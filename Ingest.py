@@ -0,0 +1,453 @@
+import os
+import time
+import struct
+import asyncio
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import fast_json
+from TradeTape import TradeTape, parse_timestamps
+from Exceptions import WebSocketError
+from colors import c
+
+'''
+    Optional multi-process ingestion.
+
+    Bitmex and Token Analyst websockets are read and decoded in their own processes,
+    events reach the strategy process through a shared memory ring buffer per feed,
+    so websocket framing, TLS, JSON decoding, and heartbeats don't share a core with trader_bot.
+
+    Bitmex trade frames are decoded in the feed process and sent as packed trade columns,
+    other Bitmex table frames are sent as is and decoded once by the strategy process,
+    Token Analyst heartbeats and acks stay in the feed process, only on-chain data is sent.
+    Each feed's watchdog runs in its feed process, the stale flag is sent back when the
+    websocket drops and again once it's resynced, so `is_stale` works in the strategy process.
+    Ping round trips and secs silent are kept by the watchdog in the feed process, they aren't served.
+'''
+
+# record header - payload length, record kind
+RECORD = struct.Struct('<IB')
+
+PAD = 0         # rest of the ring is unused, next record is at the start
+FRAME = 1       # raw Bitmex websocket frame
+TRADES = 2      # symbol, then packed TRADE rows
+DATA = 3        # Token Analyst on-chain data as JSON
+STALE = 4       # feed's stale flag, 1 when its websocket drops, 0 once it's resynced
+
+TRADE = np.dtype([('ts', '<i8'), ('price', '<f8'), ('size', '<i8'), ('side', 'i1'), ('id', 'S36')])
+
+# shared header - write count, read count, reader waiting flag
+INDEX_BYTES = 64
+
+
+
+class SharedRing:
+    """
+    Single producer, single consumer ring buffer of byte records in shared memory.
+
+    The producer only moves the write count and the consumer only moves the read count,
+    so no lock is needed. A record never wraps, if it doesn't fit before the end
+    of the ring it goes at the start.
+
+    Attributes:
+
+    `size: int`
+        ring bytes. default 16 MB
+
+    `name: str`
+        shared memory name, to attach to a ring made by another process.
+        default creates a new ring
+
+    Methods:
+
+    `put`
+        add a record, False if the ring is full
+
+    `get`
+        take the oldest record, None if empty
+
+    `close`
+        detach from the ring
+
+    `unlink`
+        free the ring, creator only
+
+    """
+    def __init__(self, size=1 << 24, name=None):
+        self.size = size
+        # feed processes are spawned from the creator and share its resource tracker,
+        # the creator unlinks the ring when done
+        self._shm = shared_memory.SharedMemory(name=name, create=name is None, size=INDEX_BYTES + size)
+        self.name = self._shm.name
+        self._index = np.ndarray(3, dtype=np.uint64, buffer=self._shm.buf)
+        self._data = self._shm.buf[INDEX_BYTES:INDEX_BYTES + size]
+        if name is None:
+            self._index[:] = 0
+
+
+    def __len__(self):
+        """Returns bytes waiting to be read."""
+        return int(self._index[0] - self._index[1])
+
+
+    def put(self, kind, payload):
+        """Adds a record, returns False if there isn't room for it."""
+        need = RECORD.size + len(payload)
+        if need > self.size:
+            raise ValueError("Record of %d bytes is larger than the ring" % len(payload))
+        write = int(self._index[0])
+        read = int(self._index[1])
+        pos = write % self.size
+        tail = self.size - pos
+
+        if tail < need:
+            if write + tail + need - read > self.size:
+                return False
+            if tail >= RECORD.size:
+                RECORD.pack_into(self._data, pos, 0, PAD)
+            write += tail
+            pos = 0
+        elif write + need - read > self.size:
+            return False
+
+        RECORD.pack_into(self._data, pos, len(payload), kind)
+        self._data[pos + RECORD.size:pos + need] = payload
+        # publish after the record is written
+        self._index[0] = write + need
+        return True
+
+
+    def get(self):
+        """Returns oldest record as (kind, payload bytes), or None if the ring is empty."""
+        read = int(self._index[1])
+        if read == int(self._index[0]):
+            return None
+        pos = read % self.size
+        tail = self.size - pos
+
+        if tail < RECORD.size:
+            read += tail
+            pos = 0
+        length, kind = RECORD.unpack_from(self._data, pos)
+        if kind == PAD:
+            read += tail
+            pos = 0
+            length, kind = RECORD.unpack_from(self._data, pos)
+
+        start = pos + RECORD.size
+        payload = bytes(self._data[start:start + length])
+        self._index[1] = read + RECORD.size + length
+        return kind, payload
+
+
+    def set_waiting(self, waiting):
+        """Consumer tells the producer it wants a wake up on the next record."""
+        self._index[2] = 1 if waiting else 0
+
+
+    def is_waiting(self):
+        return bool(self._index[2])
+
+
+    def close(self):
+        """Detaches from the ring."""
+        self._index = None
+        self._data.release()
+        self._shm.close()
+
+
+    def unlink(self):
+        """Frees the ring, call once from the process that created it."""
+        self._shm.unlink()
+
+
+
+def pack_trades(symbol, trades):
+    """Returns Bitmex trade rows for one symbol as a TRADES payload."""
+    rows = np.empty(len(trades), dtype=TRADE)
+    rows['ts'] = parse_timestamps([t['timestamp'] for t in trades])
+    rows['price'] = [t['price'] for t in trades]
+    rows['size'] = [t['size'] for t in trades]
+    rows['side'] = [TradeTape.BUY if t['side'] == 'Buy' else TradeTape.SELL for t in trades]
+    # trdMatchID, so the tape can skip trades a resubscribe's partial sends again
+    rows['id'] = [t.get('trdMatchID', '') for t in trades]
+    name = symbol.encode('utf8')
+    return bytes([len(name)]) + name + rows.tobytes()
+
+
+def unpack_trades(payload):
+    """Returns (symbol, rows) from a TRADES payload, rows is a TRADE array over the payload."""
+    n = payload[0]
+    return payload[1:1 + n].decode('utf8'), np.frombuffer(payload, dtype=TRADE, offset=1 + n)
+
+
+
+class _Producer:
+    """Feed process side of a ring, waits for room and wakes the strategy process."""
+
+    def __init__(self, ring_name, ring_size, wake):
+        self.ring = SharedRing(ring_size, name=ring_name)
+        self._wake = wake.fileno()
+        os.set_blocking(self._wake, False)
+        # keep the connection so its fd stays open
+        self._wake_conn = wake
+
+    def put(self, kind, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf8')
+        # ring full, strategy process is behind, hold the feed until it catches up
+        # this process only reads the websocket, so blocking it is the backpressure
+        while not self.ring.put(kind, payload):
+            time.sleep(0.0005)
+        if self.ring.is_waiting():
+            try:
+                os.write(self._wake, b'\0')
+            except BlockingIOError:
+                # pipe is full of wake ups already
+                pass
+
+
+
+def _bitmex_process(args, ring_name, ring_size, wake, json_backend):
+    """Feed process - reads Bitmex websocket, sends table data to the ring."""
+    fast_json.set_backend(json_backend)
+    from BitMEX import BitMEX
+
+    producer = _Producer(ring_name, ring_size, wake)
+
+    class FeedBitMEX(BitMEX):
+        def _handle_frame(self, raw_msg, id="bitMEX_stream"):
+            msg = fast_json.loads(raw_msg)
+            msg_type = self._interpret_msg_type(msg, id)
+            if msg_type == 'TABLE':
+                if msg['table'] == 'trade' and msg['action'] != 'partial' and msg['data']:
+                    by_symbol = {}
+                    for row in msg['data']:
+                        by_symbol.setdefault(row['symbol'], []).append(row)
+                    for symbol, rows in by_symbol.items():
+                        producer.put(TRADES, pack_trades(symbol, rows))
+                else:
+                    producer.put(FRAME, raw_msg)
+            return msg_type, msg
+
+        def _disconnected(self, error):
+            producer.put(STALE, b'\x01')
+            return super()._disconnected(error)
+
+        def _resynced(self):
+            super()._resynced()
+            producer.put(STALE, b'\x00')
+
+    bitmex = FeedBitMEX(**args)
+    try:
+        asyncio.new_event_loop().run_until_complete(bitmex.connect())
+    except KeyboardInterrupt:
+        pass
+
+
+
+def _token_analyst_process(key, channel, reconnect, ws_url, watchdog, ring_name, ring_size, wake, json_backend):
+    """Feed process - reads Token Analyst websocket, sends on-chain data to the ring."""
+    fast_json.set_backend(json_backend)
+    from TokenAnalyst import TokenAnalyst
+
+    producer = _Producer(ring_name, ring_size, wake)
+
+    class FeedTokenAnalyst(TokenAnalyst):
+        def _disconnected(self, error):
+            producer.put(STALE, b'\x01')
+            return super()._disconnected(error)
+
+        def _resynced(self):
+            super()._resynced()
+            producer.put(STALE, b'\x00')
+
+    token_analyst = FeedTokenAnalyst(key=key, reconnect=reconnect, ws_url=ws_url, watchdog=watchdog)
+
+    async def run():
+        async for data in token_analyst.connect(channel=channel):
+            if data is not None:
+                producer.put(DATA, fast_json.dumps_bytes(data))
+
+    try:
+        asyncio.new_event_loop().run_until_complete(run())
+    except KeyboardInterrupt:
+        pass
+
+
+
+class IngestProcesses:
+    """
+    Runs the Bitmex and Token Analyst websockets in their own processes.
+
+    Stands in for `bitmex.connect()` and `token_analyst.connect()` in the strategy process,
+    Bitmex table data is applied to `bitmex` as usual and REST calls still go through `bitmex`.
+
+    Attributes:
+
+    `bitmex: BitMEX`
+        gets the websocket's table data, its key, urls, and symbols are used by the feed process
+
+    `token_analyst: TokenAnalyst`
+        optional, its key is used by the feed process, no Token Analyst feed if not supplied
+
+    `channel: str`
+        Token Analyst channel. default btc_confirmed_exchange_flows
+
+    `ring_size: int`
+        bytes per feed ring buffer. default 16 MB
+
+    Methods:
+
+    `start`
+        start feed processes
+
+    `run_bitmex`
+        apply Bitmex table data as it arrives, use instead of bitmex.connect()
+
+    `token_analyst_data`
+        yields on-chain data, use instead of token_analyst.connect()
+
+    `stop`
+        stop feed processes and free ring buffers
+
+    """
+    def __init__(self, bitmex, token_analyst=None, channel="btc_confirmed_exchange_flows", ring_size=1 << 24):
+        self.bitmex = bitmex
+        self.token_analyst = token_analyst
+        self.channel = channel
+        self.ring_size = ring_size
+        self._feeds = {}
+
+
+    def start(self):
+        """Starts a feed process per websocket."""
+        bitmex = self.bitmex
+        bitmex_args = {
+            'key': bitmex._key,
+            'secret': bitmex._secret,
+            'symbol': bitmex.symbol,
+            'base_url': bitmex.base_url,
+            'ws_url': bitmex._ws_url,
+            'symbols': bitmex.symbols,
+            'orderIDPrefex': bitmex._orderIDPrefix,
+            'reconnect': bitmex.reconnect,
+            'watchdog': bitmex.watchdog
+        }
+        self._start_feed('bitmex', _bitmex_process, (bitmex_args,))
+        if self.token_analyst is not None:
+            token_analyst = self.token_analyst
+            self._start_feed('token_analyst', _token_analyst_process, (token_analyst._key, self.channel, token_analyst.reconnect, token_analyst.ws_url, token_analyst.watchdog))
+
+
+    async def run_bitmex(self):
+        """
+        Applies Bitmex table data from the feed process to bitmex, runs till stopped.
+
+        async func - use await
+        """
+        bitmex = self.bitmex
+        async for kind, payload in self._records('bitmex'):
+            if kind == TRADES:
+                # a trade message decoded in the feed process, frames are counted by _handle_frame
+                bitmex._frames.inc()
+                symbol, rows = unpack_trades(payload)
+                tape = bitmex.trade_tapes.get(symbol)
+                if tape is None:
+                    continue
+                # the tape skips trades it already has, same as TradeTape.append
+                tape.append_columns(rows['ts'], rows['price'], rows['size'], rows['side'], ids=rows['id'].astype(str))
+            elif kind == FRAME:
+                bitmex._handle_frame(payload)
+            elif kind == STALE:
+                bitmex.watchdog.stale = payload == b'\x01'
+
+
+    async def token_analyst_data(self):
+        """
+        Yields on-chain data from the Token Analyst feed process.
+
+        async func - use async for
+        """
+        token_analyst = self.token_analyst
+        async for kind, payload in self._records('token_analyst'):
+            if kind == DATA:
+                token_analyst.received_at = time.perf_counter_ns()
+                token_analyst._frames.inc()
+                yield token_analyst._on_data(fast_json.loads(payload))
+            elif kind == STALE:
+                token_analyst.watchdog.stale = payload == b'\x01'
+
+
+    def stop(self):
+        """Stops feed processes and frees ring buffers."""
+        for name, (process, ring, reader) in self._feeds.items():
+            process.terminate()
+            process.join(5)
+            asyncio.get_event_loop().remove_reader(reader.fileno())
+            reader.close()
+            ring.close()
+            ring.unlink()
+        self._feeds = {}
+
+
+    def _start_feed(self, name, target, args):
+        # spawn, the feed process gets its own event loop, not a copy of ours
+        ctx = multiprocessing.get_context('spawn')
+        ring = SharedRing(self.ring_size)
+        reader, writer = ctx.Pipe(duplex=False)
+        process = ctx.Process(
+            target=target,
+            args=args + (ring.name, self.ring_size, writer, fast_json.backend),
+            name="traderbot-%s" % name,
+            daemon=True
+        )
+        process.start()
+        writer.close()
+        os.set_blocking(reader.fileno(), False)
+        self._feeds[name] = (process, ring, reader)
+        print(c[3] + "\nStarted %s feed process ( pid %d )" % (name, process.pid) + c[0])
+
+
+    async def _records(self, name):
+        """Yields (kind, payload) from a feed's ring, sleeps on the wake pipe when it's empty."""
+        process, ring, reader = self._feeds[name]
+        fd = reader.fileno()
+        loop = asyncio.get_event_loop()
+        woken = asyncio.Event()
+        loop.add_reader(fd, woken.set)
+        count = 0
+
+        try:
+            # reader is closed once stop has run
+            while not reader.closed:
+                record = ring.get()
+                if record is None:
+                    ring.set_waiting(True)
+                    # check again, a record may have landed before the flag was seen
+                    record = ring.get()
+                    while record is None:
+                        try:
+                            await asyncio.wait_for(woken.wait(), 1.0)
+                        except asyncio.TimeoutError:
+                            if not process.is_alive():
+                                raise WebSocketError(process.exitcode, "%s feed process exited" % name)
+                        woken.clear()
+                        if reader.closed:
+                            return
+                        try:
+                            os.read(fd, 4096)
+                        except BlockingIOError:
+                            pass
+                        record = ring.get()
+                    ring.set_waiting(False)
+
+                yield record
+
+                # long bursts, let trader_bot workers in now and then
+                count += 1
+                if count % 256 == 0:
+                    await asyncio.sleep(0)
+        finally:
+            if not reader.closed:
+                loop.remove_reader(fd)
@@ -0,0 +1,270 @@
+import time
+import queue
+import logging
+import threading
+from logging.handlers import QueueHandler
+from Exceptions import InvalidArgError
+
+
+
+class _BufferedFileHandler(logging.FileHandler):
+    """FileHandler that leaves flushing to LogQueue instead of flushing every record."""
+
+    def flush(self):
+        pass
+
+    def force_flush(self):
+        logging.FileHandler.flush(self)
+
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Puts records on a bounded queue with the handlers to write them to, formatting is left to the LogQueue thread."""
+
+    def __init__(self, log_queue, handlers):
+        QueueHandler.__init__(self, log_queue._queue)
+        self._log_queue = log_queue
+        self._handlers = handlers
+
+    def prepare(self, record):
+        # message is made now, args can change before the writer thread gets to it,
+        # the rest of the line ( time, level, ... ) is formatted on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # the traceback would keep its frames alive till written
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._log_queue._put((self._handlers, record))
+
+
+_exc_formatter = logging.Formatter()
+
+
+
+class LogQueue:
+    """
+    Moves log formatting and file writes off the event loop.
+
+    Handlers of the attached loggers are swapped for one queue handler,
+    so logging a record only makes its message and puts it on a bounded queue.
+    A background thread wakes every `flush_interval` secs, or once the queue is half full,
+    and formats, writes, and flushes what's queued to the original handlers as one batch.
+
+    Parameters:
+
+    `maxsize: int`
+        max records waiting to be written. default 10000
+
+    `policy: str`
+        what to do when the queue is full. default 'drop_newest'
+            'drop_newest' - new record is dropped
+            'drop_oldest' - oldest waiting record is dropped for the new one
+            'block' - wait for space, blocks the event loop
+
+    `flush_interval: float`
+        max secs a record waits to be written and flushed. default 1
+
+    Methods:
+
+    `attach`
+        send loggers' records through the queue
+
+    `start`
+        start writer thread
+
+    `stop`
+        write what's queued, flush, and put loggers' handlers back
+
+    `stats`
+        get queue depth, records written, and drops
+
+    """
+    POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, maxsize=10000, policy='drop_newest', flush_interval=1.0):
+        if policy not in self.POLICIES:
+            raise InvalidArgError(policy, "policy must be block, drop_oldest, or drop_newest.")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.flush_interval = flush_interval
+        # SimpleQueue has no lock and condition per put like Queue, maxsize is kept by _put
+        self._queue = queue.SimpleQueue()
+        # logger -> handlers it had before attach
+        self._loggers = {}
+        # ( handler written to, logger's handler ), a handler shared by loggers is swapped once
+        self._handlers = []
+        self._thread = None
+        # writer wakes at flush_interval, or early once the queue is this full
+        self._wake = threading.Event()
+        self._wake_at = max(maxsize // 2, 1)
+        self._stopping = False
+        self._written = 0
+        self._dropped = 0
+        self._reported = 0
+
+
+    def attach(self, *loggers):
+        """
+        Sends every record of each logger through the queue.
+
+        File handlers are swapped for ones that flush on the writer thread's schedule.
+
+        Parameters:
+
+        `loggers: logging.Logger`
+            ie logging.getLogger() for debug.log and order_logger for orders.log
+        """
+        for logger in loggers:
+            if logger in self._loggers:
+                continue
+            handlers = list(logger.handlers)
+            self._loggers[logger] = handlers
+            for handler in handlers:
+                logger.removeHandler(handler)
+            logger.addHandler(_DroppingQueueHandler(self, [self._buffered(handler) for handler in handlers]))
+
+
+    def start(self):
+        """Starts the writer thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="LogQueue", daemon=True)
+            self._thread.start()
+
+
+    def stop(self):
+        """Writes every queued record, flushes, and puts each logger's handlers back."""
+        if self._thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+            self._stopping = False
+
+        for logger, handlers in self._loggers.items():
+            for handler in list(logger.handlers):
+                if isinstance(handler, _DroppingQueueHandler):
+                    logger.removeHandler(handler)
+            for handler in handlers:
+                logger.addHandler(handler)
+        self._loggers = {}
+
+        for buffered, original in self._handlers:
+            if buffered is not original:
+                # original reopens its file on its next record
+                buffered.close()
+        self._handlers = []
+
+
+    def stats(self):
+        """Returns dict of queued, written, and dropped record counts."""
+        return {
+            'queued': self._queue.qsize(),
+            'written': self._written,
+            'dropped': self._dropped
+        }
+
+
+    def _buffered(self, handler):
+        """Returns handler to write through, a buffered copy for a plain FileHandler."""
+        for buffered, original in self._handlers:
+            if original is handler:
+                return buffered
+        buffered = handler
+        if type(handler) is logging.FileHandler:
+            buffered = _BufferedFileHandler(handler.baseFilename, mode='a', encoding=handler.encoding)
+            buffered.setLevel(handler.level)
+            buffered.setFormatter(handler.formatter)
+            for f in handler.filters:
+                buffered.addFilter(f)
+            handler.close()
+        self._handlers.append((buffered, handler))
+        return buffered
+
+
+    def _put(self, record):
+        q = self._queue
+        size = q.qsize()
+        if size >= self._wake_at:
+            self._wake.set()
+        if size >= self.maxsize:
+            if self.policy == 'block':
+                # writer thread makes room, it doesn't need the event loop to
+                while q.qsize() >= self.maxsize:
+                    time.sleep(0.0005)
+            elif self.policy == 'drop_oldest':
+                self._dropped += 1
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+            else:
+                self._dropped += 1
+                return
+        q.put(record)
+
+
+    def _run(self):
+        while True:
+            # records pile up between wake ups and are written as a batch,
+            # so the GIL is taken from the event loop once a batch, not once a record
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = self._stopping
+            self._drain()
+            self._flush()
+            if stopping:
+                return
+
+
+    def _drain(self):
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._write(*record)
+            self._written += 1
+        self._report_drops()
+
+
+    def _write(self, handlers, record):
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                try:
+                    handler.handle(record)
+                except Exception:
+                    handler.handleError(record)
+
+
+    def _report_drops(self):
+        dropped = self._dropped
+        if dropped != self._reported:
+            record = logging.makeLogRecord({
+                'name': 'LogQueue',
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': "Log queue full, dropped %d log records." % (dropped - self._reported)
+            })
+            self._reported = dropped
+            # warning goes to the root log ( debug.log ), not to every log like orders.log
+            root = logging.getLogger()
+            if root in self._loggers:
+                self._write([self._buffered(handler) for handler in self._loggers[root]], record)
+            else:
+                root.handle(record)
+
+
+    def _flush(self):
+        for buffered, original in self._handlers:
+            try:
+                if isinstance(buffered, _BufferedFileHandler):
+                    buffered.force_flush()
+                else:
+                    buffered.flush()
+            except Exception:
+                pass
@@ -0,0 +1,306 @@
+import time
+import logging
+from collections import deque
+from aiohttp import web
+from Exceptions import InvalidArgError
+
+# quantiles reported for every histogram
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+
+class Histogram:
+    """
+    HDR style latency histogram, values recorded in nanoseconds.
+
+    Values below 2 * 2**sub_bits get a bucket each, above that every power of 2
+    is split into 2**sub_bits buckets, so a bucket is at most 1 / 2**sub_bits
+    of its value wide ( 3% with the default 5 ). Recording is a bit_length,
+    a shift and a list increment, counts are only walked when quantiles are asked for.
+
+    Attributes:
+
+    `count: int`
+        values recorded
+
+    `sum: int`
+        sum of values recorded, ns
+
+    `max: int`
+        largest value recorded, ns
+
+    Methods:
+
+    `record`
+        add a value in ns
+
+    `since`
+        add the time since a time.perf_counter_ns() start
+
+    `quantile`
+        get value at quantile, ns
+
+    `quantiles`
+        get values at several quantiles, ns
+
+    """
+    def __init__(self, sub_bits=5):
+        if not 1 <= sub_bits <= 10:
+            raise InvalidArgError(sub_bits, "sub_bits must be 1 to 10.")
+        self.sub_bits = sub_bits
+        self._linear = 2 << sub_bits
+        # enough buckets for any 64 bit value
+        self.counts = [0] * ((64 - sub_bits) << sub_bits)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+
+    def record(self, value):
+        """Adds value, in ns. Negative values count as 0."""
+        if value < self._linear:
+            if value < 0:
+                value = 0
+            self.counts[value] += 1
+        else:
+            shift = value.bit_length() - self.sub_bits - 1
+            self.counts[(shift << self.sub_bits) + (value >> shift)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+
+    def since(self, start):
+        """Adds ns since `start`, a time.perf_counter_ns()."""
+        self.record(time.perf_counter_ns() - start)
+
+
+    def quantile(self, q):
+        """Returns value at quantile q ( 0 to 1 ) in ns, the top of its bucket. 0 if nothing recorded."""
+        return self.quantiles((q,))[0]
+
+
+    def quantiles(self, qs):
+        """Returns values at each of quantiles qs, ascending, in one pass over the buckets."""
+        values = []
+        if not self.count:
+            return [0] * len(qs)
+        ranks = iter([q * self.count for q in qs])
+        rank = next(ranks)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n:
+                seen += n
+                while seen >= rank:
+                    values.append(min(self._highest(i), self.max))
+                    rank = next(ranks, None)
+                    if rank is None:
+                        return values
+        while len(values) < len(qs):
+            values.append(self.max)
+        return values
+
+
+    def _highest(self, i):
+        """Largest value that lands in bucket i."""
+        if i < self._linear:
+            return i
+        shift = (i >> self.sub_bits) - 1
+        return ((i - (shift << self.sub_bits) + 1) << shift) - 1
+
+
+
+class Counter:
+    """Count that only goes up."""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+
+
+class Gauge:
+    """Value that goes up and down, either `set` or read from `fn` when metrics are rendered."""
+
+    def __init__(self, fn=None):
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+
+
+class Metrics:
+    """
+    Registry of latency histograms, counters, and gauges, rendered in Prometheus text format
+    and served over HTTP from the running event loop.
+
+    Metrics are looked up by name and labels, asking twice returns the same one,
+    so keep what the hot path records to instead of looking it up each time.
+
+    Methods:
+
+    `histogram`
+        get or create a latency histogram, exported as a summary in seconds
+
+    `counter`
+        get or create a counter
+
+    `gauge`
+        get or create a gauge, optionally read from a function
+
+    `per_second`
+        gauge of a counter's rate
+
+    `render`
+        get every metric in Prometheus text format
+
+    `serve`
+        serve /metrics over HTTP
+
+    `stop`
+        stop serving
+
+    """
+    def __init__(self):
+        # name -> [type, help, {labels: metric}]
+        self._families = {}
+        self._runner = None
+
+
+    def histogram(self, name, help='', sub_bits=5, **labels):
+        """
+        Returns histogram for name and labels, created if new.
+
+        Parameters:
+
+        `name: str`
+            metric name, ie 'traderbot_http_request_seconds'
+
+        `help: str`
+            description of metric
+
+        `labels: str`
+            optional, ie verb='POST'
+        """
+        return self._get(name, 'summary', help, labels, lambda: Histogram(sub_bits))
+
+
+    def counter(self, name, help='', **labels):
+        """Returns counter for name and labels, created if new."""
+        return self._get(name, 'counter', help, labels, Counter)
+
+
+    def gauge(self, name, help='', fn=None, **labels):
+        """Returns gauge for name and labels, created if new. `fn` is called for its value when rendered."""
+        gauge = self._get(name, 'gauge', help, labels, lambda: Gauge(fn))
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+
+    def per_second(self, counter, name, help='', window=10, **labels):
+        """
+        Returns a gauge of how fast `counter` went up over about the last `window` secs,
+        worked out from samples taken each time metrics are rendered.
+        """
+        samples = deque([(time.monotonic(), counter.value)])
+
+        def rate():
+            now = time.monotonic()
+            samples.append((now, counter.value))
+            while len(samples) > 2 and now - samples[1][0] >= window:
+                samples.popleft()
+            then, value = samples[0]
+            return (counter.value - value) / (now - then) if now > then else 0.0
+
+        return self.gauge(name, help, fn=rate, **labels)
+
+
+    def render(self):
+        """Returns every metric in Prometheus text format."""
+        lines = []
+        for name, (kind, help, metrics) in self._families.items():
+            if help:
+                lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for labels, metric in metrics.items():
+                if kind == 'summary':
+                    for q, value in zip(QUANTILES, metric.quantiles(QUANTILES)):
+                        lines.append("%s%s %.9g" % (name, _labels(labels + (('quantile', str(q)),)), value / 1e9))
+                    lines.append("%s_sum%s %.9g" % (name, _labels(labels), metric.sum / 1e9))
+                    lines.append("%s_count%s %d" % (name, _labels(labels), metric.count))
+                elif kind == 'counter':
+                    lines.append("%s%s %d" % (name, _labels(labels), metric.value))
+                else:
+                    try:
+                        value = metric.get()
+                    except Exception:
+                        logging.exception("Metrics - gauge %s failed" % name)
+                        continue
+                    lines.append("%s%s %.9g" % (name, _labels(labels), value))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+    async def serve(self, host='127.0.0.1', port=9464):
+        """
+        Serves metrics at http://host:port/metrics on the running event loop.
+
+        async func - use await
+        """
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        self._runner = runner
+        logging.info("Metrics served at http://%s:%d/metrics" % (host, port))
+
+
+    async def stop(self):
+        """Stops serving metrics.
+
+        async func - use await"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+    async def _handle(self, request):
+        return web.Response(body=self.render().encode('utf8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+    def _get(self, name, kind, help, labels, make):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = [kind, help, {}]
+        elif family[0] != kind:
+            raise InvalidArgError(name, "metric is already a %s." % family[0])
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = make()
+        return metric
+
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+
+# shared by every module, served by TraderBot when --metrics-port or G_METRICS_PORT is set
+metrics = Metrics()
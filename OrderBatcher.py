@@ -0,0 +1,214 @@
+import asyncio
+import logging
+from Exceptions import InvalidArgError
+
+# fields BitMEX.amend_order and an amend_bulk_order entry take
+AMEND_FIELDS = ('orderID', 'origClOrdID', 'clOrdID', 'orderQty', 'leavesQty', 'price', 'stopPx', 'pegOffsetValue', 'text')
+
+class OrderBatcher:
+    """
+    Collects orders placed within a few milliseconds of each other and sends
+    them as one place_bulk_order / amend_bulk_order per symbol.
+
+    Signals that fire together, ie many outflows from the same block, then
+    share one HTTP call and one rate limit slot instead of one each.
+    A batch goes out when its window is up or when it reaches max_batch orders,
+    a batch of one goes out as a plain place_order / amend_order.
+
+    Attributes:
+
+    `bitmex: BitMEX`
+        connection orders are sent on
+
+    `window: float`
+        secs to wait for more orders after the first one of a batch. default 0.005
+
+    `max_batch: int`
+        max orders per bulk request. default 10
+
+    Methods:
+
+    `place`
+        queue an order to place, returns a future for its result
+
+    `amend`
+        queue an amend, returns a future for its result
+
+    `flush`
+        send everything queued now and wait for the responses
+
+    `stats`
+        get batch and order counts
+
+    """
+    def __init__(self, bitmex, window=0.005, max_batch=10):
+        if max_batch < 1:
+            raise InvalidArgError(max_batch, "max_batch must be at least 1.")
+        if window < 0:
+            raise InvalidArgError(window, "window can not be negative.")
+
+        self.bitmex = bitmex
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._timers = {}
+        self._tasks = set()
+        # stats
+        self.batches = 0
+        self.orders = 0
+        self.largest = 0
+
+
+    def place(self, order):
+        """
+        Queues an order to be placed.
+
+        Parameters:
+
+        `order: dict`
+            order ( use Trade class to make orders )
+
+        Returns:
+
+        `result: asyncio.Future`
+            resolves to the Bitmex response for this order, use await
+        """
+        return self._add('place', order)
+
+
+    def amend(self, order):
+        """
+        Queues an amend of an open order.
+
+        Parameters:
+
+        `order: dict`
+            orderID or origClOrdID, and the fields to amend ( see BitMEX.amend_order ).
+            optional symbol to batch it by, looked up from our orders if not supplied,
+            an amend of an order we don't know goes out on its own
+
+        Returns:
+
+        `result: asyncio.Future`
+            resolves to the Bitmex response for this amend, use await
+        """
+        if 'orderID' not in order and 'origClOrdID' not in order:
+            raise InvalidArgError(order, "Must submit either orderID or origClOrdID to amend order(s).")
+        unknown = [field for field in order if field != 'symbol' and field not in AMEND_FIELDS]
+        if unknown:
+            raise InvalidArgError(unknown, "Can not amend %s." % ', '.join(unknown))
+        return self._add('amend', order)
+
+
+    async def flush(self):
+        """Sends every queued batch now and waits till all sent batches are answered.
+
+        async func - use await"""
+        for key in list(self._pending):
+            self._send_batch(key)
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+    def stats(self):
+        """Returns dict of batches sent, orders sent, largest batch, and orders waiting."""
+        return {
+            'batches': self.batches,
+            'orders': self.orders,
+            'largest': self.largest,
+            'avg_batch': self.orders / self.batches if self.batches else 0.0,
+            'waiting': sum(len(batch) for batch in self._pending.values())
+        }
+
+
+    def _add(self, kind, order):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        if kind == 'amend':
+            symbol = self._amend_symbol(order)
+            if symbol is None:
+                # can't tell which symbol's batch it belongs in
+                self._dispatch(kind, [(order, future)])
+                return future
+        else:
+            symbol = order.get('symbol', self.bitmex.symbol)
+        key = (kind, symbol)
+
+        batch = self._pending.setdefault(key, [])
+        batch.append((order, future))
+
+        if len(batch) >= self.max_batch:
+            self._send_batch(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.window, self._send_batch, key)
+        return future
+
+
+    def _send_batch(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if batch:
+            self._dispatch(key[0], batch)
+
+
+    def _dispatch(self, kind, batch):
+        self.batches += 1
+        self.orders += len(batch)
+        self.largest = max(self.largest, len(batch))
+
+        task = asyncio.ensure_future(self._send(kind, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+    def _amend_symbol(self, order):
+        """Returns symbol of the order an amend is for, or None if we don't know the order."""
+        if 'symbol' in order:
+            return order['symbol']
+        orders = self.bitmex.orders
+        known = orders.get(order['orderID']) if 'orderID' in order else None
+        if known is None and 'origClOrdID' in order:
+            known = orders.get_by_clOrdID(order['origClOrdID'])
+        return known.get('symbol') if known is not None else None
+
+
+    async def _send(self, kind, batch):
+        orders = [order for order, future in batch]
+        if kind == 'amend':
+            # symbol is only for batching, amends don't take it
+            orders = [dict((field, value) for field, value in order.items() if field != 'symbol') for order in orders]
+        try:
+            if len(orders) == 1:
+                if kind == 'place':
+                    results = [await self.bitmex.place_order(orders[0])]
+                else:
+                    results = [await self.bitmex.amend_order(**orders[0])]
+            else:
+                if kind == 'place':
+                    results = await self.bitmex.place_bulk_order(orders)
+                else:
+                    results = await self.bitmex.amend_bulk_order(orders)
+                # dry run echoes the request back
+                if isinstance(results, dict) and 'orders' in results:
+                    results = results['orders']
+                if not isinstance(results, list) or len(results) != len(orders):
+                    raise Exception("Bulk %s response does not match request.\nSent: %s\nReturned: %s" % (kind, orders, results))
+
+        except Exception as e:
+            logging.error("Order batch of %d failed - %s" % (len(batch), e))
+            for order, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BaseException:
+            # cancelled, or BitMEX exiting on a fatal error
+            for order, future in batch:
+                future.cancel()
+            raise
+
+        # Bitmex answers bulk requests in request order
+        for (order, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,204 @@
+import logging
+from bisect import bisect_left
+
+
+class OrderBookL2:
+    """
+    Bitmex L2 order book for one symbol, kept up to date from `orderBookL2` websocket messages.
+
+    Price levels are keyed by id, prices are kept in sorted arrays per side, so
+    best bid/ask and spread are O(1), inserts and deletes are O(log n) to find the level,
+    and size updates are O(1) and allocation free.
+
+    Attributes:
+
+    `symbol: str`
+        symbol of book
+
+    Methods:
+
+    `apply`
+        apply an orderBookL2 table message
+
+    `best_bid`
+        get best bid (price, size)
+
+    `best_ask`
+        get best ask (price, size)
+
+    `spread`
+        get best ask - best bid
+
+    `mid_price`
+        get mid price
+
+    `levels`
+        get top N (price, size) levels of a side
+
+    `depth`
+        get total size of top N levels of each side
+
+    """
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self._ready = False
+        # id -> [side, price, size]
+        self._levels = {}
+        # bids are stored as negative prices so both sides sort ascending, best first
+        self._bid_prices = []
+        self._bid_ids = []
+        self._ask_prices = []
+        self._ask_ids = []
+
+
+    def __len__(self):
+        return len(self._levels)
+
+
+    def is_ready(self):
+        """Returns True once the partial message has been received."""
+        return self._ready
+
+
+    def best_bid(self):
+        """Returns (price, size) of best bid or None."""
+        if self._bid_ids:
+            level = self._levels[self._bid_ids[0]]
+            return level[1], level[2]
+        return None
+
+
+    def best_ask(self):
+        """Returns (price, size) of best ask or None."""
+        if self._ask_ids:
+            level = self._levels[self._ask_ids[0]]
+            return level[1], level[2]
+        return None
+
+
+    def spread(self):
+        """Returns best ask - best bid or None."""
+        if self._bid_ids and self._ask_ids:
+            return self._ask_prices[0] + self._bid_prices[0]
+        return None
+
+
+    def mid_price(self):
+        """Returns price between best bid and best ask or None."""
+        if self._bid_ids and self._ask_ids:
+            return (self._ask_prices[0] - self._bid_prices[0]) / 2
+        return None
+
+
+    def levels(self, side, n=10):
+        """
+        Returns top levels of a side, best first.
+
+        Parameters:
+
+        `side: str`
+            Buy or Sell
+
+        `n: int`
+            number of levels, default 10
+
+        Returns:
+
+        `levels: array<(price, size)>`
+        """
+        ids = self._bid_ids if side == 'Buy' else self._ask_ids
+        levels = self._levels
+        return [(levels[i][1], levels[i][2]) for i in ids[:n]]
+
+
+    def depth(self, n=10):
+        """Returns (bid size, ask size) summed over the top n levels of each side."""
+        levels = self._levels
+        bid_size = sum(levels[i][2] for i in self._bid_ids[:n])
+        ask_size = sum(levels[i][2] for i in self._ask_ids[:n])
+        return bid_size, ask_size
+
+
+    def apply(self, msg):
+        """
+        Applies an orderBookL2 websocket message.
+
+        Parameters:
+
+        `msg: dict`
+            decoded websocket message with 'action' and 'data'
+        """
+        action = msg['action']
+        data = msg['data']
+
+        if action == 'partial':
+            self.clear()
+            self._ready = True
+            self._insert(data)
+        elif not self._ready:
+            logging.debug("Bitmex orderBookL2 %s before partial, skipping" % action)
+        elif action == 'update':
+            self._update(data)
+        elif action == 'insert':
+            self._insert(data)
+        elif action == 'delete':
+            self._delete(data)
+
+
+    def clear(self):
+        """Removes all levels."""
+        self._ready = False
+        self._levels.clear()
+        del self._bid_prices[:], self._bid_ids[:], self._ask_prices[:], self._ask_ids[:]
+
+
+    def _insert(self, data):
+        levels = self._levels
+        symbol = self.symbol
+        for row in data:
+            if row['symbol'] != symbol:
+                continue
+            level_id = row['id']
+            if level_id in levels:
+                self._remove(level_id)
+            side = row['side']
+            price = row['price']
+            if side == 'Buy':
+                prices, ids, key = self._bid_prices, self._bid_ids, -price
+            else:
+                prices, ids, key = self._ask_prices, self._ask_ids, price
+            i = bisect_left(prices, key)
+            prices.insert(i, key)
+            ids.insert(i, level_id)
+            levels[level_id] = [side, price, row['size']]
+
+
+    def _update(self, data):
+        levels = self._levels
+        for row in data:
+            level = levels.get(row['id'])
+            if level is None:
+                continue
+            # only size changes on update, side can change when the book crosses
+            if row.get('side', level[0]) != level[0]:
+                self._remove(row['id'])
+                # size can be left out when only the side changed
+                self._insert([dict(row, price=level[1], size=row.get('size', level[2]), symbol=self.symbol)])
+            else:
+                level[2] = row['size']
+
+
+    def _delete(self, data):
+        for row in data:
+            if row['id'] in self._levels:
+                self._remove(row['id'])
+
+
+    def _remove(self, level_id):
+        side, price, size = self._levels.pop(level_id)
+        if side == 'Buy':
+            prices, ids, key = self._bid_prices, self._bid_ids, -price
+        else:
+            prices, ids, key = self._ask_prices, self._ask_ids, price
+        i = bisect_left(prices, key)
+        del prices[i], ids[i]
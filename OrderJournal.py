@@ -0,0 +1,455 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import datetime
+import threading
+import numpy as np
+from OrderManager import STATES
+from FlowStats import epoch_ms
+from Exceptions import InvalidArgError
+
+'''
+    Append only binary journal of our orders.
+
+    Every order sent, every REST order response, and every execution table row
+    is one fixed layout RECORD, appended in time order. Reads memory map the file,
+    so queries touch only the records they need.
+
+    A sidecar index ( path + '.idx' ) keeps ( clOrdID, record number ) sorted by clOrdID
+    for the records it covers, records appended since are scanned directly.
+'''
+
+# file header - magic, then record size
+MAGIC = b'TBJRNL01'
+HEADER_BYTES = 16
+
+# record kinds
+SENT = 1        # order as we sent it
+RESPONSE = 2    # order in a REST response
+EXECUTION = 3   # execution table row
+
+KINDS = {'sent': SENT, 'response': RESPONSE, 'execution': EXECUTION}
+
+# codes for Bitmex enums, 0 is missing or unknown
+ORD_STATUSES = [None] + list(STATES)
+ORD_TYPES = [None, 'Market', 'Limit', 'Stop', 'StopLimit', 'MarketIfTouched', 'LimitIfTouched', 'Pegged']
+EXEC_TYPES = [None, 'New', 'Trade', 'Canceled', 'Replaced', 'Restated', 'TriggeredOrActivatedBySystem', 'Rejected', 'Funding', 'Settlement']
+
+_CODES = {
+    'ordStatus': {name: i for i, name in enumerate(ORD_STATUSES) if name},
+    'ordType': {name: i for i, name in enumerate(ORD_TYPES) if name},
+    'execType': {name: i for i, name in enumerate(EXEC_TYPES) if name}
+}
+
+# ints missing from a row are -1, floats are nan
+RECORD = np.dtype([
+    ('ts', '<i8'),              # epoch ms journaled
+    ('exchange_ts', '<i8'),     # epoch ms of Bitmex transactTime / timestamp
+    ('kind', 'u1'),
+    ('side', 'i1'),             # 1 Buy, -1 Sell, 0 unknown
+    ('ordStatus', 'u1'),
+    ('ordType', 'u1'),
+    ('execType', 'u1'),
+    ('symbol', 'S12'),
+    ('clOrdID', 'S36'),
+    ('orderID', 'S36'),
+    ('execID', 'S36'),
+    ('price', '<f8'),
+    ('stopPx', '<f8'),
+    ('avgPx', '<f8'),
+    ('lastPx', '<f8'),
+    ('orderQty', '<i8'),
+    ('cumQty', '<i8'),
+    ('leavesQty', '<i8'),
+    ('lastQty', '<i8'),
+])
+
+_STRS = ('symbol', 'clOrdID', 'orderID', 'execID')
+_FLOATS = ('price', 'stopPx', 'avgPx', 'lastPx')
+_INTS = ('orderQty', 'cumQty', 'leavesQty', 'lastQty')
+# bytes each string field holds
+_STR_BYTES = {f: RECORD.fields[f][0].itemsize for f in _STRS}
+
+
+
+class OrderJournal:
+    """
+    Append only, fixed layout binary journal of orders sent, REST order responses, and executions.
+
+    Queries by time are a binary search over the memory mapped records,
+    queries by clOrdID or clOrdID prefix go through the sorted index.
+
+    Attributes:
+
+    `path: str`
+        journal file path, opening an existing journal appends to it. default orders.journal
+
+    `reindex_after: int`
+        records appended since the index was written before it is rebuilt on open. default 100000
+
+    `flush_interval: float`
+        secs between writes of appended records to the file by a background thread,
+        a crash loses at most this long of records. default 1
+
+    Methods:
+
+    `record_sent`
+        journal orders as they are sent
+
+    `record_response`
+        journal a REST order response
+
+    `apply`
+        journal an execution table message
+
+    `query`
+        get records by time, clOrdID, clOrdID prefix, kind, and symbol
+
+    `latest`
+        get last known state of each order, ie to reconcile after a restart
+
+    `to_dicts`
+        get records as dicts
+
+    `reindex`
+        rebuild the clOrdID index
+
+    `close`
+        write the index and close the journal
+
+    """
+    def __init__(self, path="orders.journal", reindex_after=100000, flush_interval=1.0):
+        self.path = path
+        self.index_path = path + '.idx'
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'ab')
+        if new:
+            self._file.write(MAGIC + np.uint32(RECORD.itemsize).tobytes() + bytes(HEADER_BYTES - len(MAGIC) - 4))
+            self._file.flush()
+        else:
+            with open(path, 'rb') as f:
+                header = f.read(HEADER_BYTES)
+            if header[:len(MAGIC)] != MAGIC or np.frombuffer(header, '<u4', 1, len(MAGIC))[0] != RECORD.itemsize:
+                raise InvalidArgError(path, "Not an order journal, or written by another version.")
+        self._map = None
+        self._last_ts = 0
+        records = self._records()
+        if len(records):
+            self._last_ts = int(records['ts'][-1])
+        self._load_index()
+        if len(records) - self._indexed > reindex_after:
+            self.reindex()
+
+        # appends stay in the file buffer, written out here instead of on the event loop per order
+        self.flush_interval = flush_interval
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="OrderJournal", daemon=True)
+        self._flusher.start()
+
+
+    def __len__(self):
+        return len(self._records())
+
+
+    def record_sent(self, orders):
+        """Journals order(s) as they are sent, dict or array<dict>."""
+        self._append(SENT, [orders] if isinstance(orders, dict) else orders)
+
+
+    def record_response(self, response):
+        """Journals REST order response(s), ie from place_order or cancel_order."""
+        if isinstance(response, dict):
+            response = [response]
+        if isinstance(response, list):
+            self._append(RESPONSE, [row for row in response if isinstance(row, dict)])
+
+
+    def apply(self, msg):
+        """Journals rows of a Bitmex websocket execution table message, other tables are ignored."""
+        if msg['table'] == 'execution' and msg['action'] in ('partial', 'insert'):
+            self._append(EXECUTION, msg['data'])
+
+
+    def query(self, since=None, until=None, clOrdID=None, prefix=None, kind=None, symbol=None):
+        """
+        Returns records matching every filter given, in time order.
+
+        Parameters:
+
+        `since: int`
+            epoch ms, only records journaled at or after since
+
+        `until: int`
+            epoch ms, only records journaled before until
+
+        `clOrdID: str`
+            only records of this clOrdID
+
+        `prefix: str`
+            only records with a clOrdID starting with prefix
+
+        `kind: str`
+            only 'sent', 'response', or 'execution' records
+
+        `symbol: str`
+            only records of symbol
+
+        Returns:
+
+        `records: numpy array of RECORD`
+            copy of the matching records
+        """
+        records = self._records()
+        lo = self._search_ts(records, since) if since is not None else 0
+        hi = self._search_ts(records, until) if until is not None else len(records)
+
+        if clOrdID is not None or prefix is not None:
+            key = (clOrdID if clOrdID is not None else prefix).encode('utf8')
+            first, last = self._index_range(key, clOrdID is not None)
+            if last - first <= hi - lo:
+                recs = self._find(key, clOrdID is not None, first, last)
+                recs = recs[(recs >= lo) & (recs < hi)]
+                rows = records[recs]
+            else:
+                # time range has fewer records than the index matches, filter it instead
+                rows = np.array(records[lo:hi])
+                ids = rows['clOrdID']
+                rows = rows[ids == key] if clOrdID is not None else rows[_startswith(ids, key)]
+        else:
+            rows = np.array(records[lo:hi])
+
+        if kind is not None:
+            if kind not in KINDS:
+                raise InvalidArgError(kind, "kind must be sent, response, or execution.")
+            rows = rows[rows['kind'] == KINDS[kind]]
+        if symbol is not None:
+            rows = rows[rows['symbol'] == symbol.encode('utf8')]
+        return rows
+
+
+    def latest(self, prefix=None, since=None):
+        """
+        Returns each order's records merged oldest to newest, ie to merge into OrderManager after a restart.
+
+        Parameters:
+
+        `prefix: str`
+            only clOrdIDs starting with prefix
+
+        `since: int`
+            epoch ms, only records journaled at or after since
+        """
+        rows = self.query(since=since, prefix=prefix or '')
+        # stable sort by clOrdID keeps time order within each
+        rows = rows[np.argsort(rows['clOrdID'], kind='stable')]
+        orders = {}
+        for row in self.to_dicts(rows):
+            del row['kind'], row['ts']
+            orders.setdefault(row['clOrdID'], {}).update(row)
+        return list(orders.values())
+
+
+    def to_dicts(self, rows):
+        """Returns records as Bitmex style dicts, missing fields left out."""
+        # columns to lists first, numpy scalars one at a time are slow
+        columns = {f: rows[f].tolist() for f in RECORD.names}
+        kinds = ('', 'sent', 'response', 'execution')
+        result = []
+        for i in range(len(rows)):
+            d = {'kind': kinds[columns['kind'][i]], 'ts': columns['ts'][i]}
+            if columns['exchange_ts'][i] >= 0:
+                d['timestamp'] = _iso(columns['exchange_ts'][i])
+            if columns['side'][i]:
+                d['side'] = 'Buy' if columns['side'][i] > 0 else 'Sell'
+            if columns['ordStatus'][i]:
+                d['ordStatus'] = ORD_STATUSES[columns['ordStatus'][i]]
+            if columns['ordType'][i]:
+                d['ordType'] = ORD_TYPES[columns['ordType'][i]]
+            if columns['execType'][i]:
+                d['execType'] = EXEC_TYPES[columns['execType'][i]]
+            for f in _STRS:
+                if columns[f][i]:
+                    d[f] = columns[f][i].decode('utf8')
+            for f in _FLOATS:
+                if columns[f][i] == columns[f][i]:
+                    d[f] = columns[f][i]
+            for f in _INTS:
+                if columns[f][i] >= 0:
+                    d[f] = columns[f][i]
+            result.append(d)
+        return result
+
+
+    def reindex(self):
+        """Rebuilds the clOrdID index over every record and writes it to path + '.idx'."""
+        records = self._records()
+        keys = np.array(records['clOrdID'])
+        recs = np.flatnonzero(keys != b'').astype(np.uint64)
+        keys = keys[recs]
+        order = np.argsort(keys, kind='stable')
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            # keys and record numbers as separate contiguous arrays, searchsorted copies strided ones
+            np.save(f, keys[order])
+            np.save(f, recs[order])
+            # records covered, so a crash between journal and index writes is caught on open
+            np.save(f, np.array([len(records)], dtype=np.uint64))
+        os.replace(tmp, self.index_path)
+        self._load_index()
+
+
+    def close(self):
+        """Writes the index and closes the journal."""
+        self._closed.set()
+        self._flusher.join()
+        self.reindex()
+        self._map = None
+        self._file.close()
+
+
+    def _append(self, kind, rows):
+        if not rows:
+            return
+        now = max(int(time.time() * 1000), self._last_ts)
+        self._last_ts = now
+        ord_statuses, ord_types, exec_types = _CODES['ordStatus'], _CODES['ordType'], _CODES['execType']
+        records = []
+        for row in rows:
+            get = row.get
+            timestamp = get('transactTime') or get('timestamp')
+            side = get('side')
+            if side is None and get('orderQty'):
+                side = 'Buy' if row['orderQty'] > 0 else 'Sell'
+            strs = tuple((get(f) or '').encode('utf8') for f in _STRS)
+            for f, value in zip(_STRS, strs):
+                if len(value) > _STR_BYTES[f]:
+                    logging.warning("OrderJournal: %s %s is longer than %d bytes, journaled cut short." % (f, get(f), _STR_BYTES[f]))
+            records.append((
+                now,
+                epoch_ms(timestamp) if timestamp else -1,
+                kind,
+                1 if side == 'Buy' else -1 if side == 'Sell' else 0,
+                ord_statuses.get(get('ordStatus'), 0),
+                ord_types.get(get('ordType'), 0),
+                exec_types.get(get('execType'), 0))
+                + strs
+                + tuple(np.nan if get(f) is None else get(f) for f in _FLOATS)
+                + tuple(-1 if get(f) is None else abs(get(f)) for f in _INTS))
+        self._file.write(np.array(records, dtype=RECORD).tobytes())
+
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                logging.error("OrderJournal: flush failed: %s" % e)
+
+
+    def _records(self):
+        """Returns memory mapped records, remapped if the journal has grown."""
+        self._file.flush()
+        n = (os.path.getsize(self.path) - HEADER_BYTES) // RECORD.itemsize
+        if self._map is None or len(self._map) != n:
+            if n == 0:
+                self._map = np.empty(0, dtype=RECORD)
+            else:
+                self._map = np.memmap(self.path, dtype=RECORD, mode='r', offset=HEADER_BYTES, shape=(n,))
+        return self._map
+
+
+    def _load_index(self):
+        self._keys = np.empty(0, dtype='S36')
+        self._recs = np.empty(0, dtype=np.uint64)
+        self._indexed = 0
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'rb') as f:
+                    keys = np.load(f)
+                    recs = np.load(f)
+                    covered = int(np.load(f)[0])
+            except (ValueError, OSError, IndexError):
+                return
+            if covered <= len(self._records()):
+                self._keys, self._recs, self._indexed = keys, recs, covered
+
+
+    @staticmethod
+    def _search_ts(records, t):
+        """Returns first record journaled at or after t, a binary search that reads only the records it visits."""
+        ts = records['ts']
+        lo, hi = 0, len(records)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ts[mid] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+    def _index_range(self, key, exact):
+        """Returns ( first, last ) positions in the index of clOrdID key, or of clOrdIDs starting with key."""
+        if exact:
+            return int(np.searchsorted(self._keys, key, 'left')), int(np.searchsorted(self._keys, key, 'right'))
+        return int(np.searchsorted(self._keys, key, 'left')), int(np.searchsorted(self._keys, key + b'\xff', 'left'))
+
+
+    def _find(self, key, exact, first, last):
+        """Returns record numbers in index positions first to last, plus matches appended since, in order."""
+        recs = self._recs[first:last].astype(np.int64)
+
+        # records appended since the index was written
+        tail = self._records()['clOrdID'][self._indexed:]
+        if len(tail):
+            match = (tail == key) if exact else _startswith(tail, key)
+            recs = np.concatenate((recs, np.flatnonzero(match) + self._indexed))
+        return np.sort(recs)
+
+
+
+def _iso(ms):
+    """Returns epoch ms as a Bitmex timestamp, ie '2019-12-20T17:42:08.436Z'."""
+    t = datetime.datetime.fromtimestamp(ms // 1000, datetime.timezone.utc)
+    return t.strftime('%Y-%m-%dT%H:%M:%S') + '.%03dZ' % (ms % 1000)
+
+
+
+def _startswith(ids, prefix):
+    """Returns mask of non empty clOrdIDs starting with prefix, compares raw bytes instead of np.char.startswith."""
+    if not prefix:
+        return ids != b''
+    if len(prefix) > ids.itemsize:
+        return np.zeros(len(ids), dtype=bool)
+    raw = np.ascontiguousarray(ids).view(np.uint8).reshape(len(ids), ids.itemsize)[:, :len(prefix)]
+    return (raw == np.frombuffer(prefix, np.uint8)).all(axis=1)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query an order journal, prints matching records as dicts.")
+    parser.add_argument('path', nargs='?', default="orders.journal")
+    parser.add_argument('--since', type=float, help="hours back")
+    parser.add_argument('--clOrdID')
+    parser.add_argument('--prefix', help="clOrdID prefix")
+    parser.add_argument('--kind', choices=list(KINDS))
+    parser.add_argument('--symbol')
+    parser.add_argument('--latest', action='store_true', help="each order's records merged into one")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        parser.error("no journal at %s" % args.path)
+
+    journal = OrderJournal(args.path)
+    since = int((time.time() - args.since * 3600) * 1000) if args.since is not None else None
+    if args.latest:
+        rows = journal.latest(prefix=args.prefix, since=since)
+    else:
+        rows = journal.to_dicts(journal.query(since=since, clOrdID=args.clOrdID, prefix=args.prefix, kind=args.kind, symbol=args.symbol))
+    for row in rows:
+        sys.stdout.write("%s\n" % row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+from collections import deque
+
+# Bitmex ordStatus values by state, orders we sent that Bitmex hasn't answered yet are 'Pending'
+PENDING = 'pending'
+OPEN = 'open'
+FILLED = 'filled'
+CLOSED = 'closed'
+
+STATES = {
+    'Pending': PENDING,
+    'PendingNew': OPEN,
+    'New': OPEN,
+    'PartiallyFilled': OPEN,
+    'PendingCancel': OPEN,
+    'PendingReplace': OPEN,
+    'Untriggered': OPEN,
+    'Triggered': OPEN,
+    'Filled': FILLED,
+    'Canceled': CLOSED,
+    'Rejected': CLOSED,
+    'Expired': CLOSED,
+    'Stopped': CLOSED,
+    'DoneForDay': CLOSED,
+}
+
+
+
+class OrderManager:
+    """
+    Our orders, indexed by clOrdID and orderID, kept in sync from the
+    Bitmex websocket order and execution tables and from REST responses.
+
+    Answers what is pending, open, filled, or closed without any REST calls.
+
+    States:
+        pending - sent, not acknowledged by Bitmex yet
+        open - New, PartiallyFilled, Untriggered, etc
+        filled - Filled
+        closed - Canceled, Rejected, Expired, etc
+
+    Attributes:
+
+    `prefix: str`
+        optional, only track orders whose clOrdID starts with prefix, ie the bot's orderIDPrefix
+
+    `maxlen: int`
+        max filled / closed orders kept, oldest are dropped first. default 1000
+
+    Methods:
+
+    `submitted`
+        track orders as they are sent
+
+    `on_response`
+        merge REST order responses
+
+    `apply`
+        apply an order or execution table message
+
+    `get`
+        get order by orderID
+
+    `get_by_clOrdID`
+        get order by clOrdID
+
+    `state`
+        get state of an order
+
+    `pending` / `open` / `filled` / `closed`
+        get orders in a state
+
+    `count`
+        get number of orders in a state
+
+    `symbols`
+        get symbols with pending or open orders
+
+    """
+    def __init__(self, prefix=None, maxlen=1000):
+        self.prefix = prefix
+        self.maxlen = maxlen
+        self._by_orderID = {}
+        self._by_clOrdID = {}
+        # state -> { id(order) -> order }, and state -> { symbol -> { id(order) -> order } }
+        self._states = {PENDING: {}, OPEN: {}, FILLED: {}, CLOSED: {}}
+        self._symbols = {PENDING: {}, OPEN: {}, FILLED: {}, CLOSED: {}}
+        self._done = deque()
+
+
+    def __len__(self):
+        return sum(len(orders) for orders in self._states.values())
+
+
+    def get(self, orderID):
+        """Returns order for orderID or None."""
+        return self._by_orderID.get(orderID)
+
+
+    def get_by_clOrdID(self, clOrdID):
+        """Returns order for clOrdID or None."""
+        return self._by_clOrdID.get(clOrdID)
+
+
+    def state(self, clOrdID=None, orderID=None):
+        """Returns 'pending', 'open', 'filled', 'closed', or None if the order is unknown."""
+        order = self._by_clOrdID.get(clOrdID) if clOrdID else self._by_orderID.get(orderID)
+        if order is None:
+            return None
+        return STATES.get(order.get('ordStatus'), OPEN)
+
+
+    def pending(self, symbol=None):
+        """Returns orders sent but not acknowledged yet, optionally only for symbol."""
+        return self._in_state(PENDING, symbol)
+
+
+    def open(self, symbol=None):
+        """Returns open orders, optionally only for symbol."""
+        return self._in_state(OPEN, symbol)
+
+
+    def filled(self, symbol=None):
+        """Returns filled orders, optionally only for symbol."""
+        return self._in_state(FILLED, symbol)
+
+
+    def closed(self, symbol=None):
+        """Returns canceled, rejected, and expired orders, optionally only for symbol."""
+        return self._in_state(CLOSED, symbol)
+
+
+    def count(self, state, symbol=None):
+        """Returns number of orders in state, ie 'open', optionally only for symbol."""
+        if symbol is None:
+            return len(self._states[state])
+        return len(self._symbols[state].get(symbol, ()))
+
+
+    def symbols(self):
+        """Returns symbols we have pending or open orders on."""
+        return [symbol for symbol in set(self._symbols[PENDING]) | set(self._symbols[OPEN]) if symbol]
+
+
+    def submitted(self, orders):
+        """
+        Tracks orders as pending as they are sent.
+
+        Parameters:
+
+        `orders: dict or array<dict>`
+            order(s) as sent to Bitmex, with clOrdID
+        """
+        if isinstance(orders, dict):
+            orders = [orders]
+        for sent in orders:
+            clOrdID = sent.get('clOrdID')
+            if not clOrdID or not self._ours(clOrdID) or clOrdID in self._by_clOrdID:
+                continue
+            order = dict(sent)
+            order['ordStatus'] = 'Pending'
+            self._by_clOrdID[clOrdID] = order
+            self._add(PENDING, order)
+
+
+    def on_response(self, response):
+        """Merges REST order response(s), ie from place_order or amend_bulk_order."""
+        if isinstance(response, dict):
+            response = [response]
+        if isinstance(response, list):
+            self._merge(response)
+
+
+    def apply(self, msg):
+        """
+        Applies a Bitmex websocket order or execution table message.
+
+        Parameters:
+
+        `msg: dict`
+            decoded websocket message with 'table', 'action' and 'data'
+        """
+        table = msg['table']
+        action = msg['action']
+
+        if table == 'order':
+            if action == 'partial':
+                # snapshot of open orders, anything we thought was open and isn't here is gone
+                live = set(row['orderID'] for row in msg['data'])
+                for order in list(self._states[OPEN].values()):
+                    if order.get('orderID') not in live:
+                        self._set(order, {'ordStatus': 'Canceled'})
+                self._merge(msg['data'])
+            elif action in ('insert', 'update'):
+                self._merge(msg['data'])
+            elif action == 'delete':
+                for row in msg['data']:
+                    order = self._by_orderID.get(row['orderID'])
+                    if order is not None and STATES.get(order.get('ordStatus')) in (PENDING, OPEN):
+                        self._set(order, {'ordStatus': 'Canceled'})
+
+        elif table == 'execution' and action in ('partial', 'insert'):
+            # executions carry the order's status after each fill, cancel, or amend
+            fields = ('orderID', 'clOrdID', 'symbol', 'side', 'ordStatus', 'cumQty', 'leavesQty', 'avgPx', 'orderQty', 'price')
+            self._merge([{f: row[f] for f in fields if row.get(f) is not None} for row in msg['data']])
+
+
+    def _ours(self, clOrdID):
+        return self.prefix is None or (clOrdID or '').startswith(self.prefix)
+
+
+    def _merge(self, rows):
+        for row in rows:
+            orderID = row.get('orderID')
+            order = self._by_orderID.get(orderID)
+            if order is None:
+                clOrdID = row.get('clOrdID')
+                order = self._by_clOrdID.get(clOrdID) if clOrdID else None
+                if order is None:
+                    if not self._ours(clOrdID) or not orderID:
+                        continue
+                    # new to us, _set moves it to its state
+                    order = {}
+                    self._add(OPEN, order)
+                if orderID:
+                    self._by_orderID[orderID] = order
+            self._set(order, row)
+
+
+    def _set(self, order, changes):
+        before = STATES.get(order.get('ordStatus'), OPEN)
+        symbol = order.get('symbol')
+        order.update(changes)
+        clOrdID = order.get('clOrdID')
+        if clOrdID:
+            self._by_clOrdID[clOrdID] = order
+        after = STATES.get(order.get('ordStatus'), OPEN)
+        if after != before or order.get('symbol') != symbol:
+            self._remove(before, order, symbol)
+            self._add(after, order)
+            if after != before and after in (FILLED, CLOSED):
+                self._done.append(order)
+                self._trim()
+
+
+    def _trim(self):
+        while len(self._done) > self.maxlen:
+            order = self._done.popleft()
+            state = STATES.get(order.get('ordStatus'), OPEN)
+            # only forget it if it's still done, a leavesQty amend can reopen a filled order
+            if state in (FILLED, CLOSED):
+                self._remove(state, order, order.get('symbol'))
+                if self._by_orderID.get(order.get('orderID')) is order:
+                    del self._by_orderID[order['orderID']]
+                if self._by_clOrdID.get(order.get('clOrdID')) is order:
+                    del self._by_clOrdID[order['clOrdID']]
+
+
+    def _add(self, state, order):
+        self._states[state][id(order)] = order
+        self._symbols[state].setdefault(order.get('symbol'), {})[id(order)] = order
+
+
+    def _remove(self, state, order, symbol):
+        self._states[state].pop(id(order), None)
+        orders = self._symbols[state].get(symbol)
+        if orders is not None:
+            orders.pop(id(order), None)
+            if not orders:
+                del self._symbols[state][symbol]
+
+
+    def _in_state(self, state, symbol):
+        if symbol is None:
+            return list(self._states[state].values())
+        return list(self._symbols[state].get(symbol, {}).values())
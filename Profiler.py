@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import signal
+import pstats
+import asyncio
+import logging
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from colors import c
+from Exceptions import InvalidArgError
+
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's python stack every `interval` secs, counts each stack seen."""
+
+    def __init__(self, thread_id, interval):
+        threading.Thread.__init__(self, name="Profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._done = threading.Event()
+        # code object -> frame name, names are only built once per function
+        self._names = {}
+
+    def run(self):
+        names = self._names
+        stacks = self.stacks
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+                stack.append(name)
+                frame = frame.f_back
+            stack.reverse()
+            stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+
+class Profiler:
+    """
+    Profiles the running bot for a while, started at launch or by a signal, without restarting it.
+
+    Profiles the event loop thread, so the websocket handlers, trader_bot, and
+    everything else on the loop is covered. Feed processes ( --multiprocess ) are not.
+
+    Parameters:
+
+    `mode: str`
+        default 'sample'
+            'sample' - low overhead, a background thread samples the loop's stack every `interval` secs.
+                writes folded stacks ( .folded ) for flamegraph.pl or speedscope, and a top functions report
+            'cprofile' - every call is timed, slower while running.
+                writes .pstats for snakeviz / flameprof / gprof2dot, and a top functions report
+
+    `memory: boolean`
+        also trace allocations with tracemalloc, writes top allocations and growth since start. default False
+        allocations get several times slower while tracing, more so with more `frames`
+
+    `secs: float`
+        secs to profile before writing output, None or 0 runs till stopped. default 60
+
+    `out_dir: str`
+        directory output is written to. default 'profiles'
+
+    `interval: float`
+        secs between samples in 'sample' mode. default 0.005
+
+    `frames: int`
+        frames of traceback kept per allocation with memory on. default 8
+
+    Methods:
+
+    `start`
+        start profiling
+
+    `stop`
+        stop and write output
+
+    `toggle`
+        start, or stop if running, ie from a signal
+
+    `install_signal`
+        toggle profiling on a signal, default SIGUSR1
+
+    """
+    MODES = ('sample', 'cprofile')
+
+    def __init__(self, mode='sample', memory=False, secs=60, out_dir='profiles', interval=0.005, frames=8):
+        if mode not in self.MODES:
+            raise InvalidArgError(mode, "mode must be sample or cprofile.")
+        if interval <= 0:
+            raise InvalidArgError(interval, "interval must be positive.")
+
+        self.mode = mode
+        self.memory = memory
+        self.secs = secs
+        self.out_dir = out_dir
+        self.interval = interval
+        self.frames = frames
+        self._profile = None
+        self._sampler = None
+        self._memory_start = None
+        self._traced = False
+        self._started = None
+        self._timer = None
+        self._stopping = None
+
+
+    @property
+    def running(self):
+        return self._started is not None
+
+
+    def start(self):
+        """Starts profiling the calling thread, call from the event loop."""
+        if self.running:
+            return
+        if self.memory:
+            # left on after stop if something else started it
+            self._traced = not tracemalloc.is_tracing()
+            if self._traced:
+                tracemalloc.start(self.frames)
+            self._memory_start = tracemalloc.take_snapshot()
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _Sampler(threading.get_ident(), self.interval)
+            self._sampler.start()
+        self._started = time.time()
+
+        if self.secs:
+            self._timer = asyncio.get_event_loop().call_later(self.secs, self.toggle)
+        print(c[3] + "\nProfiling ( %s%s ) %s" % (self.mode, ", memory" if self.memory else "",
+            "for %s secs" % self.secs if self.secs else "till stopped") + c[0])
+
+
+    async def stop(self):
+        """
+        Stops profiling and writes output, returns paths written.
+
+        async func - use await
+        """
+        if not self.running:
+            return []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        secs = time.time() - self._started
+        name = os.path.join(self.out_dir, "traderbot-%s-%d" % (time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started)), os.getpid()))
+        self._started = None
+
+        profile = sampler = memory_start = memory_end = None
+        if self._profile is not None:
+            profile, self._profile = self._profile, None
+            profile.disable()
+        if self._sampler is not None:
+            sampler, self._sampler = self._sampler, None
+            sampler.stop()
+        if self._memory_start is not None:
+            memory_start, self._memory_start = self._memory_start, None
+            memory_end = tracemalloc.take_snapshot()
+            if self._traced:
+                tracemalloc.stop()
+
+        # reports can take a few secs with lots of allocations traced, write them off the loop
+        paths = await asyncio.get_event_loop().run_in_executor(
+            None, self._write, name, secs, profile, sampler, memory_start, memory_end)
+        print(c[3] + "\nProfile written - %s" % ", ".join(paths) + c[0])
+        return paths
+
+
+    def toggle(self):
+        """Starts profiling, or stops it and writes output if running."""
+        if self.running:
+            if self._stopping is None or self._stopping.done():
+                self._stopping = asyncio.ensure_future(self.stop())
+        else:
+            self.start()
+
+
+    def install_signal(self, loop, sig=None):
+        """
+        Toggles profiling each time the process gets `sig`, ie `kill -USR1 <pid>`.
+
+        Returns False where signals can't be handled by the loop, ie Windows.
+        """
+        if sig is None:
+            sig = getattr(signal, 'SIGUSR1', None)
+        if sig is None:
+            return False
+        try:
+            loop.add_signal_handler(sig, self.toggle)
+        except (NotImplementedError, RuntimeError):
+            return False
+        return True
+
+
+    def _write(self, name, secs, profile, sampler, memory_start, memory_end):
+        os.makedirs(self.out_dir, exist_ok=True)
+        paths = []
+
+        if profile is not None:
+            profile.dump_stats(name + ".pstats")
+            paths.append(name + ".pstats")
+            with open(name + ".txt", 'w') as f:
+                f.write("cProfile - %.1f secs\n\n" % secs)
+                stats = pstats.Stats(profile, stream=f)
+                stats.sort_stats('tottime').print_stats(40)
+                stats.sort_stats('cumulative').print_stats(40)
+            paths.append(name + ".txt")
+
+        if sampler is not None:
+            with open(name + ".folded", 'w') as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write("%s %d\n" % (";".join(stack), count))
+            paths.append(name + ".folded")
+            with open(name + ".txt", 'w') as f:
+                f.write(_sample_report(sampler, secs))
+            paths.append(name + ".txt")
+
+        if memory_end is not None:
+            with open(name + "-memory.txt", 'w') as f:
+                f.write(_memory_report(memory_start, memory_end))
+            paths.append(name + "-memory.txt")
+
+        logging.info("Profile written - %s" % paths)
+        return paths
+
+
+
+def _sample_report(sampler, secs, top=40):
+    """Top functions by samples on top of the stack ( self ) and anywhere in it ( total )."""
+    own = Counter()
+    total = Counter()
+    for stack, count in sampler.stacks.items():
+        if stack:
+            own[stack[-1]] += count
+        for name in set(stack):
+            total[name] += count
+    samples = sampler.samples or 1
+    lines = ["sampled every %g secs - %d samples over %.1f secs" % (sampler.interval, sampler.samples, secs), ""]
+    for title, counts in (("self", own), ("total", total)):
+        lines.append("%8s %8s  %s" % (title, "%", "function"))
+        for name, count in counts.most_common(top):
+            lines.append("%8d %7.1f%%  %s" % (count, count / samples * 100, name))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _memory_report(start, end, top=25):
+    """Top allocations live at the end, growth since start, and tracebacks of the biggest."""
+    ignore = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>")
+    )
+    start = start.filter_traces(ignore)
+    end = end.filter_traces(ignore)
+
+    stats = end.statistics('lineno')
+    lines = ["allocated now - %.1f KiB in %d blocks" % (sum(s.size for s in stats) / 1024, sum(s.count for s in stats)), ""]
+    lines.append("top allocations by line")
+    lines.extend(str(s) for s in stats[:top])
+    lines.append("")
+    lines.append("growth since start by line")
+    lines.extend(str(s) for s in end.compare_to(start, 'lineno')[:top])
+    lines.append("")
+    lines.append("biggest allocations by traceback")
+    for s in end.statistics('traceback')[:5]:
+        lines.append("%d blocks, %.1f KiB" % (s.count, s.size / 1024))
+        lines.extend("    " + line for line in s.traceback.format())
+    lines.append("")
+    return "\n".join(lines)
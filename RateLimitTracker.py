@@ -5,6 +5,8 @@ class RateLimitTracker:
     """
     Keeps track of time and count so you can avoid hitting an API rate limit.
 
+    `check` sleeps with time.sleep, inside the event loop use RateLimiter instead.
+
     Parameters:
 
     `limit: int`
@@ -0,0 +1,138 @@
+import time
+import asyncio
+import logging
+from colors import c
+
+
+class RateLimiter:
+    """
+    Asyncio token bucket rate limiter, kept in sync with Bitmex rate limit headers.
+
+    The bucket holds `limit` tokens and refills continuously at `limit / timeframe` tokens per second.
+    Callers `await acquire()` before an API call, waiting callers are served in order.
+
+    After each response `done(headers)` corrects the bucket from the
+    `X-RateLimit-Limit` and `X-RateLimit-Remaining` headers, 
+    on a 429 `block_until` holds every caller till `X-RateLimit-Reset`.
+
+    Parameters:
+
+    `limit: int`
+        max calls to API per timeframe. default 60
+
+    `timeframe: int`
+        timeframe of limit in seconds. default 60
+
+    `reserve: int`
+        tokens kept back from what the server says is remaining, default 1
+
+    Attributes:
+
+    `limit: int`
+        max calls to API per timeframe
+
+    `timeframe: int`
+        timeframe of limit in seconds
+
+    `in_flight: int`
+        calls that acquired a token but have no response yet
+
+    Methods:
+
+    `acquire`
+        wait for and take a token
+
+    `done`
+        mark call as finished, sync from response headers
+
+    `available`
+        get tokens available now
+
+    `block_until`
+        hold all callers until a given time
+
+    """
+    def __init__(self, limit=60, timeframe=60, reserve=1):
+        self.limit = limit
+        self.timeframe = timeframe
+        self.reserve = reserve
+        self.in_flight = 0
+        self._tokens = float(limit)
+        self._rate = limit / timeframe
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        self._lock = None
+
+
+    def available(self):
+        """Returns tokens available now, can be fractional."""
+        self._refill()
+        return self._tokens
+
+
+    async def acquire(self, tokens=1):
+        """
+        Waits until `tokens` are available and takes them.
+
+        async func - use await
+        """
+        # created here so the lock is bound to the running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # asyncio.Lock wakes waiters in order, so callers queue fairly
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.in_flight += 1
+                    return
+
+                wait = (tokens - self._tokens) / self._rate
+                print(c[2] + "\nRate Limit Hit, waiting for %.2f seconds.\n" % wait + c[0])
+                await asyncio.sleep(wait)
+
+
+    def done(self, headers=None):
+        """
+        Marks a call as finished. Syncs bucket from Bitmex rate limit headers if supplied.
+
+        Parameters:
+
+        `headers: dict`
+            response headers
+        """
+        self.in_flight = max(self.in_flight - 1, 0)
+        if not headers or 'X-RateLimit-Remaining' not in headers:
+            return
+
+        if 'X-RateLimit-Limit' in headers:
+            limit = int(headers['X-RateLimit-Limit'])
+            if limit != self.limit:
+                self.limit = limit
+                self._rate = limit / self.timeframe
+
+        self._refill()
+        # server has not seen calls still in flight, don't hand their tokens out again
+        remaining = int(headers['X-RateLimit-Remaining']) - self.in_flight - self.reserve
+        self._tokens = min(max(float(remaining), 0.0), float(self.limit))
+
+
+    def block_until(self, reset):
+        """Holds all callers until `reset` ( epoch seconds ), ie from a 429 response."""
+        wait = reset - time.time()
+        if wait > 0:
+            logging.warning("Rate limit blocked for %.2f seconds." % wait)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + wait)
+
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._updated) * self._rate, float(self.limit))
+        self._updated = now
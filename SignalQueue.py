@@ -0,0 +1,199 @@
+import time
+import asyncio
+import logging
+from Exceptions import InvalidArgError
+from Metrics import metrics
+
+
+class SignalQueue:
+    """
+    Bounded queue between a websocket feed and a pool of strategy workers.
+
+    The feed `put`s data and goes straight back to reading frames,
+    workers take data off the queue and await `handler(data)`.
+
+    Parameters:
+
+    `handler: async func`
+        called by a worker with each item, ie trader_bot
+
+    `maxsize: int`
+        max items waiting in queue. default 100
+
+    `workers: int`
+        number of workers. default 2
+
+    `policy: str`
+        what to do when the queue is full. default 'block'
+            'block' - put waits for space ( backpressure on the feed )
+            'drop_oldest' - oldest waiting item is dropped for the new one
+            'drop_newest' - new item is dropped
+
+    `report_every: float`
+        optional, log stats every N seconds
+
+    Methods:
+
+    `start`
+        start workers
+
+    `stop`
+        cancel workers
+
+    `put`
+        add item to queue
+
+    `join`
+        wait till every queued item is handled
+
+    `stats`
+        get queue depth, drops, and wait times
+
+    """
+    POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, handler, maxsize=100, workers=2, policy='block', report_every=None):
+        if policy not in self.POLICIES:
+            raise InvalidArgError(policy, "policy must be block, drop_oldest, or drop_newest.")
+        if workers < 1:
+            raise InvalidArgError(workers, "Must have at least 1 worker.")
+
+        self.handler = handler
+        self.maxsize = maxsize
+        self.workers = workers
+        self.policy = policy
+        self.report_every = report_every
+        self._queue = None
+        self._tasks = []
+        # stats
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._last_wait = 0.0
+        # stage latencies, served by Metrics
+        self._wait_latency = metrics.histogram('traderbot_signal_wait_seconds', "time a signal waits in the queue for a worker")
+        self._signal_latency = metrics.histogram('traderbot_frame_to_trader_bot_seconds', "frame received to trader_bot called")
+        self._handler_latency = metrics.histogram('traderbot_trader_bot_seconds', "time in trader_bot per signal")
+
+
+    def start(self):
+        """Starts worker tasks on the running event loop."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        for i in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._worker(i)))
+        if self.report_every:
+            self._tasks.append(asyncio.ensure_future(self._reporter()))
+
+
+    async def stop(self):
+        """Cancels workers, items still waiting are not handled.
+
+        async func - use await"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+    async def put(self, data, received=None):
+        """
+        Adds item to the queue according to the queue policy.
+
+        async func - use await
+
+        Parameters:
+
+        `data: any`
+            item for handler
+
+        `received: int`
+            optional, time.perf_counter_ns() the frame data came from was received. default now
+
+        Returns:
+
+        `queued: boolean`
+            False if the item was dropped
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+        queue = self._queue
+        queued_at = time.perf_counter_ns()
+        item = (queued_at, received if received is not None else queued_at, data)
+
+        if queue.full():
+            if self.policy == 'drop_newest':
+                self.dropped += 1
+                logging.warning("Signal queue full, dropped newest signal.")
+                return False
+            elif self.policy == 'drop_oldest':
+                queue.get_nowait()
+                queue.task_done()
+                self.dropped += 1
+                logging.warning("Signal queue full, dropped oldest signal.")
+
+        await queue.put(item)
+        depth = queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+
+    async def join(self):
+        """Waits till every queued item has been handled.
+
+        async func - use await"""
+        if self._queue is not None:
+            await self._queue.join()
+
+
+    def depth(self):
+        """Returns number of items waiting."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+
+    def stats(self):
+        """Returns dict of depth, max_depth, processed, dropped, errors, and wait times in ms."""
+        return {
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'avg_wait_ms': self._wait_total / self.processed * 1000 if self.processed else 0.0,
+            'max_wait_ms': self._wait_max * 1000,
+            'last_wait_ms': self._last_wait * 1000
+        }
+
+
+    async def _worker(self, n):
+        queue = self._queue
+        while True:
+            queued_at, received, data = await queue.get()
+            start = time.perf_counter_ns()
+            self._wait_latency.record(start - queued_at)
+            self._signal_latency.record(start - received)
+            wait = (start - queued_at) / 1e9
+            self._last_wait = wait
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+            try:
+                await self.handler(data)
+            except Exception:
+                # one bad signal shouldn't take the worker down
+                self.errors += 1
+                logging.exception("Signal worker %d failed handling %s" % (n, data))
+            finally:
+                self._handler_latency.since(start)
+                self.processed += 1
+                queue.task_done()
+
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            logging.info("Signal queue stats - %s" % self.stats())
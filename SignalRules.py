@@ -0,0 +1,147 @@
+from bisect import bisect_right
+from Exceptions import InvalidArgError
+
+# exchanges Token Analyst reports flows for, bit i of a flow's exchange mask is EXCHANGES[i]
+EXCHANGES = ['Binance', 'Bitmex', 'Bitfinex', 'Bittrex', 'Kraken', 'Poloniex', 'Huobi']
+EXCHANGE_BITS = {name: 1 << i for i, name in enumerate(EXCHANGES)}
+
+
+
+class SignalRules:
+    """
+    Many Token Analyst flow rules checked against each flow in one pass.
+
+    A rule is the same check as TokenAnalyst.check_for_inflow / check_for_outflow -
+    flowType, exchanges the flow is to, and value >= threshold ( and optionally <= max_value ).
+
+    Rules are compiled into groups by flowType and exchange bitmask, each sorted by threshold.
+    A flow's `to` exchanges are turned into a bitmask once, then each group that shares a bit
+    fires the rules up to the flow's value with one bisect.
+
+    Methods:
+
+    `add`
+        register a rule
+
+    `remove`
+        remove a rule
+
+    `match`
+        get names of rules a flow fires
+
+    `rules`
+        get registered rule names
+
+    """
+    def __init__(self):
+        # name -> ( order, flowType, exchange mask or None for All, threshold, max_value )
+        self._rules = {}
+        self._order = 0
+        # flowType -> [ ( mask or None, thresholds, [ ( order, name, max_value ) ] ) ], built by _compile
+        self._index = None
+
+
+    def add(self, name, flowType='Outflow', threshold=None, exchange='Bitmex', max_value=None):
+        """
+        Registers a rule, replaces any rule with the same name.
+
+        Parameters:
+
+        `name: str`
+            returned by match when the rule fires
+
+        `flowType: str`
+            Inflow or Outflow
+
+        `threshold: float`
+            only flows with value >= threshold
+
+        `exchange: str or array<str>`
+            only flows to any of these exchanges, 'All' for any. default Bitmex
+            (Valid exchange values are All, Binance, Bitmex, Bitfinex, Bittrex, Kraken, Poloniex, and Huobi)
+
+        `max_value: float`
+            only flows with value <= max_value
+        """
+        if flowType not in ('Inflow', 'Outflow'):
+            raise InvalidArgError(flowType, "flowType must be Inflow or Outflow.")
+
+        if exchange == 'All':
+            mask = None
+        else:
+            mask = 0
+            for ex in [exchange] if isinstance(exchange, str) else exchange:
+                if ex not in EXCHANGE_BITS:
+                    raise InvalidArgError(ex, "Unknown exchange, valid exchanges are All, %s." % ", ".join(EXCHANGE_BITS))
+                mask |= EXCHANGE_BITS[ex]
+
+        self._rules.pop(name, None)
+        self._rules[name] = (self._order, flowType, mask, threshold or float('-inf'), max_value)
+        self._order += 1
+        self._index = None
+
+
+    def remove(self, name):
+        """Removes rule by name."""
+        if self._rules.pop(name, None) is not None:
+            self._index = None
+
+
+    def rules(self):
+        """Returns registered rule names, in the order they were added."""
+        return list(self._rules)
+
+
+    def match(self, data):
+        """
+        Checks Token Analyst data against every rule.
+
+        Parameters:
+
+        `data: Token Analyst data`
+            data from Token Analyst websocket
+
+        Returns:
+
+        `names: array<str>`
+            names of rules that fired, in the order they were added. empty if none
+        """
+        if self._index is None:
+            self._compile()
+
+        groups = self._index.get(data['flowType'])
+        if not groups:
+            return []
+
+        value = data['value']
+        to = 0
+        for ex in data['to']:
+            to |= EXCHANGE_BITS.get(ex, 0)
+
+        fired = []
+        for mask, thresholds, rules in groups:
+            if mask is not None and not mask & to:
+                continue
+            for i in range(bisect_right(thresholds, value)):
+                order, name, max_value = rules[i]
+                if max_value is None or value <= max_value:
+                    fired.append((order, name))
+
+        if len(fired) > 1:
+            fired.sort()
+        return [name for order, name in fired]
+
+
+    def _compile(self):
+        groups = {}
+        for name, (order, flowType, mask, threshold, max_value) in self._rules.items():
+            groups.setdefault((flowType, mask), []).append((threshold, order, name, max_value))
+
+        self._index = {}
+        for (flowType, mask), rules in groups.items():
+            rules.sort()
+            self._index.setdefault(flowType, []).append((
+                mask,
+                [threshold for threshold, order, name, max_value in rules],
+                [(order, name, max_value) for threshold, order, name, max_value in rules]
+            ))
@@ -0,0 +1,248 @@
+import logging
+from collections import deque
+
+
+class Table:
+    """
+    One Bitmex websocket table, ie position, order, or trade.
+
+    Rows are keyed by the `keys` sent in the table's `partial` message
+    and updated in place, so looking up a row by key is O(1).
+
+    Tables without keys (ie trade) are append only and keep the last `maxlen` rows.
+
+    Attributes:
+
+    `name: str`
+        table name
+
+    `keys: array<str>`
+        fields that make up a row's key, from the partial message
+
+    `types: dict`
+        field types, from the partial message
+
+    `maxlen: int`
+        max rows kept, oldest rows are dropped first. default 1000
+
+    Methods:
+
+    `get`
+        get row by key
+
+    `get_by`
+        get rows by an indexed field
+
+    `add_index`
+        index rows by a field
+
+    `values`
+        get all rows
+
+    `last`
+        get last inserted or updated row
+
+    """
+    def __init__(self, name, maxlen=1000):
+        self.name = name
+        self.keys = None
+        self.types = {}
+        self.maxlen = maxlen
+        self._rows = {}
+        self._log = deque(maxlen=maxlen)
+        self._last = None
+        # secondary indexes, field -> { value -> { key -> row } }
+        self._indexes = {}
+
+
+    def __len__(self):
+        return len(self._rows) if self.keys else len(self._log)
+
+
+    def is_ready(self):
+        """Returns True once the partial message has been received."""
+        return self.keys is not None
+
+
+    def get(self, *key):
+        """Returns row for given key values ( in order of `keys` ) or None."""
+        return self._rows.get(key)
+
+
+    def get_by(self, field, value):
+        """Returns list of rows where indexed `field` equals `value`."""
+        return list(self._indexes[field].get(value, {}).values())
+
+
+    def add_index(self, field):
+        """Index rows by `field` so they can be looked up with `get_by`."""
+        index = self._indexes.setdefault(field, {})
+        for key, row in self._rows.items():
+            index.setdefault(row.get(field), {})[key] = row
+
+
+    def values(self):
+        """Returns list of all rows."""
+        return list(self._rows.values()) if self.keys else list(self._log)
+
+
+    def last(self):
+        """Returns last inserted or updated row or None."""
+        return self._last
+
+
+    def partial(self, data, keys, types=None):
+        """Resets table to the given snapshot."""
+        self.keys = list(keys)
+        self.types = types or {}
+        self._rows.clear()
+        self._log.clear()
+        self._last = None
+        for index in self._indexes.values():
+            index.clear()
+        self.insert(data)
+
+
+    def insert(self, data):
+        """Inserts new rows."""
+        if not self.keys:
+            self._log.extend(data)
+            if data:
+                self._last = data[-1]
+            return
+
+        for row in data:
+            key = self._key(row)
+            if key in self._rows:
+                self._unindex(key, self._rows[key])
+            self._rows[key] = row
+            self._index(key, row)
+            self._last = row
+
+        # drop oldest rows
+        while len(self._rows) > self.maxlen:
+            key = next(iter(self._rows))
+            self._unindex(key, self._rows.pop(key))
+
+
+    def update(self, data):
+        """Updates existing rows in place with the changed fields."""
+        for change in data:
+            key = self._key(change)
+            row = self._rows.get(key)
+            if row is None:
+                logging.debug("Bitmex %s update for unknown row %s" % (self.name, key))
+                continue
+            self._unindex(key, row)
+            row.update(change)
+            self._index(key, row)
+            self._last = row
+
+
+    def delete(self, data):
+        """Deletes rows."""
+        for change in data:
+            key = self._key(change)
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._unindex(key, row)
+
+
+    def _key(self, row):
+        return tuple(row[k] for k in self.keys)
+
+
+    def _index(self, key, row):
+        for field, index in self._indexes.items():
+            index.setdefault(row.get(field), {})[key] = row
+
+
+    def _unindex(self, key, row):
+        for field, index in self._indexes.items():
+            rows = index.get(row.get(field))
+            if rows is not None:
+                rows.pop(key, None)
+                if not rows:
+                    del index[row.get(field)]
+
+
+
+class TableStore:
+    """
+    Keeps Bitmex websocket tables up to date from partial, insert, update, and delete messages.
+
+    Parameters:
+
+    `maxlen: int`
+        max rows kept per table. default 1000
+
+    `indexes: dict`
+        secondary indexes to keep per table, ie {'position': ['symbol']}
+
+    Methods:
+
+    `apply`
+        apply a table message
+
+    `table`
+        get a table by name
+
+    """
+    def __init__(self, maxlen=1000, indexes=None):
+        self.maxlen = maxlen
+        self._indexes = indexes or {}
+        self._tables = {}
+
+
+    def __getitem__(self, name):
+        return self.table(name)
+
+
+    def __contains__(self, name):
+        return name in self._tables
+
+
+    def table(self, name):
+        """Returns table by name, an empty table if no data has been received for it yet."""
+        table = self._tables.get(name)
+        if table is None:
+            table = Table(name, maxlen=self.maxlen)
+            for field in self._indexes.get(name, []):
+                table.add_index(field)
+            self._tables[name] = table
+        return table
+
+
+    def apply(self, msg):
+        """
+        Applies a Bitmex websocket table message.
+
+        Parameters:
+
+        `msg: dict`
+            decoded websocket message with 'table', 'action', and 'data'
+
+        Returns:
+
+        `table: Table`
+            the table the message was applied to
+        """
+        table = self.table(msg['table'])
+        action = msg['action']
+        data = msg['data']
+
+        if action == 'partial':
+            table.partial(data, msg.get('keys') or [], msg.get('types'))
+        elif not table.is_ready():
+            # bitmex always sends the partial first, anything before it is stale
+            logging.debug("Bitmex %s %s before partial, skipping" % (table.name, action))
+        elif action == 'insert':
+            table.insert(data)
+        elif action == 'update':
+            table.update(data)
+        elif action == 'delete':
+            table.delete(data)
+        else:
+            logging.warning("Unknown Bitmex table action %s" % action)
+
+        return table
@@ -1,9 +1,15 @@
 import websockets
 import os
-import json
+import time
 import asyncio
-import sys
+import logging
+import fast_json
+from Capture import TOKEN_ANALYST as CAPTURE_FEED
+from FlowStats import FlowStats, WINDOWS
 from Exceptions import WebSocketError
+from Metrics import metrics
+from Backoff import Backoff
+from Watchdog import Watchdog
 from colors import c
 
 
@@ -16,6 +22,28 @@ class TokenAnalyst:
     `key: str`
         Token Analyst API key
 
+    `recorder: FrameRecorder`
+        optional, if supplied every raw websocket frame is recorded to it
+
+    `windows: array<int>`
+        optional, secs of each rolling window for flow stats. default 10 min, 1 hour, and 24 hours
+
+    `flows: FlowStats`
+        rolling inflow / outflow / net flow stats per exchange, updated with each flow
+
+    `received_at: int`
+        time.perf_counter_ns() the last frame was received, for frame to trader_bot latency
+
+    `reconnect: Backoff`
+        optional, delays between websocket reconnect attempts. default Backoff()
+
+    `ws_url: str`
+        optional, Token Analyst websocket url. default wss://ws.tokenanalyst.io
+
+    `watchdog: Watchdog`
+        optional, watches heartbeats and drops the websocket when it goes quiet.
+        default Watchdog('token_analyst', stale_after=90, ping_interval=15, ping='protocol')
+
     Methods:
 
     `connect`
@@ -53,11 +81,43 @@ class TokenAnalyst:
 
     `get_timestamp`
         get timestamp from websocket data
+
+    `get_flow_stats`
+        get rolling inflow / outflow / net flow stats for an exchange
+
+    `is_stale`
+        check if the websocket is down or has gone quiet
     
     """
-    def __init__(self, key):
+    def __init__(self, key, recorder=None, windows=WINDOWS, reconnect=None, ws_url="wss://ws.tokenanalyst.io", watchdog=None):
         self._key = key
         self._ws = None
+        self.recorder = recorder
+        self.flows = FlowStats(windows)
+        self.reconnect = reconnect or Backoff()
+        self.ws_url = ws_url
+        # heartbeats are frames, so a quiet channel isn't silent
+        self.watchdog = watchdog or Watchdog('token_analyst', stale_after=90, ping_interval=15, ping='protocol')
+        # frame event -> ( handler, True if the frame's id must be our stream id ), handlers get the frame's data
+        self._routes = {
+            'data': (self._on_data, True),
+            'heartbeat': (self._on_heartbeat, False),
+            'subscribed': (self._on_subscribed, True),
+            'error': (self._on_error, False)
+        }
+        self.received_at = None
+        # stage latencies and counts, served by Metrics
+        self._frames = metrics.counter('traderbot_feed_messages_total', "websocket messages received", feed='token_analyst')
+        self._frame_latency = metrics.histogram('traderbot_frame_seconds', "time to decode and handle a websocket frame", feed='token_analyst')
+        self._reconnects = metrics.counter('traderbot_feed_reconnects_total', "websocket reconnects", feed='token_analyst')
+        self._gaps = metrics.counter('traderbot_feed_gaps_total', "gaps in data found after a reconnect", feed='token_analyst')
+        self._outage = metrics.histogram('traderbot_feed_outage_seconds', "disconnect to state rebuilt on a new connection", feed='token_analyst')
+        metrics.per_second(self._frames, 'traderbot_feed_messages_per_second', "websocket messages per second", feed='token_analyst')
+        # time.perf_counter_ns() the websocket dropped, till we are subscribed again
+        self._down_since = None
+        # last flow before a disconnect, the first flow after is checked for missed blocks
+        self._last_data = None
+        self._gap_from = None
 
 
     def get_transactionId(self, data):
@@ -108,6 +168,31 @@ class TokenAnalyst:
         return flowType
 
 
+    def get_flow_stats(self, exchange='Bitmex', window=600):
+        """
+        Returns rolling flow stats for exchange over the last window secs of flows.
+
+        Parameters:
+
+        `exchange: str`
+            exchange name, or 'All' for every flow. default Bitmex
+
+        `window: int`
+            window in secs, one of windows. default 600
+
+        Returns:
+
+        `stats: dict`
+            { 'inflow', 'outflow', 'net' }, each { 'sum', 'count', 'mean', 'var' }
+        """
+        return self.flows.get(exchange=exchange, window=window)
+
+
+    def is_stale(self):
+        """Returns True while the websocket is down, resubscribing, or has gone quiet."""
+        return self.watchdog.stale
+
+
     def check_for_inflow(self, data, threshold=None, exchange='Bitmex'):
         """
         Checks Token Analyst data for Inflow.
@@ -185,7 +270,7 @@ class TokenAnalyst:
             see Token Analyst API docs for details 
 
         """
-        uri = "wss://ws.tokenanalyst.io"
+        uri = self.ws_url
         id = "token_analyst_stream"
         payload = {
             "event":"subscribe",
@@ -196,18 +281,27 @@ class TokenAnalyst:
 
         while True:
             try:
-                # connect to websocket with no ping timeout - longer connection
+                # connect to websocket with no ping timeout - longer connection, the watchdog watches for it going quiet
                 async with websockets.connect(uri, ping_timeout=None) as websocket:
                     self._ws = websocket
-                    await websocket.send(json.dumps(payload))
-                    async for msg in websocket: 
-                        # check msg for data, returns None or on-chain data
-                        data = await self._interpret(json.loads(msg), id)
-                        yield data 
-            except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed):
-                print(c[2] + "\n\nToken Analyst websocket connection error, trying to reconnect in 5 secs\n\n" + c[0])
-                await asyncio.sleep(5)
-                continue
+                    watchdog = self.watchdog
+                    watch = asyncio.ensure_future(watchdog.watch(websocket))
+                    try:
+                        await websocket.send(fast_json.dumps(payload))
+                        async for msg in websocket: 
+                            self.received_at = watchdog.last_frame = time.perf_counter_ns()
+                            if self.recorder:
+                                self.recorder.write(CAPTURE_FEED, msg)
+                            # check msg for data, returns None or on-chain data
+                            data = self._handle_frame(msg, id)
+                            yield data 
+                    finally:
+                        watch.cancel()
+                error = "closed by server"
+            except (asyncio.TimeoutError, websockets.exceptions.WebSocketException, OSError) as e:
+                error = e
+
+            await asyncio.sleep(self._disconnected(error))
 
 
     async def close(self):
@@ -219,47 +313,96 @@ class TokenAnalyst:
         print(c[3] + '\nTokenAnalyst connection closed' + c[0])
 
 
-    async def _interpret(self, response, id):
-        """check for heartbeat, connection success / errors, and Data."""
+    def _handle_frame(self, msg, id="token_analyst_stream"):
+        """Decodes a raw websocket frame, returns None or on-chain data. Used by the live websocket and by Capture.replay."""
 
-        if(response['id'] == id and response['event'] == "data"):
-            return await self._on_data(response['data'])
-        if(response['id'] == None and response['event'] == "heartbeat"):
-            return await self._on_heartbeat(response['data'])
-        if(response['id'] == id and response['event'] == "subscribed" and response['data']['success'] == True):
-            return await self._on_subscribed(response['data'])
-        if(response['event'] == 'error' and response['data']['success'] == False):
-            return await self._on_error(response['data'])
-        return None
+        start = time.perf_counter_ns()
+        data = self._interpret(fast_json.loads(msg), id)
+        self._frames.inc()
+        self._frame_latency.since(start)
+        return data
+
+
+    def _interpret(self, response, id):
+        """Sends heartbeat, connection success / errors, and Data to their handler in _routes."""
+
+        route = self._routes.get(response['event'])
+        if route is None:
+            return None
+        handler, match_id = route
+        if match_id and response['id'] != id:
+            return None
+        return handler(response['data'])
             
 
-    async def _on_data(self, data): 
-        """Returns on-chain data."""
+    def _on_data(self, data): 
+        """Updates flow stats, returns on-chain data."""
 
+        if self._gap_from is not None:
+            self._check_block_gap(data)
+        self.flows.update(data)
+        self._last_data = data
         return data
 
 
-    async def _on_heartbeat(self, heartbeat):
-        """Prints that we got a heartbeat from Token Analyst along with servertime."""
+    def _on_heartbeat(self, heartbeat):
+        """Notes the heartbeat for the watchdog, prints that we got it along with servertime."""
 
+        self.watchdog.heartbeat()
         print(c[1] + "\nToken Analyst heartbeat - server time: " + str(heartbeat['serverTime']) + c[0]) 
         return None
 
 
-    async def _on_subscribed(self, details):
+    def _on_subscribed(self, details):
         """Prints that we have successfully subscribed to a given channel."""
 
-        print(c[1] + "\nToken Analyst connection successful. " + str(details['message']) + c[0])
+        if details['success'] == True:
+            print(c[1] + "\nToken Analyst connection successful. " + str(details['message']) + c[0])
+            self._resynced()
         return None
 
 
-    async def _on_error(self, error):
-        """Raises error, prints that websocket has had an error, and aborts."""
-
-        raise WebSocketError(error, error['message'])
-        print(c[2] + "\nTokenAnalyst error - " + error['message'] + c[0])
-        await self.close()
-        sys.exit(1)
+    def _disconnected(self, error):
+        """Counts a dropped websocket, returns secs to wait before reconnecting."""
+        self.watchdog.stale = True
+        self._reconnects.inc()
+        if self._down_since is None:
+            self._down_since = time.perf_counter_ns()
+            if self._last_data is not None:
+                self._gap_from = self._last_data.get('blockNumber')
+        delay = self.reconnect.next()
+        logging.warning("Token Analyst websocket disconnected ( %s ), reconnect attempt %d in %.2f secs" % (error, self.reconnect.attempts, delay))
+        print(c[2] + "\n\nToken Analyst websocket disconnected ( %s ), reconnecting in %.2f secs\n\n" % (error, delay) + c[0])
+        return delay
+
+
+    def _resynced(self):
+        """Subscribed again, next reconnect is immediate."""
+        self.reconnect.reset()
+        self.watchdog.stale = False
+        if self._down_since is not None:
+            secs = (time.perf_counter_ns() - self._down_since) / 1e9
+            self._outage.since(self._down_since)
+            self._down_since = None
+            logging.warning("Token Analyst websocket back after %.3f secs" % secs)
+
+
+    def _check_block_gap(self, data):
+        """First flow after a reconnect, reports blocks skipped since the last flow before it."""
+        last, self._gap_from = self._gap_from, None
+        block = data.get('blockNumber')
+        if block is not None and block > last + 1:
+            self._gaps.inc()
+            logging.warning("Token Analyst gap - flows of blocks %d to %d missed while disconnected" % (last + 1, block - 1))
+
+
+    def _on_error(self, error):
+        """Raises error, websocket has had an error."""
+
+        if error['success'] == False:
+            print(c[2] + "\nTokenAnalyst error - " + error['message'] + c[0])
+            raise WebSocketError(error, error['message'])
+        return None
 
 
     def _inflow_outflow_check(self, data, check_flowtype, threshold, exchange):
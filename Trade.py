@@ -1,8 +1,21 @@
 from colors import c
 import base64
 import uuid
+import time
 from config import G_DEFAULT_BITMEX_SYMBOL # if you dont have this declared in config go do that
 from Exceptions import InvalidArgError
+from Metrics import metrics
+
+_build_latency = metrics.histogram('traderbot_order_build_seconds', "time to check and build an order")
+
+# price increments per symbol, see Bitmex instrument tickSize
+TICK_SIZES = {
+    'XBTUSD': 0.5,
+    'ETHUSD': 0.05,
+    'XRPUSD': 0.0001,
+    'LTCUSD': 0.01,
+    'BCHUSD': 0.05,
+}
 
 class Trade:
     '''
@@ -42,7 +55,7 @@ class Trade:
         self.orderIDPrefex = orderIDPrefex
        
 
-    def market_buy(self,quantity):
+    def market_buy(self,quantity, symbol=None):
         '''
         returns an order to Buy at market price. 
 
@@ -51,6 +64,9 @@ class Trade:
         `quantity: int`
             number of contracts
 
+        `symbol: str`
+            optional, symbol to trade, default is this Trade's symbol
+
         Returns:
 
         `order: dict`
@@ -60,11 +76,12 @@ class Trade:
         order = self.make_order(
             quantity=quantity, 
             side=side, 
+            symbol=symbol
         )
         return order
 
 
-    def market_sell(self,quantity):
+    def market_sell(self,quantity, symbol=None):
         '''
         Make a order for Selling at market price.
 
@@ -73,6 +90,9 @@ class Trade:
         `quantity: int`
             number of contracts
 
+        `symbol: str`
+            optional, symbol to trade, default is this Trade's symbol
+
         Returns:
 
         `order: dict`
@@ -82,11 +102,12 @@ class Trade:
         order = self.make_order(
             quantity=quantity, 
             side=side, 
+            symbol=symbol
         )
         return order
 
 
-    def limit_buy(self,quantity, price):
+    def limit_buy(self,quantity, price, symbol=None):
         '''Make a limit buy order.
         
         Parameters:
@@ -97,24 +118,28 @@ class Trade:
         `price: float`
             price, must be val;id tickSize, ie must be integer or .5 between int 
 
+        `symbol: str`
+            optional, symbol to trade, default is this Trade's symbol
+
         Returns:
 
         `order: dict`
             limit buy order
         
         '''
-        self.is_tickSize_valid(price)
+        self.is_tickSize_valid(price, symbol)
 
         side = "Buy"
         order = self.make_order(
             quantity=quantity, 
             price=price,
             side=side, 
+            symbol=symbol
         )
         return order
         
 
-    def limit_sell(self,quantity, price):
+    def limit_sell(self,quantity, price, symbol=None):
         """Make a limit sell / short order.
         
         Parameters:
@@ -125,6 +150,9 @@ class Trade:
         `price: float`
             price, must be val;id tickSize, ie must be integer or .5 between int
 
+        `symbol: str`
+            optional, symbol to trade, default is this Trade's symbol
+
         Returns:
 
         `order: dict`
@@ -132,18 +160,19 @@ class Trade:
         
         """
 
-        self.is_tickSize_valid(price)
+        self.is_tickSize_valid(price, symbol)
 
         side="Sell"
         order = self.make_order(
             quantity=quantity, 
             price=price,
             side=side, 
+            symbol=symbol
         )
         return order
 
 
-    def stop_order(self,quantity, stopPx, price=None, execInst=None):
+    def stop_order(self,quantity, stopPx, price=None, execInst=None, symbol=None):
         '''
         Creates a stop order.
 
@@ -164,19 +193,23 @@ class Trade:
 
         `execInst:str`
 
+        `symbol: str`
+            optional, symbol to trade, default is this Trade's symbol
+
         Returns:
         
         `order: dict`
             stop order 
         '''
         if price:
-            self.is_tickSize_valid(price)
+            self.is_tickSize_valid(price, symbol)
 
         order = self.make_order(
             quantity=quantity, 
             stopPx=stopPx,
             price=price,
-            execInst=execInst
+            execInst=execInst,
+            symbol=symbol
         )
         return order
 
@@ -295,12 +328,13 @@ class Trade:
                 an order ready to be sent in a bulk or single order.
         """
         # Read Me - This creates all the orders below, so dont break it
+        start = time.perf_counter_ns()
 
         if price and price < 0:
             raise InvalidArgError(price,"Order Price must be positive.")
 
         if price:
-            self.is_tickSize_valid(price)
+            self.is_tickSize_valid(price, symbol)
 
         if not quantity and execInst != 'Close':
             raise InvalidArgError([quantity, execInst],"Must supply order quantity.")
@@ -377,13 +411,17 @@ class Trade:
         if execInst:        order['execInst'] = execInst
         if orderType:       order['ordType'] = orderType
 
+        _build_latency.since(start)
         return order
 
 
-    def is_tickSize_valid(self,price):
-        """Check for valid tickSize, ie if the price is an integer or .5 away."""
+    def is_tickSize_valid(self,price, symbol=None):
+        """Check for valid tickSize for symbol, ie for XBTUSD if the price is an integer or .5 away."""
+        if symbol == None:
+            symbol = self.symbol
+        tickSize = TICK_SIZES.get(symbol, 0.5)
 
-        if not isinstance(price, int):
-            if not isinstance(price + 0.5, int):
-                raise InvalidArgError(price,"Invalid Tick Size! Prices must be set at integer or .5 between")
+        ticks = price / tickSize
+        if abs(ticks - round(ticks)) > 1e-9:
+            raise InvalidArgError(price,"Invalid Tick Size! %s prices must be a multiple of %s" % (symbol, tickSize))
         
@@ -0,0 +1,276 @@
+import numpy as np
+
+
+class TradeTape:
+    """
+    Fixed capacity ring buffer of trades stored as NumPy columns.
+
+    Each trade takes 25 bytes ( timestamp, price, size, side ) instead of a full trade dict.
+    Once full, the oldest trades are overwritten.
+
+    Windowed queries are vectorized. Windows are in seconds back from the latest trade,
+    or between `since` and `until` ( epoch ms ) when given.
+
+    Attributes:
+
+    `capacity: int`
+        max number of trades kept. default 100000
+
+    Methods:
+
+    `append`
+        append Bitmex trade rows
+
+    `append_columns`
+        append trades as arrays
+
+    `last_price`
+        get price of last trade
+
+    `last_timestamp`
+        get timestamp of last trade
+
+    `last`
+        get last trade
+
+    `vwap`
+        get volume weighted average price over a window
+
+    `volume`
+        get volume over a window, optionally only Buy or Sell
+
+    `count`
+        get number of trades over a window
+
+    `stats`
+        get vwap, volume, buy / sell volume, count, high and low over a window
+
+    `columns`
+        get copies of the columns over a window
+
+    """
+    BUY = 1
+    SELL = -1
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._ts = np.zeros(capacity, dtype=np.int64)       # epoch ms
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._size = np.zeros(capacity, dtype=np.int64)
+        self._side = np.zeros(capacity, dtype=np.int8)      # 1 Buy, -1 Sell
+        self._head = 0      # next write position
+        self._count = 0     # trades stored
+        # trdMatchIDs of the trades at the last timestamp, a replayed partial repeats some of them
+        self._last_ids = set()
+
+
+    def __len__(self):
+        return self._count
+
+
+    @property
+    def nbytes(self):
+        """Memory used by the columns in bytes."""
+        return self._ts.nbytes + self._price.nbytes + self._size.nbytes + self._side.nbytes
+
+
+    def append(self, trades):
+        """
+        Appends Bitmex trade table rows.
+
+        Rows older than the last stored trade are skipped, and so are rows at its timestamp
+        with a trdMatchID already stored, so a repeated partial is not double counted.
+
+        Parameters:
+
+        `trades: array<dict>`
+            rows from the Bitmex trade table
+        """
+        if not trades:
+            return
+        self.append_columns(
+            parse_timestamps([t['timestamp'] for t in trades]),
+            [t['price'] for t in trades],
+            [t['size'] for t in trades],
+            [self.BUY if t['side'] == 'Buy' else self.SELL for t in trades],
+            ids=[t.get('trdMatchID') for t in trades]
+        )
+
+
+    def append_columns(self, ts, price, size, side, ids=None):
+        """
+        Appends trades as arrays of epoch ms timestamps, prices, sizes and sides ( 1 Buy, -1 Sell ), oldest first.
+
+        Trades older than the last stored trade are skipped. At its timestamp, trades with `ids`
+        ( trdMatchID ) already stored are skipped too, without `ids` they are all kept.
+        """
+        ts = np.asarray(ts)
+        n = len(ts)
+        if not n:
+            return
+        last = self._ts[self._head - 1] if self._count else None
+
+        # trades come oldest first, so only a batch starting at or before the last trade needs filtering
+        if last is not None and ts[0] <= last:
+            keep = ts > last
+            same = np.flatnonzero(ts == last)
+            if ids is None:
+                keep[same] = True
+            else:
+                keep[same] = [ids[i] not in self._last_ids for i in same]
+            if not keep.all():
+                ts, price, size, side = ts[keep], np.asarray(price)[keep], np.asarray(size)[keep], np.asarray(side)[keep]
+                if ids is not None:
+                    ids = [ids[i] for i in np.flatnonzero(keep)]
+                n = len(ts)
+                if not n:
+                    return
+
+        if n > self.capacity:
+            ts, price, size, side = ts[-self.capacity:], price[-self.capacity:], size[-self.capacity:], side[-self.capacity:]
+            if ids is not None:
+                ids = ids[-self.capacity:]
+            n = self.capacity
+
+        start = self._head
+        first = min(n, self.capacity - start)
+        for col, values in ((self._ts, ts), (self._price, price), (self._size, size), (self._side, side)):
+            values = np.asarray(values)
+            col[start:start + first] = values[:first]
+            col[:n - first] = values[first:]
+
+        self._head = (start + n) % self.capacity
+        self._count = min(self._count + n, self.capacity)
+
+        # remember the ids at the new last timestamp
+        newest = ts[-1]
+        at_newest = ()
+        if ids is not None:
+            i = n - 1
+            while i > 0 and ts[i - 1] == newest:
+                i -= 1
+            # a row with no id can't be told apart from the next, so it isn't remembered
+            at_newest = [id for id in ids[i:] if id]
+        if newest == last:
+            self._last_ids.update(at_newest)
+        else:
+            self._last_ids = set(at_newest)
+
+
+    def last_price(self):
+        """Returns price of last trade or None."""
+        if self._count:
+            return float(self._price[self._head - 1])
+        return None
+
+
+    def last_timestamp(self):
+        """Returns epoch ms timestamp of last trade or None."""
+        if self._count:
+            return int(self._ts[self._head - 1])
+        return None
+
+
+    def last(self):
+        """Returns last trade as dict or None."""
+        if not self._count:
+            return None
+        i = self._head - 1
+        return {
+            'timestamp': int(self._ts[i]),
+            'price': float(self._price[i]),
+            'size': int(self._size[i]),
+            'side': 'Buy' if self._side[i] == self.BUY else 'Sell'
+        }
+
+
+    def vwap(self, window=None, since=None, until=None):
+        """Returns volume weighted average price over window or None if no trades."""
+        price, size, _ = self._window(window, since, until, self._price, self._size, self._side)
+        total = size.sum()
+        if not total:
+            return None
+        return float(np.dot(price, size) / total)
+
+
+    def volume(self, window=None, since=None, until=None, side=None):
+        """Returns volume over window, only of `side` ( Buy or Sell ) if supplied."""
+        size, sides = self._window(window, since, until, self._size, self._side)
+        if side:
+            size = size[sides == (self.BUY if side == 'Buy' else self.SELL)]
+        return int(size.sum())
+
+
+    def count(self, window=None, since=None, until=None):
+        """Returns number of trades over window."""
+        lo, hi = self._bounds(window, since, until)
+        return hi - lo
+
+
+    def stats(self, window=None, since=None, until=None):
+        """Returns dict of vwap, volume, buy_volume, sell_volume, count, high, and low over window."""
+        price, size, side = self._window(window, since, until, self._price, self._size, self._side)
+        volume = int(size.sum())
+        buy_volume = int(size[side == self.BUY].sum())
+        return {
+            'vwap': float(np.dot(price, size) / volume) if volume else None,
+            'volume': volume,
+            'buy_volume': buy_volume,
+            'sell_volume': volume - buy_volume,
+            'count': len(price),
+            'high': float(price.max()) if len(price) else None,
+            'low': float(price.min()) if len(price) else None
+        }
+
+
+    def columns(self, window=None, since=None, until=None):
+        """Returns copies of (timestamp, price, size, side) arrays over window, oldest first."""
+        cols = self._window(window, since, until, self._ts, self._price, self._size, self._side)
+        return tuple(col.copy() for col in cols)
+
+
+    def _bounds(self, window, since, until):
+        """Returns (lo, hi) logical indexes, oldest trade is 0, of trades in window."""
+        if not self._count:
+            return 0, 0
+        if until is None:
+            until = int(self._ts[self._head - 1])
+        if since is None and window is not None:
+            since = until - int(window * 1000)
+
+        # once wrapped, the buffer is two sorted runs, [head:] then [:head]
+        if self._count < self.capacity:
+            older, newer = self._ts[:self._count], self._ts[:0]
+        else:
+            older, newer = self._ts[self._head:], self._ts[:self._head]
+
+        lo = 0 if since is None else _search(older, newer, since, 'left')
+        hi = _search(older, newer, until, 'right')
+        return lo, hi
+
+
+    def _window(self, window, since, until, *cols):
+        """Returns columns over window, views unless the window wraps around the buffer."""
+        lo, hi = self._bounds(window, since, until)
+        oldest = self._head if self._count == self.capacity else 0
+        start = oldest + lo
+        stop = oldest + hi
+        if stop <= self.capacity:
+            return tuple(col[start:stop] for col in cols)
+        if start >= self.capacity:
+            return tuple(col[start - self.capacity:stop - self.capacity] for col in cols)
+        return tuple(np.concatenate((col[start:], col[:stop - self.capacity])) for col in cols)
+
+
+
+def _search(older, newer, value, side):
+    """searchsorted over two consecutive sorted runs."""
+    i = int(np.searchsorted(older, value, side))
+    if i < len(older):
+        return i
+    return i + int(np.searchsorted(newer, value, side))
+
+
+def parse_timestamps(timestamps):
+    """Returns array of epoch ms from Bitmex ISO timestamps, ie '2019-11-28T01:00:00.269Z'."""
+    return np.array([t.rstrip('Z') for t in timestamps], dtype='datetime64[ms]').astype(np.int64)
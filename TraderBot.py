@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import argparse
 import time
 from threading import Thread
 
@@ -8,13 +9,79 @@ logging.basicConfig(filename="debug.log", level=logging.DEBUG)
 from BitMEX import BitMEX
 from TokenAnalyst import TokenAnalyst
 from Trade import Trade
-from RateLimitTracker import RateLimitTracker
-from config import check_config
+from RateLimiter import RateLimiter
+from Backoff import Backoff
+from Watchdog import Watchdog
+from SignalQueue import SignalQueue
+from SignalRules import SignalRules
+from OrderBatcher import OrderBatcher
+from config import (
+    check_config, 
+    G_SIGNAL_WORKERS, 
+    G_SIGNAL_QUEUE_SIZE, 
+    G_SIGNAL_QUEUE_POLICY, 
+    G_JSON_BACKEND, 
+    G_ORDER_BATCH_WINDOW, 
+    G_ORDER_BATCH_SIZE,
+    G_BITMEX_SYMBOLS,
+    G_RECONNECT_DELAY,
+    G_RECONNECT_MAX_DELAY,
+    G_BITMEX_STALE_AFTER,
+    G_BITMEX_PING_INTERVAL,
+    G_TOKEN_ANALYST_STALE_AFTER,
+    G_TOKEN_ANALYST_PING_INTERVAL,
+    G_FLOW_WINDOWS,
+    G_LOG_QUEUE,
+    G_LOG_QUEUE_SIZE,
+    G_LOG_QUEUE_POLICY,
+    G_LOG_FLUSH_INTERVAL,
+    G_ORDER_JOURNAL,
+    G_METRICS_HOST,
+    G_METRICS_PORT,
+    G_PROFILE_MODE,
+    G_PROFILE_MEMORY,
+    G_PROFILE_SECS,
+    G_PROFILE_DIR
+)
 from colors import c
 from order_logger import order_logger
+from Capture import FrameRecorder, replay
+from Ingest import IngestProcesses
+from LogQueue import LogQueue
+from OrderJournal import OrderJournal
+from Metrics import metrics
+from Profiler import Profiler
+import fast_json
 
 
-def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Trade on Bitmex using Token Analyst on-chain data.")
+    parser.add_argument('--record', metavar='PATH', 
+        help="record raw websocket frames from both feeds to a capture file")
+    parser.add_argument('--replay', metavar='PATH', 
+        help="replay a capture file through trader_bot instead of connecting, orders are not sent")
+    parser.add_argument('--speed', type=float, default=1.0, 
+        help="replay speed, 1 is real time, N is N times real time, 0 is as fast as possible")
+    parser.add_argument('--multiprocess', action='store_true',
+        help="read and decode each websocket in its own process, so trader_bot has this one to itself")
+    parser.add_argument('--profile', nargs='?', const=G_PROFILE_MODE, choices=Profiler.MODES,
+        help="profile from the start, 'sample' ( default ) or 'cprofile'. kill -USR1 <pid> starts / stops a profile any time")
+    parser.add_argument('--profile-secs', type=float, default=G_PROFILE_SECS, 
+        help="secs to profile for, 0 profiles till stopped")
+    parser.add_argument('--profile-memory', action='store_true', default=G_PROFILE_MEMORY,
+        help="also take tracemalloc snapshots and write top allocations, slows allocations while profiling")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', default=G_METRICS_PORT,
+        help="serve Prometheus metrics at http://%s:PORT/metrics, off if not given" % G_METRICS_HOST)
+    args = parser.parse_args()
+    if args.multiprocess and (args.record or args.replay):
+        parser.error("--multiprocess can't be used with --record or --replay")
+    return args
+
+
+def main(args=None):
+
+    if args is None:
+        args = parse_args()
 
     # ---------- Your code here ---------- #
     async def trader_bot(data):
@@ -27,34 +94,46 @@ def main():
         """
 
         # EXAMPLE 
-        # - checks for outflow above threshold to Bitmex
-        # - checks to see if we can make API and stay within rate limit  
+        # - skips the flow if Bitmex market data may be out of date
+        # - checks for outflow above threshold to Bitmex ( the 'bitmex_outflow' rule below )
         # - makes limit buy order
-        # - places order on Bitmex
+        # - places order on Bitmex, batched with any others placed in the same few ms,
+        #   waits its turn if we are at the rate limit
         # - logs order and order reponse
 
+        # websocket is down, resubscribing, or went quiet - last trade price can't be trusted
+        if bitmex.is_stale():
+            return
+
         last_trade_price = bitmex.get_last_trade_price()
+        if last_trade_price is None:
+            return
 
-        outflow_threshold = 1000
-        outflow_result = token_analyst.check_for_outflow(data=data, threshold=outflow_threshold)
+        fired = rules.match(data)
 
-        if outflow_result:
-            rate_limit.check()
-            
+        if 'bitmex_outflow' in fired:
             price = int(last_trade_price - 100)
             my_order = trade.limit_buy(quantity=10, price=price)
-            order_reponse = await bitmex.place_order(order=my_order)
+            order_reponse = await orders.place(my_order)
             
-            my_orders.append(order_reponse)
             order_logger.info("outflow trade - %s - response - %s" % (my_order, order_reponse))
 
 
     # ----------------- end trader_bot ------------------- #
 
 
+    # debug.log and orders.log are written on a background thread, logging only queues the record
+    log_queue = None
+    if G_LOG_QUEUE:
+        log_queue = LogQueue(maxsize=G_LOG_QUEUE_SIZE, policy=G_LOG_QUEUE_POLICY, flush_interval=G_LOG_FLUSH_INTERVAL)
+        log_queue.attach(logging.getLogger(), order_logger)
+        log_queue.start()
+
     logging.debug("---------------- New Start -------------------")
     order_logger.info("---------------- New Start -------------------")
 
+    logging.debug("JSON backend - %s" % fast_json.set_backend(G_JSON_BACKEND))
+
     (
         TOKEN_ANALYST_API_KEY, 
         BITMEX_API_KEY, 
@@ -64,27 +143,88 @@ def main():
         BITMEX_WS_URL
     ) = check_config()
 
-    token_analyst = TokenAnalyst(key=TOKEN_ANALYST_API_KEY)
+    recorder = FrameRecorder(args.record) if args.record else None
+
+    # orders sent, REST responses, and executions, not when replaying since orders aren't sent
+    journal = OrderJournal(G_ORDER_JOURNAL) if G_ORDER_JOURNAL and not args.replay else None
+
+    token_analyst = TokenAnalyst(
+        key=TOKEN_ANALYST_API_KEY, 
+        recorder=recorder, 
+        windows=G_FLOW_WINDOWS,
+        reconnect=Backoff(G_RECONNECT_DELAY, G_RECONNECT_MAX_DELAY),
+        watchdog=Watchdog('token_analyst', stale_after=G_TOKEN_ANALYST_STALE_AFTER, ping_interval=G_TOKEN_ANALYST_PING_INTERVAL, ping='protocol')
+    )
+
+    # shared by all REST calls, synced from Bitmex rate limit headers
+    rate_limit = RateLimiter(
+        limit=30, 
+        timeframe=60
+    )
 
     bitmex = BitMEX(
         key=BITMEX_API_KEY, 
         secret=BITMEX_API_SECRET, 
         symbol=DEFAULT_BITMEX_SYMBOL, 
         base_url=BITMEX_BASE_URL, 
-        ws_url=BITMEX_WS_URL 
+        ws_url=BITMEX_WS_URL,
+        rate_limiter=rate_limit,
+        recorder=recorder,
+        dry_run=bool(args.replay),
+        symbols=G_BITMEX_SYMBOLS,
+        journal=journal,
+        reconnect=Backoff(G_RECONNECT_DELAY, G_RECONNECT_MAX_DELAY),
+        watchdog=Watchdog('bitmex', stale_after=G_BITMEX_STALE_AFTER, ping_interval=G_BITMEX_PING_INTERVAL)
     )
 
+    # pick up our orders from the last day, the websocket's order snapshot then closes any that are gone
+    if journal is not None:
+        bitmex.orders.on_response(journal.latest(prefix="traderbot_", since=int((time.time() - 86400) * 1000)))
+
     trade = Trade(
         symbol=DEFAULT_BITMEX_SYMBOL,
         orderIDPrefex="traderbot_"
     )
 
-    rate_limit = RateLimitTracker(
-        limit=30, 
-        timeframe=60
+    # flow rules for trader_bot, all checked against each flow in one pass by rules.match(data)
+    rules = SignalRules()
+    rules.add('bitmex_outflow', flowType='Outflow', threshold=1000, exchange='Bitmex')
+
+    # orders placed within a few ms of each other go out as one bulk order
+    orders = OrderBatcher(
+        bitmex=bitmex,
+        window=G_ORDER_BATCH_WINDOW,
+        max_batch=G_ORDER_BATCH_SIZE
+    )
+
+    # Token Analyst data waits here for a free trader_bot worker,
+    # so the websocket keeps reading while orders are in flight
+    signals = SignalQueue(
+        handler=trader_bot,
+        maxsize=G_SIGNAL_QUEUE_SIZE,
+        workers=G_SIGNAL_WORKERS,
+        policy=G_SIGNAL_QUEUE_POLICY,
+        report_every=60
+    )
+
+    # read when metrics are scraped, the stage latencies and counts are kept by each class
+    metrics.gauge('traderbot_rate_limit_available', "rate limit tokens available now", fn=rate_limit.available)
+    metrics.gauge('traderbot_rate_limit_in_flight', "REST requests waiting for a response", fn=lambda: rate_limit.in_flight)
+    metrics.gauge('traderbot_rate_limit_limit', "rate limit per timeframe, from Bitmex headers", fn=lambda: rate_limit.limit)
+    metrics.gauge('traderbot_signal_queue_depth', "signals waiting for a trader_bot worker", fn=signals.depth)
+    metrics.gauge('traderbot_signal_queue_dropped', "signals dropped by the queue policy", fn=lambda: signals.dropped)
+
+
+    # CPU and memory profile of the event loop, from the start with --profile or whenever we get SIGUSR1
+    profiler = Profiler(
+        mode=args.profile or G_PROFILE_MODE,
+        memory=args.profile_memory,
+        secs=args.profile_secs,
+        out_dir=G_PROFILE_DIR
     )
 
-    my_orders = []
+    # websockets are read in feed processes, their data comes back through shared memory
+    ingest = IngestProcesses(bitmex=bitmex, token_analyst=token_analyst) if args.multiprocess else None
 
 
     # Below creates an event loop and 2 main tasks, 
@@ -95,22 +235,27 @@ def main():
     #
     # Connecting to the Token Analyst websocket 
     # yields us on-chain data we can use to make trades.
-    # When that data is recieved it is sent to the 
-    # trader_bot function above for us to act on. 
+    # When that data is recieved it is queued for the 
+    # trader_bot function above to act on. 
 
     loop = asyncio.get_event_loop() 
 
     async def token_analyst_ws_loop():
         """
         Connects to Token Analyst websocket, 
-        recieves on-chain data and sends data to trader_bot.
+        recieves on-chain data and queues data for trader_bot.
         
         """
-        async for data in token_analyst.connect(channel="btc_confirmed_exchange_flows"):
+        signals.start()
+        if ingest:
+            feed = ingest.token_analyst_data()
+        else:
+            feed = token_analyst.connect(channel="btc_confirmed_exchange_flows")
+        async for data in feed:
             if(data == None):
                 continue
             else:
-                await trader_bot(data)
+                await signals.put(data, received=token_analyst.received_at)
 
         
     async def bitmex_ws_loop():
@@ -119,16 +264,61 @@ def main():
         position, margin, order, wallet, and trade data.
         
         """
-        await bitmex.connect()
+        if ingest:
+            await ingest.run_bitmex()
+        else:
+            await bitmex.connect()
+
+
+    async def replay_loop():
+        """
+        Feeds a capture file through the same Bitmex and Token Analyst 
+        frame handlers and trader_bot, then stops.
+
+        """
+        signals.start()
+        await replay(args.replay, bitmex=bitmex, token_analyst=token_analyst, on_data=signals.put, speed=args.speed)
+        await signals.join()
+        print(c[3] + "\nSignal queue - %s" % signals.stats() + c[0])
+        print(c[3] + "\nOrder batches - %s" % orders.stats() + c[0])
+        await signals.stop()
+        loop.stop()
         
 
     try: 
-        loop.create_task(bitmex_ws_loop())
-        loop.create_task(token_analyst_ws_loop())
+        profiler.install_signal(loop)
+        if args.profile:
+            loop.call_soon(profiler.start)
+
+        if args.metrics_port:
+            loop.create_task(metrics.serve(G_METRICS_HOST, args.metrics_port))
+
+        if args.replay:
+            loop.create_task(replay_loop())
+        else:
+            if ingest:
+                ingest.start()
+            loop.create_task(bitmex_ws_loop())
+            loop.create_task(token_analyst_ws_loop())
         
         loop.run_forever()
     finally:
+        # before loop.stop(), a stopped loop can't run these to completion
+        if profiler.running:
+            loop.run_until_complete(profiler.stop())
+        if args.metrics_port:
+            loop.run_until_complete(metrics.stop())
+        # pooled REST session and its connections, and the websocket if it's ours
+        loop.run_until_complete(bitmex.close())
         loop.stop() 
+        if ingest:
+            ingest.stop()
+        if recorder:
+            recorder.close()
+        if journal is not None:
+            journal.close()
+        if log_queue:
+            log_queue.stop()
 
 
 if __name__ == "__main__":
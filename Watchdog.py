@@ -0,0 +1,163 @@
+import time
+import asyncio
+import logging
+from colors import c
+from Metrics import metrics
+from Exceptions import InvalidArgError
+
+
+class Watchdog:
+    """
+    Watches a websocket feed for going quiet, the websockets are opened with no ping timeout.
+
+    The feed sets `last_frame` as each frame comes in and runs `watch` for each connection.
+    Every `ping_interval` secs a ping is sent and its round trip timed, a Bitmex 'pong' or a
+    Token Analyst heartbeat is a frame, so a quiet but healthy feed still has frames.
+    With no frame for `stale_after` secs the feed is marked stale and the connection aborted,
+    the feed's connect loop then reconnects and clears `stale` once its state is rebuilt.
+    A feed starts stale, it has no state till its first connection is resynced.
+
+    Ping round trips, drops, and secs silent are metrics of the process running `watch`,
+    so with feed processes ( Ingest ) they are only registered in the feed's process.
+
+    Parameters:
+
+    `name: str`
+        feed name for logs and metrics, ie 'bitmex'
+
+    `stale_after: float`
+        secs with no frame before the connection is dropped. default 10
+
+    `ping_interval: float`
+        secs between pings, None for no pings. default 5
+
+    `ping: str`
+        'text' - send 'ping' and the feed calls `pong` when 'pong' comes back ( Bitmex ).
+        'protocol' - websocket protocol ping, only times the round trip, the pong isn't a frame. default 'text'
+
+    Attributes:
+
+    `stale: boolean`
+        True till the feed is first resynced, and while it is disconnected or silent past its budget
+
+    `last_frame: int`
+        time.perf_counter_ns() of the last frame
+
+    `last_heartbeat: int`
+        time.perf_counter_ns() of the last heartbeat event from the feed, if it sends them
+
+    `rtt: float`
+        secs round trip of the last ping, None till one comes back
+
+    Methods:
+
+    `watch`
+        watch a connection till it goes stale
+
+    `heartbeat`
+        note a heartbeat event
+
+    `pong`
+        note a 'pong' for the last text ping
+
+    `silent`
+        get secs since the last frame
+
+    """
+    PINGS = ('text', 'protocol')
+
+    def __init__(self, name, stale_after=10, ping_interval=5, ping='text'):
+        if stale_after <= 0:
+            raise InvalidArgError(stale_after, "stale_after must be positive.")
+        if ping not in self.PINGS:
+            raise InvalidArgError(ping, "ping must be text or protocol.")
+
+        self.name = name
+        self.stale_after = stale_after
+        self.ping_interval = ping_interval
+        self.ping = ping
+        self.stale = True
+        self.last_frame = time.perf_counter_ns()
+        self.last_heartbeat = None
+        self.rtt = None
+        self._ping_sent = None
+        # registered by the first watch, ie in the feed process and not the strategy process
+        self._rtt = None
+        self._stalls = None
+        metrics.gauge('traderbot_feed_stale', "1 while the feed is disconnected or quiet past its budget", fn=lambda: int(self.stale), feed=name)
+
+
+    def silent(self):
+        """Returns secs since the last frame."""
+        return (time.perf_counter_ns() - self.last_frame) / 1e9
+
+
+    def heartbeat(self):
+        """Notes a heartbeat event from the feed."""
+        self.last_heartbeat = time.perf_counter_ns()
+
+
+    def pong(self):
+        """Notes a pong, times the round trip of the ping it answers."""
+        now = time.perf_counter_ns()
+        sent, self._ping_sent = self._ping_sent, None
+        if sent is not None:
+            self.rtt = (now - sent) / 1e9
+            if self._rtt is not None:
+                self._rtt.record(now - sent)
+
+
+    async def watch(self, websocket):
+        """
+        Pings and watches a connection, aborts it once it's silent for `stale_after` secs.
+
+        Run as a task per connection, cancel it when the connection closes.
+
+        async func - use await
+        """
+        if self._rtt is None:
+            name = self.name
+            self._rtt = metrics.histogram('traderbot_feed_ping_seconds', "websocket ping round trip", feed=name)
+            self._stalls = metrics.counter('traderbot_feed_stale_total', "connections dropped for going quiet", feed=name)
+            metrics.gauge('traderbot_feed_silent_seconds', "secs since the last websocket frame", fn=self.silent, feed=name)
+        self.last_frame = time.perf_counter_ns()
+        self._ping_sent = None
+        last_ping = None
+        pinging = None
+        check = min(self.stale_after, self.ping_interval or self.stale_after) / 4
+        try:
+            while True:
+                await asyncio.sleep(check)
+                now = time.perf_counter_ns()
+
+                if self.ping_interval and self._ping_sent is None and (last_ping is None or now - last_ping >= self.ping_interval * 1e9):
+                    last_ping = now
+                    # a send on a stalled connection can wait on a full buffer, don't hold up the checks
+                    pinging = asyncio.ensure_future(self._send_ping(websocket, now))
+
+                silent = self.silent()
+                if silent >= self.stale_after:
+                    self.stale = True
+                    self._stalls.inc()
+                    logging.warning("%s websocket silent for %.1f secs, dropping it to reconnect" % (self.name, silent))
+                    print(c[2] + "\n%s websocket silent for %.1f secs, marked stale, reconnecting" % (self.name, silent) + c[0])
+                    # close() waits on a close handshake a stalled connection won't answer
+                    websocket.transport.abort()
+                    return
+        finally:
+            if pinging is not None:
+                pinging.cancel()
+
+
+    async def _send_ping(self, websocket, sent):
+        self._ping_sent = sent
+        try:
+            if self.ping == 'protocol':
+                waiter = await websocket.ping()
+                await waiter
+                self.pong()
+            else:
+                await websocket.send('ping')
+        except Exception:
+            # connection is closing, the connect loop deals with it
+            pass
@@ -0,0 +1,86 @@
+"""
+Benchmark - backtest the TraderBot example strategy over synthetic history.
+
+Outflows from Bitmex above 1000 BTC trigger a limit buy of 10 contracts 100 below the last trade,
+built with the Trade class, held for an hour.
+
+Usage: python benchmarks/bench_backtest.py [--days 90] [--trades-per-day 100000] [--flows-per-day 2000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Trade reads API keys from config, they are not used here
+for name in ('TOKEN_ANALYST_API_KEY', 'BITMEX_API_KEY', 'BITMEX_API_SECRET'):
+    os.environ.setdefault(name, 'benchmark')
+
+from Backtester import Backtester, FlowData, TradeData, INFLOW, OUTFLOW
+from SignalRules import EXCHANGE_BITS
+from Trade import Trade
+
+DAY_MS = 24 * 3600 * 1000
+START = 1575158400000  # 2019-12-01
+
+
+def synthetic_trades(days, per_day, rand):
+    n = days * per_day
+    ts = START + np.sort(rand.randint(0, days * DAY_MS, n))
+    steps = rand.choice([-2.5, -0.5, 0.0, 0.5, 2.5], n)
+    price = np.round((7000 + np.cumsum(steps)) * 2) / 2
+    size = rand.randint(1, 5000, n)
+    side = rand.choice([1, -1], n).astype(np.int8)
+    return TradeData(ts, price, size, side)
+
+
+def synthetic_flows(days, per_day, rand):
+    n = days * per_day
+    ts = START + np.sort(rand.randint(0, days * DAY_MS, n))
+    value = rand.exponential(300, n)
+    flow = rand.choice([INFLOW, OUTFLOW], n)
+    exchanges = np.array(list(EXCHANGE_BITS.values()))
+    to = rand.choice(exchanges, n)
+    frm = rand.choice(exchanges, n)
+    return FlowData(ts, value, flow, to, frm)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--trades-per-day', type=int, default=100000)
+    parser.add_argument('--flows-per-day', type=int, default=2000)
+    args = parser.parse_args()
+
+    rand = np.random.RandomState(1)
+    start = time.perf_counter()
+    trades = synthetic_trades(args.days, args.trades_per_day, rand)
+    flows = synthetic_flows(args.days, args.flows_per_day, rand)
+    print("generated %d trades, %d flows in %.2fs" % (len(trades), len(flows), time.perf_counter() - start))
+
+    trade = Trade(symbol="XBTUSD", orderIDPrefex="backtest_")
+
+    def make_order(flow, last_trade_price):
+        if last_trade_price is None:
+            return None
+        return trade.limit_buy(quantity=10, price=int(last_trade_price - 100))
+
+    bt = Backtester(flows, trades, latency=0.25)
+
+    start = time.perf_counter()
+    signals = bt.signals(flowType='Outflow', threshold=1000, exchange='Bitmex')
+    rule_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = bt.run(signals, make_order, hold=3600, expire=3600)
+    run_time = time.perf_counter() - start
+
+    print("rule over %d flows in %.4fs -> %d signals" % (len(flows), rule_time, len(signals)))
+    print("filled orders in %.3fs" % run_time)
+    print(result.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Microbenchmark - per frame overhead of websocket frame routing.
+
+Runs a burst of Token Analyst data frames and a mix of Bitmex table frames
+through the routing in TokenAnalyst / BitMEX ( dispatch tables, sync handlers )
+and through the old routing ( chained checks, a coroutine awaited per helper ),
+with the same table and data handlers underneath. Timed with and without
+the JSON decode, both sides count and time each frame for Metrics.
+
+Usage: python benchmarks/bench_dispatch.py [--frames 200000]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fast_json
+from BitMEX import BitMEX
+from TokenAnalyst import TokenAnalyst
+from sample_frames import bitmex_frames, trade_frame, order_book_frame, token_analyst_frame
+
+ID = "token_analyst_stream"
+
+
+class OldTokenAnalyst(TokenAnalyst):
+    """TokenAnalyst._interpret before dispatch tables."""
+
+    async def old_handle_frame(self, msg, id=ID):
+        start = time.perf_counter_ns()
+        data = await self.old_interpret(fast_json.loads(msg), id)
+        self._frames.inc()
+        self._frame_latency.since(start)
+        return data
+
+    async def old_interpret(self, response, id):
+        if(response['id'] == id and response['event'] == "data"):
+            return await self.old_on_data(response['data'])
+        if(response['id'] == None and response['event'] == "heartbeat"):
+            return None
+        if(response['id'] == id and response['event'] == "subscribed" and response['data']['success'] == True):
+            return None
+        if(response['event'] == 'error' and response['data']['success'] == False):
+            return None
+        return None
+
+    async def old_on_data(self, data):
+        return self._on_data(data)
+
+
+class OldBitMEX(BitMEX):
+    """BitMEX._interpret_msg_type and _store_table_info before dispatch tables."""
+
+    async def old_handle_frame(self, raw_msg, id="bitMEX_stream"):
+        start = time.perf_counter_ns()
+        msg = fast_json.loads(raw_msg)
+        msg_type = await self.old_interpret_msg_type(msg, id)
+        if msg_type == 'TABLE':
+            await self.old_store_table_info(msg)
+        self._frames.inc()
+        self._frame_latency.since(start)
+        return msg_type, msg
+
+    async def old_interpret_msg_type(self, response, id):
+        if 'info' in response:
+            return 'INFO'
+        elif 'success' in response:
+            return 'SUCCESS'
+        elif 'error' in response:
+            return 'ERROR'
+        elif 'table' in response:
+            return 'TABLE'
+
+    async def old_store_table_info(self, data):
+        if data['table'] == 'orderBookL2':
+            self._on_order_book(data)
+        elif data['table'] == 'trade':
+            self._on_trade(data)
+        else:
+            self.tables.apply(data)
+            if data['table'] == 'order' or data['table'] == 'execution':
+                self.orders.apply(data)
+
+
+async def old_bitmex_dispatch(bitmex, msgs):
+    for msg in msgs:
+        if await bitmex.old_interpret_msg_type(msg, "bitMEX_stream") == 'TABLE':
+            await bitmex.old_store_table_info(msg)
+
+
+def noop(data):
+    return data
+
+
+class Noop:
+    def apply(self, data):
+        pass
+
+
+async def run(func, items):
+    start = time.perf_counter()
+    for item in items:
+        await func(item)
+    return time.perf_counter() - start
+
+
+async def run_sync(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return time.perf_counter() - start
+
+
+def row(name, n, old_secs, new_secs):
+    print("%-36s %12.3f %12.3f %12.0f %12.0f %8.0f%%" % (
+        name, old_secs / n * 1e6, new_secs / n * 1e6, n / old_secs, n / new_secs, (1 - new_secs / old_secs) * 100))
+
+
+async def main(frames):
+    token_analyst_raw = [token_analyst_frame(value=1000 + i % 1000) for i in range(frames)]
+    mix = [trade_frame(), order_book_frame(), trade_frame(), order_book_frame(), bitmex_frames()[1]]
+    bitmex_raw = [mix[i % len(mix)] for i in range(frames)]
+    token_analyst_msgs = [fast_json.loads(raw) for raw in token_analyst_raw]
+
+    print("%-36s %12s %12s %12s %12s %9s" % ("", "old usec", "new usec", "old / s", "new / s", "saved"))
+
+    old, new = OldTokenAnalyst(key='bench_key'), TokenAnalyst(key='bench_key')
+    row("token analyst - decode + dispatch", frames, await run(old.old_handle_frame, token_analyst_raw), await run_sync(new._handle_frame, token_analyst_raw))
+    old, new = OldTokenAnalyst(key='bench_key'), TokenAnalyst(key='bench_key')
+    row("token analyst - dispatch", frames,
+        await run(lambda msg: old.old_interpret(msg, ID), token_analyst_msgs),
+        await run_sync(lambda msg: new._interpret(msg, ID), token_analyst_msgs))
+
+    old = OldBitMEX("bench_key", "bench_secret", 'XBTUSD', "http://127.0.0.1:1/api/v1/", "ws://127.0.0.1:1")
+    new = BitMEX("bench_key", "bench_secret", 'XBTUSD', "http://127.0.0.1:1/api/v1/", "ws://127.0.0.1:1")
+    row("bitmex - decode + dispatch", frames, await run(old.old_handle_frame, bitmex_raw), await run_sync(new._handle_frame, bitmex_raw))
+
+    # dispatch only, decode each frame fresh since handlers keep the rows
+    old_secs = new_secs = 0
+    for i in range(0, frames, 10000):
+        msgs = [fast_json.loads(raw) for raw in bitmex_raw[i:i + 10000]]
+        start = time.perf_counter()
+        await old_bitmex_dispatch(old, msgs)
+        old_secs += time.perf_counter() - start
+        msgs = [fast_json.loads(raw) for raw in bitmex_raw[i:i + 10000]]
+        new_secs += await run_sync(new._store_table_info, msgs)
+    row("bitmex - dispatch", frames, old_secs, new_secs)
+
+    # routing alone, every handler swapped for a no-op
+    old_ta, new_ta = OldTokenAnalyst(key='bench_key'), TokenAnalyst(key='bench_key')
+    old_ta._on_data = noop
+    new_ta._routes = {event: (noop, match_id) for event, (handler, match_id) in new_ta._routes.items()}
+    row("token analyst - routing only", frames,
+        await run(lambda msg: old_ta.old_interpret(msg, ID), token_analyst_msgs),
+        await run_sync(lambda msg: new_ta._interpret(msg, ID), token_analyst_msgs))
+
+    old._on_order_book = old._on_trade = noop
+    old.tables = old.orders = Noop()
+    new._table_routes = {table: noop for table in new._table_routes}
+    new._on_table = noop
+    bitmex_msgs = [fast_json.loads(raw) for raw in mix]
+    bitmex_msgs = [bitmex_msgs[i % len(mix)] for i in range(frames)]
+    row("bitmex - routing only", frames,
+        await run(lambda msg: old_bitmex_dispatch(old, (msg,)), bitmex_msgs),
+        await run_sync(lambda msg: new._table_routes.get(msg['table'], new._on_table)(msg) if 'table' in msg else new._interpret_msg_type(msg, "bitMEX_stream"), bitmex_msgs))
+
+    await old.close()
+    await new.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=200000)
+    args = parser.parse_args()
+    asyncio.new_event_loop().run_until_complete(main(args.frames))
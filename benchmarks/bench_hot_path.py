@@ -0,0 +1,276 @@
+"""
+Benchmark - where time goes on the signal to order hot path.
+
+Feeds captured frames ( from `python TraderBot.py --record PATH` ), or a synthetic
+capture, through each stage on its own and through the whole path from a
+Token Analyst frame to a signed request ready to send:
+
+    TokenAnalyst._handle_frame ( decode + _interpret )  per Token Analyst frame
+    check_for_outflow / check_for_inflow                 per signal
+    Trade.limit_buy ( make_order, uuid + base64 clOrdID )
+    generate_signature, BitmexHeaders
+    BitMEX._prepare_request + BitmexHeaders              request prep in _http_request
+    BitMEX._store_table_info                             per Bitmex table message
+    BitMEX._handle_frame ( decode + type + store )       per Bitmex frame
+    whole path                                           Token Analyst frame to signed request
+
+Reports throughput and p50 / p99 per stage. `--save` keeps the numbers as
+benchmarks/results/<tag>.json, tag defaults to `git describe`, so releases can be
+compared with `--compare benchmarks/results/<old tag>.json`.
+`--standin` also times the whole path with the order sent to the local Bitmex stand-in.
+
+Usage: python benchmarks/bench_hot_path.py [--capture PATH] [--signals 5000] [--save] [--compare FILE] [--standin]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import platform
+import argparse
+import datetime
+import subprocess
+import contextlib
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+# Trade reads API keys from config, they are not used here
+for name in ('TOKEN_ANALYST_API_KEY', 'BITMEX_API_KEY', 'BITMEX_API_SECRET'):
+    os.environ.setdefault(name, 'benchmark')
+
+import fast_json
+import Capture
+from BitMEX import BitMEX, BitmexHeaders, generate_signature
+from TokenAnalyst import TokenAnalyst
+from Trade import Trade
+from sample_frames import bitmex_frames, trade_frame, token_analyst_frame, token_analyst_heartbeat_frame
+from bench_order_book import make_messages
+
+RESULTS_DIR = os.path.join(HERE, 'results')
+EXCHANGES = ['Bitmex', 'Binance', 'Bitfinex', 'Bittrex', 'Kraken', 'Poloniex', 'Huobi']
+KEY = 'benchmark_key'
+SECRET = 'benchmark_secret_benchmark_secret'
+THRESHOLD = 1000
+
+
+def synthetic_capture(path, signals, rand):
+    """Writes a capture with the mix of frames a live run sees, per Token Analyst frame ~10 trade and ~30 book frames."""
+    recorder = Capture.FrameRecorder(path)
+    received = time.time()
+    partial, book = make_messages(signals * 30)
+    recorder.write(Capture.BITMEX, json.dumps(partial), received)
+    for frame in bitmex_frames():
+        recorder.write(Capture.BITMEX, frame, received)
+
+    price = 7000.0
+    for i in range(signals):
+        for j in range(30):
+            received += 0.01
+            recorder.write(Capture.BITMEX, json.dumps(book[i * 30 + j]), received)
+            if j % 3 == 0:
+                price += rand.choice((-0.5, 0, 0.5))
+                recorder.write(Capture.BITMEX, trade_frame(rand.randint(1, 5), price), received)
+        if i % 50 == 0:
+            recorder.write(Capture.TOKEN_ANALYST, token_analyst_heartbeat_frame(), received)
+        recorder.write(Capture.TOKEN_ANALYST, token_analyst_frame(
+            flowType=rand.choice(('Inflow', 'Outflow')),
+            value=round(rand.lognormvariate(5, 2), 8),
+            to='Bitmex' if rand.random() < 0.5 else rand.choice(EXCHANGES)
+        ), received)
+    recorder.close()
+
+
+def load_frames(path):
+    bitmex, token_analyst = [], []
+    for feed, received, frame in Capture.read_frames(path):
+        (bitmex if feed == Capture.BITMEX else token_analyst).append(frame)
+    return bitmex, token_analyst
+
+
+class Stages:
+    """Per stage timings in ns."""
+    def __init__(self):
+        self.samples = {}
+        self.order = []
+
+    def add(self, name, ns):
+        if name not in self.samples:
+            self.samples[name] = []
+            self.order.append(name)
+        self.samples[name].append(ns)
+
+    def results(self):
+        results = {}
+        for name in self.order:
+            ns = np.array(self.samples[name], dtype=np.float64)
+            results[name] = {
+                'n': len(ns),
+                'ops_per_sec': len(ns) / (ns.sum() / 1e9) if ns.sum() else 0.0,
+                'p50_us': np.percentile(ns, 50) / 1000,
+                'p99_us': np.percentile(ns, 99) / 1000,
+            }
+        return results
+
+
+def timed(stages, name, func, *args, **kwargs):
+    start = time.perf_counter_ns()
+    result = func(*args, **kwargs)
+    stages.add(name, time.perf_counter_ns() - start)
+    return result
+
+
+async def run_stages(bitmex_raw, token_analyst_raw, base_url="http://127.0.0.1:1/api/v1/", standin=None):
+    stages = Stages()
+    token_analyst = TokenAnalyst(key=KEY)
+    bitmex = BitMEX(KEY, SECRET, 'XBTUSD', base_url, "ws://127.0.0.1:1")
+    trade = Trade(symbol='XBTUSD', orderIDPrefex="traderbot_")
+    headers = BitmexHeaders(KEY, SECRET)
+
+    # Bitmex frames first, they fill the tape the strategy reads the last price from
+    for raw in bitmex_raw:
+        timed(stages, 'BitMEX._handle_frame', bitmex._handle_frame, raw)
+    fresh = BitMEX(KEY, SECRET, 'XBTUSD', base_url, "ws://127.0.0.1:1")
+    for raw in bitmex_raw:
+        msg = fast_json.loads(raw)
+        if 'table' in msg:
+            timed(stages, 'BitMEX._store_table_info', fresh._store_table_info, msg)
+
+    data = []
+    for raw in token_analyst_raw:
+        item = timed(stages, 'TokenAnalyst._handle_frame', token_analyst._handle_frame, raw)
+        if item is not None:
+            data.append(item)
+
+    for item in data:
+        timed(stages, 'check_for_outflow', token_analyst.check_for_outflow, data=item, threshold=THRESHOLD)
+        timed(stages, 'check_for_inflow', token_analyst.check_for_inflow, data=item, threshold=THRESHOLD)
+
+    price = int(bitmex.get_last_trade_price() - 100)
+    orders = [timed(stages, 'Trade.limit_buy', trade.limit_buy, quantity=10, price=price) for _ in data]
+
+    for order in orders:
+        url, body = bitmex._prepare_request('order', postdict=order)
+        expires = int(time.time()) + 5
+        timed(stages, 'generate_signature', generate_signature, SECRET, 'POST', str(url), expires, body)
+        timed(stages, 'BitmexHeaders', headers, 'POST', url, body)
+
+    for order in orders:
+        start = time.perf_counter_ns()
+        url, body = bitmex._prepare_request('order', postdict=order)
+        bitmex._auth('POST', url, body)
+        stages.add('request prep', time.perf_counter_ns() - start)
+
+    # whole path, per Token Analyst frame, to a signed request ready to send
+    hits = 0
+    for raw in token_analyst_raw:
+        start = time.perf_counter_ns()
+        item = token_analyst._handle_frame(raw)
+        if item is not None and token_analyst.check_for_outflow(data=item, threshold=THRESHOLD):
+            order = trade.limit_buy(quantity=10, price=int(bitmex.get_last_trade_price() - 100))
+            url, body = bitmex._prepare_request('order', postdict=order)
+            bitmex._auth('POST', url, body)
+            stages.add('whole path ( signal )', time.perf_counter_ns() - start)
+            hits += 1
+        stages.add('whole path ( any frame )', time.perf_counter_ns() - start)
+
+    # same again with the order sent to the stand-in and the response read
+    if standin is not None:
+        sender = BitMEX(standin.key, standin.secret, 'XBTUSD', base_url, "ws://127.0.0.1:1", orderIDPrefex="traderbot_")
+        for raw in token_analyst_raw:
+            start = time.perf_counter_ns()
+            item = token_analyst._handle_frame(raw)
+            if item is not None and token_analyst.check_for_outflow(data=item, threshold=THRESHOLD):
+                order = trade.limit_buy(quantity=10, price=int(bitmex.get_last_trade_price() - 100))
+                await sender.place_order(order)
+                stages.add('whole path + stand-in send', time.perf_counter_ns() - start)
+        await sender.close()
+
+    await bitmex.close()
+    await fresh.close()
+    return stages.results(), hits
+
+
+def git_tag():
+    try:
+        out = subprocess.check_output(['git', 'describe', '--tags', '--always', '--dirty'], cwd=HERE, stderr=subprocess.DEVNULL)
+        return out.decode('utf8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'dev'
+
+
+def print_results(results, compare=None):
+    header = "%-30s %9s %14s %10s %10s" % ("stage", "n", "ops / sec", "p50 us", "p99 us")
+    if compare:
+        header += "%12s" % "p50 vs old"
+    print(header)
+    for name, r in results.items():
+        line = "%-30s %9d %14.0f %10.2f %10.2f" % (name, r['n'], r['ops_per_sec'], r['p50_us'], r['p99_us'])
+        old = compare.get(name) if compare else None
+        if old:
+            line += "%+11.1f%%" % ((r['p50_us'] / old['p50_us'] - 1) * 100)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capture', metavar='PATH', help="capture file, default is a synthetic capture")
+    parser.add_argument('--signals', type=int, default=5000, help="Token Analyst frames in the synthetic capture")
+    parser.add_argument('--save', action='store_true', help="save results to benchmarks/results/<tag>.json")
+    parser.add_argument('--tag', help="results name, default git describe")
+    parser.add_argument('--compare', metavar='FILE', help="saved results to compare p50s against")
+    parser.add_argument('--standin', action='store_true', help="also send orders to the local Bitmex stand-in")
+    args = parser.parse_args()
+
+    path = args.capture
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'hot_path.cap.gz')
+        synthetic_capture(path, args.signals, random.Random(1))
+    bitmex_raw, token_analyst_raw = load_frames(path)
+
+    async def run():
+        standin = None
+        base_url = "http://127.0.0.1:1/api/v1/"
+        if args.standin:
+            from BitMEXServer import BitMEXServer
+            standin = BitMEXServer(key=KEY, secret=SECRET, rate_limit=10 ** 6)
+            base_url, _ = await standin.start()
+        try:
+            return await run_stages(bitmex_raw, token_analyst_raw, base_url, standin)
+        finally:
+            if standin is not None:
+                await standin.stop()
+
+    # heartbeats and subscribe messages print, keep that off the terminal
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results, hits = asyncio.get_event_loop().run_until_complete(run())
+
+    print("%d Bitmex frames, %d Token Analyst frames, %d signals over threshold, JSON backend %s\n"
+          % (len(bitmex_raw), len(token_analyst_raw), hits, fast_json.backend))
+    compare = None
+    if args.compare:
+        with open(args.compare) as f:
+            compare = json.load(f)['stages']
+    print_results(results, compare)
+
+    if args.save:
+        tag = args.tag or git_tag()
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, '%s.json' % tag)
+        with open(out, 'w') as f:
+            json.dump({
+                'tag': tag,
+                'date': datetime.datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+                'python': platform.python_version(),
+                'json_backend': fast_json.backend,
+                'capture': args.capture or 'synthetic %d signals' % args.signals,
+                'stages': results
+            }, f, indent=2)
+        print("\nSaved %s" % out)
+
+
+if __name__ == "__main__":
+    main()
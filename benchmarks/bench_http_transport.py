@@ -0,0 +1,158 @@
+"""
+Benchmark - websocket message latency while REST calls are in flight.
+
+Runs a local REST + websocket server in a background thread. The websocket 
+pushes a timestamped frame every millisecond while the client places orders.
+
+Compares the pooled aiohttp transport used by BitMEX._http_request against a 
+blocking transport (what requests.Session.send used to do on the event loop).
+
+Usage: python benchmarks/bench_http_transport.py [--orders 50] [--latency 0.05]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import statistics
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aiohttp import web
+import websockets
+from BitMEX import BitMEX
+
+
+def start_server(latency, tick):
+    """Starts REST + websocket server in a background thread, returns port."""
+    loop = asyncio.new_event_loop()
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+
+    async def order(request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        return web.json_response(dict(body, orderID='bench', ordStatus='New'))
+
+    async def realtime(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        async def push():
+            try:
+                while not ws.closed:
+                    await ws.send_str(json.dumps({'table': 'trade', 'sent': time.perf_counter()}))
+                    await asyncio.sleep(tick)
+            except ConnectionResetError:
+                pass
+
+        # reading lets aiohttp answer the client's close frame
+        pusher = asyncio.ensure_future(push())
+        async for _ in ws:
+            pass
+        pusher.cancel()
+        return ws
+
+    app = web.Application()
+    app.router.add_post('/api/v1/order', order)
+    app.router.add_get('/realtime', realtime)
+
+    async def serve():
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.SockSite(runner, sock).start()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(serve())
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    time.sleep(0.2)
+    return port
+
+
+def blocking_send(url, order):
+    """Old behaviour, a synchronous HTTP round trip."""
+    req = urllib.request.Request(
+        url, 
+        data=json.dumps(order).encode('utf8'), 
+        headers={'content-type': 'application/json'}, 
+        method='POST'
+    )
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read())
+
+
+async def run_case(port, n_orders, concurrency, blocking):
+    """Returns list of websocket frame lags in ms while n_orders are placed."""
+    base_url = "http://127.0.0.1:%d/api/v1/" % port
+    bitmex = BitMEX(
+        key="benchkey", 
+        secret="benchsecret", 
+        symbol="XBTUSD", 
+        base_url=base_url, 
+        ws_url="ws://127.0.0.1:%d" % port
+    )
+    order = {'symbol': 'XBTUSD', 'orderQty': 10, 'price': 7000, 'side': 'Buy'}
+    lags = []
+    done = asyncio.Event()
+
+    async def reader():
+        async with websockets.connect(bitmex._ws_url + "/realtime", close_timeout=0.5) as ws:
+            async for msg in ws:
+                lags.append((time.perf_counter() - json.loads(msg)['sent']) * 1000)
+                if done.is_set():
+                    return
+
+    async def sender():
+        for _ in range(n_orders // concurrency):
+            if blocking:
+                for _ in range(concurrency):
+                    blocking_send(base_url + "order", order)
+                    await asyncio.sleep(0)
+            else:
+                await asyncio.gather(*[bitmex.place_order(order) for _ in range(concurrency)])
+
+    read_task = asyncio.ensure_future(reader())
+    await asyncio.sleep(0.2)
+    lags.clear()
+    start = time.perf_counter()
+    await sender()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await read_task
+    await bitmex.close()
+    return lags, elapsed
+
+
+def report(name, lags, elapsed, n_orders):
+    lags = sorted(lags)
+    p50 = statistics.median(lags)
+    p99 = lags[int(len(lags) * 0.99) - 1]
+    print("%-10s orders: %d in %.2fs | ws frames: %d | lag p50 %.2f ms  p99 %.2f ms  max %.2f ms" % (
+        name, n_orders, elapsed, len(lags), p50, p99, lags[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05, help="server side REST latency in secs")
+    parser.add_argument('--tick', type=float, default=0.001, help="secs between websocket frames")
+    args = parser.parse_args()
+
+    port = start_server(args.latency, args.tick)
+    loop = asyncio.get_event_loop()
+    for name, blocking in (("blocking", True), ("async", False)):
+        lags, elapsed = loop.run_until_complete(run_case(port, args.orders, args.concurrency, blocking))
+        report(name, lags, elapsed, args.orders)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark - Bitmex feed lag under strategy load, in process vs feed process.
+
+A Bitmex stand-in in its own process bursts trade and order book frames while a
+CPU heavy strategy runs on the event loop. Measures how long the burst takes to
+land in the trade tape, how far behind the tape is while it lands, and how
+much strategy work got done, with the websocket read on the strategy's loop
+( bitmex.connect ) and in a feed process ( Ingest.IngestProcesses ).
+
+Usage: python benchmarks/bench_ingest.py [--trades 20000] [--work-ms 2]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from BitMEX import BitMEX
+from Ingest import IngestProcesses
+
+
+def serve(port, trades, go):
+    """Stand-in process, bursts trades and order book updates once go is set."""
+    from BitMEXServer import BitMEXServer
+
+    async def run():
+        server = BitMEXServer()
+        await server.start(port=port)
+        while not go.is_set():
+            await asyncio.sleep(0.01)
+        for i in range(trades):
+            await server.push_trade(7000 + i % 20 * 0.5, side='Buy' if i % 2 else 'Sell')
+            await server.push('orderBookL2', 'update', [{'symbol': 'XBTUSD', 'id': 8799300000 + i % 50, 'side': 'Sell', 'size': i}])
+            if i % 50 == 0:
+                await asyncio.sleep(0)
+        await asyncio.sleep(3600)
+
+    asyncio.new_event_loop().run_until_complete(run())
+
+
+def busy(ms):
+    end = time.perf_counter() + ms / 1000
+    x = 0
+    while time.perf_counter() < end:
+        x += 1
+    return x
+
+
+async def measure(mode, port, trades, work_ms):
+    ctx = multiprocessing.get_context('spawn')
+    go = ctx.Event()
+    server = ctx.Process(target=serve, args=(port, trades, go), daemon=True)
+    server.start()
+    await asyncio.sleep(1.5)
+
+    bitmex = BitMEX("standin_key", "standin_secret", 'XBTUSD', "http://127.0.0.1:%d/api/v1/" % port, "ws://127.0.0.1:%d" % port)
+    ingest = None
+    if mode == 'feed process':
+        ingest = IngestProcesses(bitmex)
+        ingest.start()
+        feed = asyncio.ensure_future(ingest.run_bitmex())
+    else:
+        feed = asyncio.ensure_future(bitmex.connect())
+    await asyncio.sleep(2)
+
+    tape = bitmex.get_trade_data()
+    lags = []
+    work = 0
+    go.set()
+    start = time.perf_counter()
+    while tape.count() < trades and time.perf_counter() - start < 120:
+        # strategy - CPU work, then give the loop a turn
+        busy(work_ms)
+        work += 1
+        last = tape.last_timestamp()
+        if last is not None:
+            lags.append(time.time() * 1000 - last)
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+
+    feed.cancel()
+    if ingest:
+        ingest.stop()
+    await bitmex.close()
+    server.terminate()
+    server.join()
+
+    lags = np.array(lags) if lags else np.zeros(1)
+    print("%-14s %10d %10.2f %12.0f %10.1f %10.1f %14.0f" % (
+        mode, tape.count(), elapsed, tape.count() / elapsed,
+        np.percentile(lags, 50), np.percentile(lags, 99), work / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trades', type=int, default=20000)
+    parser.add_argument('--work-ms', type=float, default=2, help="strategy CPU ms per loop turn")
+    parser.add_argument('--port', type=int, default=18766)
+    args = parser.parse_args()
+
+    print("%-14s %10s %10s %12s %10s %10s %14s" % ("", "trades", "secs", "trades / s", "lag p50", "lag p99", "strategy / s"))
+    for i, mode in enumerate(('in process', 'feed process')):
+        asyncio.new_event_loop().run_until_complete(measure(mode, args.port + i, args.trades, args.work_ms))
+    print("\nlag is ms between a trade's Bitmex timestamp and it being in the tape, sampled each strategy turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark - order journal queries over months of history.
+
+Writes a journal of synthetic orders, responses, and fills ( 3 records per order,
+spread over --days ), indexes it, then times post-trade queries and the restart
+reconciliation read.
+
+Usage: python benchmarks/bench_journal.py [--orders 500000] [--days 90]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from OrderJournal import OrderJournal, RECORD, SENT, RESPONSE, EXECUTION, HEADER_BYTES
+
+DAY = 86400 * 1000
+
+
+def write_history(path, orders, days):
+    """Appends synthetic records straight to the file, journaling them one by one would take minutes."""
+    journal = OrderJournal(path)
+    journal.close()
+    now = int(time.time() * 1000)
+    ts = np.sort(np.random.default_rng(3).integers(now - days * DAY, now, orders))
+    records = np.zeros(orders * 3, dtype=RECORD)
+    for i, kind in enumerate((SENT, RESPONSE, EXECUTION)):
+        rows = records[i::3]
+        rows['ts'] = ts + i
+        rows['kind'] = kind
+        rows['side'] = 1
+        rows['symbol'] = b'XBTUSD'
+        rows['clOrdID'] = np.char.add(b'traderbot_', np.char.zfill(np.arange(orders).astype('S'), 8))
+        rows['price'] = 7000.0
+        rows['orderQty'] = 10
+    with open(path, 'ab') as f:
+        f.write(records.tobytes())
+    return now
+
+
+def timed(name, func, loops=20):
+    func()
+    start = time.perf_counter()
+    for _ in range(loops):
+        result = func()
+    print("%-44s %10.3f ms %10d rows" % (name, (time.perf_counter() - start) / loops * 1000, len(result)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=500000)
+    parser.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'orders.journal')
+        now = write_history(path, args.orders, args.days)
+
+        start = time.perf_counter()
+        journal = OrderJournal(path, reindex_after=0)
+        print("%-44s %10.3f ms   ( %d records, %.0f MB )" % ("open + index", (time.perf_counter() - start) * 1000,
+              len(journal), (os.path.getsize(path) - HEADER_BYTES) / 1e6))
+
+        # a few live records past the index
+        for i in range(100):
+            journal.record_sent({'symbol': 'XBTUSD', 'clOrdID': 'traderbot_live%04d' % i, 'orderQty': 10, 'price': 7000.0})
+
+        some = 'traderbot_%08d' % (args.orders // 2)
+        timed("one clOrdID", lambda: journal.query(clOrdID=some))
+        # clOrdIDs count up with time, a prefix of one made in the window covers up to 100 orders in it
+        first = journal.query(since=now - 2 * DAY, until=now - DAY)['clOrdID'][0].decode()
+        prefix = first[:-2]
+        fills = lambda: journal.query(prefix=prefix, kind='execution', since=now - 2 * DAY, until=now - DAY)
+        assert len(fills()), "prefix %s has no fills in the window" % prefix
+        timed("fills for clOrdID prefix, one day", fills)
+        timed("everything yesterday", lambda: journal.query(since=now - 2 * DAY, until=now - DAY))
+        timed("restart - latest per order, last day", lambda: journal.latest(prefix='traderbot_', since=now - DAY), loops=3)
+        journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Microbenchmark - JSON decoding of websocket frames and encoding of order bodies.
+
+Times every installed fast_json backend over the sample frames, and the old
+BitMEX._ws_subscribe path that decoded each table frame twice.
+
+Usage: python benchmarks/bench_json.py [--loops 20000]
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import fast_json
+from sample_frames import all_frames
+
+ORDER = {'symbol': 'XBTUSD', 'clOrdID': 'traderbot_4Ir0uLF6TBeWqCfKrYH0Dw', 'orderQty': 10, 'side': 'Buy', 'price': 7000}
+
+
+def usec(stmt, loops):
+    return min(timeit.repeat(stmt, number=loops, repeat=3)) / loops * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loops', type=int, default=20000)
+    args = parser.parse_args()
+
+    frames = all_frames()
+    backends = fast_json.available()
+
+    print("%-28s %8s" % ("frame ( usec per decode )", "bytes") + "".join("%12s" % b for b in backends) + "%14s" % "json x2 (old)")
+    for frame_name, frame in frames:
+        row = "%-28s %8d" % (frame_name, len(frame))
+        for name in backends:
+            fast_json.set_backend(name)
+            loads = fast_json.loads
+            raw = frame.encode('utf8')
+            row += "%12.2f" % usec(lambda: loads(raw), args.loops)
+        row += "%14.2f" % usec(lambda: (json.loads(frame), json.loads(frame)), args.loops)
+        print(row)
+
+    row = "%-28s %8d" % ("order body encode", len(json.dumps(ORDER)))
+    for name in backends:
+        fast_json.set_backend(name)
+        dumps_bytes = fast_json.dumps_bytes
+        row += "%12.2f" % usec(lambda: dumps_bytes(ORDER), args.loops)
+    row += "%14.2f" % usec(lambda: json.dumps(ORDER).encode('utf8'), args.loops)
+    print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Microbenchmark - cost of a log call on the event loop, FileHandler vs LogQueue.
+
+Logs the request line _http_request logs before every send, to a file in a
+temp dir, straight through a FileHandler ( format, write, flush per record )
+and through LogQueue ( record queued, written on a background thread ).
+
+Usage: python benchmarks/bench_logging.py [--records 50000]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from LogQueue import LogQueue
+
+URL = "https://testnet.bitmex.com/api/v1/order"
+BODY = b'{"symbol":"XBTUSD","clOrdID":"traderbot_4Ir0uLF6TBeWqCfKrYH0Dw","orderQty":10,"side":"Buy","price":7000}'
+
+
+def run(logger, records):
+    times = np.empty(records)
+    for i in range(records):
+        start = time.perf_counter_ns()
+        logger.info("sending req to %s: %s", URL, BODY)
+        times[i] = time.perf_counter_ns() - start
+    return times / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=50000)
+    args = parser.parse_args()
+
+    print("%-28s %10s %10s %10s %10s" % ("", "mean usec", "p50", "p99", "dropped"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('FileHandler', 'LogQueue'):
+            logger = logging.getLogger("bench_" + mode)
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = logging.FileHandler(os.path.join(tmp, mode + ".log"))
+            handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s]: %(message)s"))
+            logger.addHandler(handler)
+
+            log_queue = None
+            if mode == 'LogQueue':
+                log_queue = LogQueue(maxsize=args.records)
+                log_queue.attach(logger)
+                log_queue.start()
+
+            times = run(logger, args.records)
+            dropped = 0
+            if log_queue:
+                log_queue.stop()
+                dropped = log_queue.stats()['dropped']
+            handler.close()
+
+            with open(os.path.join(tmp, mode + ".log")) as f:
+                lines = sum(1 for _ in f)
+            assert lines == args.records - dropped, (mode, lines)
+            print("%-28s %10.2f %10.2f %10.2f %10d" % (mode, times.mean(), np.percentile(times, 50), np.percentile(times, 99), dropped))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Microbenchmark - cost of recording metrics on the hot path, and of a scrape.
+
+Times Histogram.record / since and Counter.inc against an empty loop,
+checks histogram quantiles against exact ones for a log-normal latency
+sample, and times Metrics.render with every TraderBot metric filled in.
+
+Usage: python benchmarks/bench_metrics.py [--values 1000000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from Metrics import Metrics, Histogram, QUANTILES
+
+
+def per_call(func, values):
+    start = time.perf_counter_ns()
+    for value in values:
+        func(value)
+    return (time.perf_counter_ns() - start) / len(values)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--values', type=int, default=1000000)
+    args = parser.parse_args()
+
+    # latencies from 1 usec to a few secs, ns
+    values = np.random.default_rng(7).lognormal(12, 2, args.values).astype(np.int64).tolist()
+    histogram = Histogram()
+    registry = Metrics()
+    counter = registry.counter('bench_total')
+
+    base = per_call(lambda value: None, values)
+    print("%-36s %10s" % ("", "nsec"))
+    print("%-36s %10.0f" % ("Histogram.record", per_call(histogram.record, values) - base))
+    print("%-36s %10.0f" % ("Histogram.since", per_call(lambda value: histogram.since(value), values) - base))
+    print("%-36s %10.0f" % ("Counter.inc", per_call(lambda value: counter.inc(), values) - base))
+
+    print("\n%-36s %14s %14s %8s" % ("quantile", "exact ns", "histogram ns", "error"))
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+    for q in QUANTILES:
+        exact = np.quantile(values, q, method='higher')
+        got = histogram.quantile(q)
+        print("%-36s %14d %14d %7.2f%%" % (q, exact, got, (got - exact) / exact * 100))
+
+    # about what TraderBot registers
+    for feed in ('bitmex', 'token_analyst'):
+        for value in values[:10000]:
+            registry.histogram('traderbot_frame_seconds', feed=feed).record(value)
+        registry.counter('traderbot_feed_messages_total', feed=feed).inc(10000)
+    for name in ('signal_wait', 'frame_to_trader_bot', 'trader_bot', 'order_build', 'order_ack', 'rate_limit_wait'):
+        for value in values[:10000]:
+            registry.histogram('traderbot_%s_seconds' % name).record(value)
+    for verb in ('GET', 'POST', 'PUT', 'DELETE'):
+        registry.histogram('traderbot_http_request_seconds', verb=verb).record(values[0])
+
+    loops = 100
+    start = time.perf_counter()
+    for _ in range(loops):
+        text = registry.render()
+    print("\n%-36s %10.3f ms %10d lines" % ("Metrics.render", (time.perf_counter() - start) / loops * 1000, text.count('\n')))
+
+
+if __name__ == "__main__":
+    main()
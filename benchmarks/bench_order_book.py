@@ -0,0 +1,82 @@
+"""
+Benchmark - OrderBookL2 delta throughput.
+
+Builds a 2 x 500 level book, then applies a burst of random orderBookL2
+update / insert / delete messages like the ones Bitmex sends for XBTUSD.
+
+Usage: python benchmarks/bench_order_book.py [--messages 100000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from OrderBook import OrderBookL2
+
+SYMBOL = "XBTUSD"
+INDEX = 88
+
+
+def level_id(price):
+    """Bitmex style id for price, tickSize 0.5."""
+    return 100000000 * INDEX - int(price * 2)
+
+
+def row(price, side, size=None):
+    r = {'symbol': SYMBOL, 'id': level_id(price), 'side': side}
+    if size is not None:
+        r['size'] = size
+        r['price'] = price
+    return r
+
+
+def make_messages(n, mid=7000.0, levels=500):
+    rand = random.Random(1)
+    partial = [row(mid - 0.5 * (i + 1), 'Buy', 100) for i in range(levels)]
+    partial += [row(mid + 0.5 * i, 'Sell', 100) for i in range(levels)]
+    live = {'Buy': set(r['price'] for r in partial if r['side'] == 'Buy'),
+            'Sell': set(r['price'] for r in partial if r['side'] == 'Sell')}
+    msgs = []
+    for _ in range(n):
+        side = rand.choice(('Buy', 'Sell'))
+        price = mid + (-0.5 * rand.randint(1, 50) if side == 'Buy' else 0.5 * rand.randint(0, 49))
+        roll = rand.random()
+        if price in live[side] and roll < 0.8:
+            msgs.append({'table': 'orderBookL2', 'action': 'update',
+                         'data': [{'symbol': SYMBOL, 'id': level_id(price), 'side': side, 'size': rand.randint(1, 1000)}]})
+        elif price in live[side]:
+            live[side].discard(price)
+            msgs.append({'table': 'orderBookL2', 'action': 'delete', 'data': [row(price, side)]})
+        else:
+            live[side].add(price)
+            msgs.append({'table': 'orderBookL2', 'action': 'insert', 'data': [row(price, side, rand.randint(1, 1000))]})
+    return {'table': 'orderBookL2', 'action': 'partial', 'data': partial}, msgs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    partial, msgs = make_messages(args.messages)
+    book = OrderBookL2(SYMBOL)
+    book.apply(partial)
+
+    start = time.perf_counter()
+    for msg in msgs:
+        book.apply(msg)
+        book.best_bid()
+        book.best_ask()
+    elapsed = time.perf_counter() - start
+
+    print("applied %d deltas in %.3fs | %.0f msgs/sec | %.2f us/msg" % (
+        len(msgs), elapsed, len(msgs) / elapsed, elapsed / len(msgs) * 1e6))
+    print("levels %d | best bid %s | best ask %s | spread %s | depth(10) %s" % (
+        len(book), book.best_bid(), book.best_ask(), book.spread(), book.depth(10)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Microbenchmark - slow down of the frame hot path while Profiler runs.
+
+Runs a burst of Token Analyst data frames and Bitmex table frames through
+their websocket handlers with no profiler, the sampling profiler, cProfile,
+and each of those with tracemalloc on.
+
+Usage: python benchmarks/bench_profile.py [--frames 100000]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from BitMEX import BitMEX
+from TokenAnalyst import TokenAnalyst
+from Profiler import Profiler
+from sample_frames import trade_frame, order_book_frame, token_analyst_frame
+
+
+async def run(profiler, token_analyst, bitmex, frames):
+    if profiler:
+        profiler.start()
+    start = time.perf_counter()
+    for raw in frames:
+        if raw[0] == 'ta':
+            token_analyst._handle_frame(raw[1])
+        else:
+            bitmex._handle_frame(raw[1])
+    secs = time.perf_counter() - start
+    if profiler:
+        await profiler.stop()
+    return secs
+
+
+async def main(n):
+    mix = [('ta', token_analyst_frame(value=1000)), ('bitmex', trade_frame()), ('bitmex', order_book_frame())]
+    frames = [(kind, raw) for kind, raw in (mix[i % len(mix)] for i in range(n))]
+    bitmex = BitMEX("bench_key", "bench_secret", 'XBTUSD', "http://127.0.0.1:1/api/v1/", "ws://127.0.0.1:1")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print("%-28s %12s %12s" % ("", "usec / frame", "slower"))
+        base = None
+        for name, mode, memory in (("none", None, False), ("sample", 'sample', False), ("cprofile", 'cprofile', False),
+                                   ("sample + tracemalloc", 'sample', True), ("cprofile + tracemalloc", 'cprofile', True)):
+            profiler = Profiler(mode=mode, memory=memory, secs=0, out_dir=tmp) if mode else None
+            secs = await run(profiler, TokenAnalyst(key='bench_key'), bitmex, frames)
+            if base is None:
+                base = secs
+            print("%-28s %12.3f %11.0f%%" % (name, secs / n * 1e6, (secs / base - 1) * 100))
+
+    await bitmex.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.new_event_loop().run_until_complete(main(args.frames))
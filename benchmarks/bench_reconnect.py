@@ -0,0 +1,81 @@
+"""
+Benchmark - Bitmex websocket recovery time after a dropped connection.
+
+Connects to the local Bitmex stand-in, then drops every websocket --drops times
+and times each drop to every table rebuilt from its new partial ( fresh auth,
+resubscribe, partials ). The old reconnect path, a fixed 5 secs sleep after every
+drop, is timed the same way over --old-drops drops.
+
+Usage: python benchmarks/bench_reconnect.py [--drops 50] [--old-drops 3]
+"""
+import os
+import io
+import sys
+import asyncio
+import argparse
+import logging
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from BitMEX import BitMEX
+from BitMEXServer import BitMEXServer
+
+
+class FixedSleep:
+    """Reconnect delays as before Backoff, 5 secs after every drop."""
+    attempts = 0
+
+    def next(self):
+        self.attempts += 1
+        return 5
+
+    def reset(self):
+        self.attempts = 0
+
+
+async def time_drops(server, base_url, ws_url, drops, reconnect=None):
+    """Returns ms from each drop to every table rebuilt."""
+    bitmex = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url, reconnect=reconnect)
+    task = asyncio.ensure_future(bitmex.connect())
+
+    times = []
+    # connect, drop, and subscribe messages aren't what we are timing
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.sleep(0.5)
+        for i in range(drops):
+            count = bitmex._outage.count
+            before = bitmex._outage.sum
+            await server.disconnect()
+            while bitmex._outage.count == count:
+                await asyncio.sleep(0.0005)
+            times.append((bitmex._outage.sum - before) / 1e6)
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await bitmex.close()
+    return np.array(times)
+
+
+async def main(drops, old_drops):
+    logging.disable(logging.WARNING)
+    server = BitMEXServer()
+    base_url, ws_url = await server.start()
+
+    print("%-32s %10s %10s %10s" % ("", "p50 ms", "p99 ms", "max ms"))
+    times = await time_drops(server, base_url, ws_url, drops)
+    print("%-32s %10.2f %10.2f %10.2f" % ("drop -> tables rebuilt", np.percentile(times, 50), np.percentile(times, 99), times.max()))
+    if old_drops:
+        times = await time_drops(server, base_url, ws_url, old_drops, reconnect=FixedSleep())
+        print("%-32s %10.2f %10.2f %10.2f" % ("before ( 5 s sleep, %d drops )" % old_drops, np.percentile(times, 50), np.percentile(times, 99), times.max()))
+
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--drops', type=int, default=50)
+    parser.add_argument('--old-drops', type=int, default=3, help="drops timed on the old 5 secs sleep path, 0 to skip")
+    args = parser.parse_args()
+    asyncio.new_event_loop().run_until_complete(main(args.drops, args.old_drops))
@@ -0,0 +1,77 @@
+"""
+Benchmark - BitMEX client against the local stand-in server.
+
+Places orders one after another and times the REST round trip and the
+order ack arriving on the websocket, while the server streams trades.
+Optional latency and 429 / 503 injection show how retries move the tail.
+
+Usage: python benchmarks/bench_standin.py [--orders 500] [--latency 0] [--error-rate 0]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from BitMEX import BitMEX
+from BitMEXServer import BitMEXServer
+
+
+def report(name, samples):
+    ms = np.array(samples) * 1000
+    print("%-22s %8d %10.3f %10.3f %10.3f" % (name, len(ms), np.percentile(ms, 50), np.percentile(ms, 99), ms.max()))
+
+
+async def run(args):
+    server = BitMEXServer(latency=args.latency, rate_limit=10 ** 6, error_rate={429: args.error_rate, 503: args.error_rate}, seed=1)
+    base_url, ws_url = await server.start()
+    bitmex = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url, timeout=5)
+    ws_task = asyncio.ensure_future(bitmex.connect())
+    trades = asyncio.ensure_future(server.play([7000 + i % 20 * 0.5 for i in range(10 ** 6)], interval=0.001))
+
+    while bitmex.get_last_trade_price() is None:
+        await asyncio.sleep(0.01)
+
+    rest, ack = [], []
+    failed = 0
+    start = time.perf_counter()
+    for i in range(args.orders):
+        order = {'symbol': 'XBTUSD', 'clOrdID': 'bench_%d' % i, 'orderQty': 10, 'side': 'Buy', 'price': 6000}
+        sent = time.perf_counter()
+        try:
+            response = await bitmex.place_order(order)
+        except Exception:
+            # POSTs are not retried, an injected error fails the call
+            failed += 1
+            continue
+        rest.append(time.perf_counter() - sent)
+        while bitmex.get_order(response['orderID']) is None:
+            await asyncio.sleep(0)
+        ack.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - start
+
+    print("%-22s %8s %10s %10s %10s" % ("", "n", "p50 ms", "p99 ms", "max ms"))
+    report("REST place_order", rest)
+    report("websocket order ack", ack)
+    print("\n%d orders in %.2f secs ( %.0f / sec ), %d failed, %d REST calls served" % (args.orders, elapsed, args.orders / elapsed, failed, server.requests))
+
+    trades.cancel()
+    ws_task.cancel()
+    await bitmex.close()
+    await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0, help="secs the server adds to each REST call")
+    parser.add_argument('--error-rate', type=float, default=0, help="chance of each of 429 and 503 per REST call")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(run(args))
+
+
+if __name__ == "__main__":
+    main()
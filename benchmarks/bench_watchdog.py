@@ -0,0 +1,76 @@
+"""
+Benchmark - time to notice and recover from a stalled Bitmex websocket.
+
+Connects to the local Bitmex stand-in, then --stalls times leaves the websocket
+open but silent ( no data, no pongs ) and times the stall to the feed being marked
+stale and to its tables rebuilt on a new connection. Also reports ping round trips.
+Before the watchdog a stalled connection was never noticed.
+
+Usage: python benchmarks/bench_watchdog.py [--stalls 10] [--stale-after 1] [--ping-interval 0.25]
+"""
+import os
+import io
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from BitMEX import BitMEX
+from BitMEXServer import BitMEXServer
+from Watchdog import Watchdog
+
+
+async def main(stalls, stale_after, ping_interval):
+    logging.disable(logging.WARNING)
+    server = BitMEXServer()
+    base_url, ws_url = await server.start()
+    watchdog = Watchdog('bitmex', stale_after=stale_after, ping_interval=ping_interval)
+    bitmex = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url, watchdog=watchdog)
+    task = asyncio.ensure_future(bitmex.connect())
+
+    to_stale = []
+    to_back = []
+    # connect, stall, and subscribe messages aren't what we are timing
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.sleep(0.5)
+        for i in range(stalls):
+            count = bitmex._outage.count
+            start = time.perf_counter()
+            server.stall()
+            stale = None
+            while bitmex._outage.count == count:
+                if stale is None and bitmex.is_stale():
+                    stale = time.perf_counter() - start
+                await asyncio.sleep(0.0005)
+            to_back.append(time.perf_counter() - start)
+            to_stale.append(stale if stale is not None else to_back[-1])
+            # a few pings on the new connection
+            await asyncio.sleep(ping_interval * 2)
+
+    rtt = watchdog._rtt
+    print("%-28s %10s %10s %10s" % ("", "p50 ms", "p99 ms", "max ms"))
+    for name, times in (("stall -> marked stale", to_stale), ("stall -> tables rebuilt", to_back)):
+        times = np.array(times) * 1000
+        print("%-28s %10.2f %10.2f %10.2f" % (name, np.percentile(times, 50), np.percentile(times, 99), times.max()))
+    p50, p99 = (q / 1e6 for q in rtt.quantiles((0.5, 0.99)))
+    print("%-28s %10.3f %10.3f %10.3f" % ("ping round trip ( %d )" % rtt.count, p50, p99, rtt.max / 1e6))
+    print("budget %.2f secs, check every %.3f secs, before the watchdog a stall was never noticed" % (stale_after, min(stale_after, ping_interval) / 4))
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await bitmex.close()
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stalls', type=int, default=10)
+    parser.add_argument('--stale-after', type=float, default=1)
+    parser.add_argument('--ping-interval', type=float, default=0.25)
+    args = parser.parse_args()
+    asyncio.new_event_loop().run_until_complete(main(args.stalls, args.stale_after, args.ping_interval))
@@ -0,0 +1,95 @@
+"""
+Sample websocket frames for benchmarks.
+
+`bitmex_frames` are the examples in example_bitmex_webstream_data.txt re-encoded as JSON,
+the rest are small frames shaped like what Bitmex and Token Analyst send most often.
+"""
+import os
+import ast
+import json
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+EXAMPLE_FILE = os.path.join(ROOT, 'example_bitmex_webstream_data.txt')
+
+
+def example_objects():
+    """Returns python objects of the examples in example_bitmex_webstream_data.txt."""
+    objs = []
+    block = None
+    with open(EXAMPLE_FILE) as f:
+        for line in f:
+            if line.startswith('{'):
+                block = []
+            if block is not None:
+                block.append(line)
+            if line.startswith('}') and block is not None:
+                objs.append(ast.literal_eval(''.join(block)))
+                block = None
+    return objs
+
+
+def bitmex_frames():
+    """Returns example Bitmex frames as JSON strs ( position partial, and order )."""
+    objs = example_objects()
+    frames = [json.dumps(objs[0])]
+    frames.append(json.dumps({'table': 'order', 'action': 'insert', 'data': [objs[1]]}))
+    return frames
+
+
+def trade_frame(n=1, price=7000.0):
+    """Returns Bitmex trade insert frame with n trades."""
+    data = [{
+        'timestamp': '2019-12-20T17:42:08.436Z',
+        'symbol': 'XBTUSD',
+        'side': 'Buy' if i % 2 else 'Sell',
+        'size': 100 + i,
+        'price': price + 0.5 * i,
+        'tickDirection': 'ZeroPlusTick',
+        'trdMatchID': '7ff37f6c-c4b6-a226-1ef2-1b5f0d3fb6f2',
+        'grossValue': 1428400,
+        'homeNotional': 0.014284,
+        'foreignNotional': 100
+    } for i in range(n)]
+    return json.dumps({'table': 'trade', 'action': 'insert', 'data': data})
+
+
+def order_book_frame(n=3):
+    """Returns Bitmex orderBookL2 update frame with n levels."""
+    data = [{'symbol': 'XBTUSD', 'id': 8799300000 + i, 'side': 'Sell', 'size': 1000 + i} for i in range(n)]
+    return json.dumps({'table': 'orderBookL2', 'action': 'update', 'data': data})
+
+
+def token_analyst_frame(flowType='Outflow', value=1500.0, to='Bitmex', id="token_analyst_stream"):
+    """Returns Token Analyst exchange flow data frame."""
+    return json.dumps({
+        'id': id,
+        'event': 'data',
+        'data': {
+            'transactionId': 'f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16',
+            'blockHash': '00000000000000000003e8b8a9a1c2e6e9f2b0b3cb8e1a1f1b0b2a0d4c3b2a10',
+            'blockNumber': 607000,
+            'from': ['Bitmex' if flowType == 'Outflow' else 'Unknown'],
+            'to': [to],
+            'flowType': flowType,
+            'value': value,
+            'valueUsd': value * 7000,
+            'timestamp': '2019-12-20T17:42:08.000Z'
+        }
+    })
+
+
+def token_analyst_heartbeat_frame():
+    """Returns Token Analyst heartbeat frame."""
+    return json.dumps({'id': None, 'event': 'heartbeat', 'data': {'serverTime': 1576863728000}})
+
+
+def all_frames():
+    """Returns list of (name, frame) for every sample frame."""
+    frames = [('bitmex position partial', bitmex_frames()[0]), ('bitmex order insert', bitmex_frames()[1])]
+    frames += [
+        ('bitmex trade insert', trade_frame()),
+        ('bitmex orderBookL2 update', order_book_frame()),
+        ('token analyst data', token_analyst_frame()),
+        ('token analyst heartbeat', token_analyst_heartbeat_frame()),
+    ]
+    return frames
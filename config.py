@@ -22,12 +22,77 @@ G_BITMEX_API_SECRET =     'SECRET'
 # default symbol for trades - see Bitmex API docs for other valid symbols
 G_DEFAULT_BITMEX_SYMBOL = "XBTUSD"
 
+# symbols to get trades and order book for, each is kept separately - ie ["XBTUSD", "ETHUSD"]
+# the default symbol is always included
+G_BITMEX_SYMBOLS = ["XBTUSD"]
+
 # bitmex websocket URL - default is testnet, change to make real trades 
 G_BITMEX_WS_URL = "wss://testnet.bitmex.com" # REAL TRADES -> "wss://www.bitmex.com"
 
 # bitmex REST API URL - default is testnet, change to make real trades
 G_BITMEX_BASE_URL = "https://testnet.bitmex.com/api/v1/" # REAL TRADES -> "https://www.bitmex.com/api/v1/"
 
+# websocket reconnects - first retry is immediate, then waits double from G_RECONNECT_DELAY up to G_RECONNECT_MAX_DELAY secs, jittered
+G_RECONNECT_DELAY = 0.25
+G_RECONNECT_MAX_DELAY = 30
+
+# stale feed watchdog - a websocket with no frames for G_*_STALE_AFTER secs is marked stale and reconnected,
+# pinged every G_*_PING_INTERVAL secs to time its round trip. Bitmex answers 'ping' with 'pong',
+# Token Analyst sends heartbeat events, so neither goes quiet while healthy
+G_BITMEX_STALE_AFTER = 10
+G_BITMEX_PING_INTERVAL = 5
+G_TOKEN_ANALYST_STALE_AFTER = 90
+G_TOKEN_ANALYST_PING_INTERVAL = 15
+
+# number of trader_bot workers handling Token Analyst signals at once
+G_SIGNAL_WORKERS = 2
+
+# max Token Analyst signals waiting for a worker
+G_SIGNAL_QUEUE_SIZE = 100
+
+# when the signal queue is full - 'block', 'drop_oldest', or 'drop_newest'
+G_SIGNAL_QUEUE_POLICY = "block"
+
+# JSON library for websocket frames and order bodies - 'auto', 'orjson', 'msgspec', or 'json'
+# 'auto' uses the fastest one installed
+G_JSON_BACKEND = "auto"
+
+# secs to collect orders into one bulk order before sending, and max orders per bulk order
+G_ORDER_BATCH_WINDOW = 0.005
+G_ORDER_BATCH_SIZE = 10
+
+# secs of each rolling window for Token Analyst flow stats - 10 min, 1 hour, 24 hours
+G_FLOW_WINDOWS = [600, 3600, 86400]
+
+# write debug.log and orders.log on a background thread, logging on the event loop only queues the record
+G_LOG_QUEUE = True
+
+# max log records waiting to be written, and what to do when full - 'drop_newest', 'drop_oldest', or 'block'
+G_LOG_QUEUE_SIZE = 10000
+G_LOG_QUEUE_POLICY = "drop_newest"
+
+# max secs between log file flushes
+G_LOG_FLUSH_INTERVAL = 1.0
+
+# binary journal of orders sent, REST order responses, and executions - None to turn off
+G_ORDER_JOURNAL = "orders.journal"
+
+# serve latency histograms and counters at http://G_METRICS_HOST:G_METRICS_PORT/metrics ( Prometheus text ) - None is off,
+# --metrics-port turns it on for a run. ie 9464, 9100 is node_exporter's port
+G_METRICS_HOST = "127.0.0.1"
+G_METRICS_PORT = None
+
+# --profile, or `kill -USR1 <pid>` while running, profiles the event loop for G_PROFILE_SECS ( send it again to stop early )
+# 'sample' - low overhead stack sampling, or 'cprofile' - every call timed, slower
+G_PROFILE_MODE = "sample"
+
+# also trace allocations with tracemalloc while profiling, same as --profile-memory. makes allocations several times slower
+G_PROFILE_MEMORY = False
+
+# secs to profile, 0 to profile till stopped, and where to write flame graph stacks and reports
+G_PROFILE_SECS = 60
+G_PROFILE_DIR = "profiles"
+
 
 
 
@@ -0,0 +1,119 @@
+import json
+import logging
+
+'''
+    JSON encoding / decoding for websocket frames and REST bodies.
+
+    Uses orjson or msgspec if installed, falls back to the standard json module.
+    Pick one at startup with set_backend, then call fast_json.loads / fast_json.dumps
+    ( not `from fast_json import loads`, that would keep the old backend ).
+
+    All backends encode compact JSON, no whitespace between keys, as Bitmex signatures expect.
+'''
+
+BACKENDS = ('orjson', 'msgspec', 'json')
+
+backend = None
+
+
+def _use_json():
+    global loads, dumps, dumps_bytes, backend
+    decoder = json.JSONDecoder()
+    encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def loads(data):
+        """Returns decoded JSON from str or bytes."""
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode('utf8')
+        return decoder.decode(data)
+
+    def dumps(obj):
+        """Returns compact JSON str."""
+        return encoder.encode(obj)
+
+    def dumps_bytes(obj):
+        """Returns compact JSON utf8 bytes."""
+        return encoder.encode(obj).encode('utf8')
+
+    backend = 'json'
+
+
+def _use_orjson():
+    global loads, dumps, dumps_bytes, backend
+    import orjson
+
+    loads = orjson.loads
+    dumps_bytes = orjson.dumps
+
+    def dumps(obj):
+        """Returns compact JSON str."""
+        return orjson.dumps(obj).decode('utf8')
+
+    backend = 'orjson'
+
+
+def _use_msgspec():
+    global loads, dumps, dumps_bytes, backend
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+    loads = decoder.decode
+    dumps_bytes = encoder.encode
+
+    def dumps(obj):
+        """Returns compact JSON str."""
+        return encoder.encode(obj).decode('utf8')
+
+    backend = 'msgspec'
+
+
+_SETUP = {
+    'orjson': _use_orjson,
+    'msgspec': _use_msgspec,
+    'json': _use_json,
+}
+
+
+def available():
+    """Returns list of installed backends, fastest first."""
+    names = []
+    for name in BACKENDS:
+        try:
+            __import__(name)
+            names.append(name)
+        except ImportError:
+            pass
+    return names
+
+
+def set_backend(name='auto'):
+    """
+    Picks JSON backend.
+
+    Parameters:
+
+    `name: str`
+        'auto', 'orjson', 'msgspec', or 'json'.
+        'auto' uses the first one installed, in that order.
+        If the named backend is not installed falls back to 'json'.
+
+    Returns:
+
+    `backend: str`
+        name of backend in use
+    """
+    names = BACKENDS if name == 'auto' else (name, 'json')
+    for n in names:
+        try:
+            _SETUP[n]()
+            break
+        except ImportError:
+            if name != 'auto':
+                logging.warning("JSON backend %s not installed, using json." % n)
+        except KeyError:
+            logging.warning("Unknown JSON backend %s, using json." % n)
+    return backend
+
+
+set_backend('auto')
@@ -0,0 +1,104 @@
+import json
+import asyncio
+import pytest
+from BitMEX import BitMEX
+from BitMEXServer import BitMEXServer
+from RateLimiter import RateLimiter
+
+
+class CountingBitMEX(BitMEX):
+    """BitMEX that counts cancel_all_orders calls."""
+    cancels = 0
+
+    async def cancel_all_orders(self, symbol=None, cancel_filter=None, text=None):
+        self.cancels += 1
+        return await super().cancel_all_orders(symbol=symbol, cancel_filter=cancel_filter, text=text)
+
+
+async def _rate_limited_order(injected):
+    server = BitMEXServer(rate_limit=600)
+    base_url, ws_url = await server.start()
+    bitmex = CountingBitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url, rate_limiter=RateLimiter(limit=600))
+    order = {'symbol': 'XBTUSD', 'orderQty': 10, 'price': 7000, 'ordType': 'Limit', 'clOrdID': 'traderbot_test'}
+    server.inject(429, count=injected)
+    try:
+        with pytest.raises(Exception, match="Max retries"):
+            await bitmex._http_request(path="order", postdict=order, verb="POST", rethrow_errors=True)
+        return bitmex.cancels, server.requests, bitmex.rate_limiter.in_flight
+    finally:
+        await bitmex.close()
+        await server.stop()
+
+
+def test_repeated_429s_cancel_once():
+    # order 429s, its cancel 429s twice then goes through, the order is not retried ( POST )
+    cancels, requests, in_flight = asyncio.run(_rate_limited_order(injected=3))
+    assert cancels == 1
+    assert requests == 4
+    assert in_flight == 0
+
+
+async def _cancelled_request():
+    server = BitMEXServer(latency=1)
+    base_url, ws_url = await server.start()
+    bitmex = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url, rate_limiter=RateLimiter(limit=600))
+    try:
+        request = asyncio.ensure_future(bitmex._http_request(path="order", verb="GET"))
+        await asyncio.sleep(0.1)
+        assert bitmex.rate_limiter.in_flight == 1
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        return bitmex.rate_limiter.in_flight
+    finally:
+        await bitmex.close()
+        await server.stop()
+
+
+def test_cancelled_request_gives_back_its_rate_limit_slot():
+    assert asyncio.run(_cancelled_request()) == 0
+
+
+def order(clOrdID, price=6000):
+    return {'symbol': 'XBTUSD', 'orderQty': 10, 'side': 'Buy', 'price': price, 'ordType': 'Limit', 'clOrdID': clOrdID}
+
+
+async def _get_with_filter():
+    server = BitMEXServer()
+    base_url, ws_url = await server.start()
+    bitmex = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url)
+    try:
+        placed = await bitmex.place_order(order('traderbot_get'))
+        # json filter is quoted, ie : as %3A, the signature has to cover it as sent
+        query = {'filter': json.dumps({'clOrdID': ['traderbot_get']}), 'reverse': 'true'}
+        found = await bitmex._http_request(path="order", query=query, verb="GET", rethrow_errors=True)
+        return placed, found
+    finally:
+        await bitmex.close()
+        await server.stop()
+
+
+def test_get_with_a_filter_query_is_signed_as_sent():
+    placed, found = asyncio.run(_get_with_filter())
+    assert [o['orderID'] for o in found] == [placed['orderID']]
+
+
+async def _duplicate_clOrdID():
+    server = BitMEXServer()
+    base_url, ws_url = await server.start()
+    bitmex = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url)
+    # ie after a restart, the order isn't known locally so it's looked up by a filtered GET
+    restarted = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url)
+    try:
+        placed = await bitmex.place_order(order('traderbot_dup'))
+        recovered = await restarted.place_order(order('traderbot_dup'))
+        return placed, recovered, restarted.orders.get_by_clOrdID('traderbot_dup')
+    finally:
+        await bitmex.close()
+        await restarted.close()
+        await server.stop()
+
+
+def test_duplicate_clOrdID_returns_the_existing_order():
+    placed, recovered, known = asyncio.run(_duplicate_clOrdID())
+    assert recovered['orderID'] == placed['orderID']
+    assert known['orderID'] == placed['orderID']
@@ -0,0 +1,43 @@
+import numpy as np
+from FlowStats import FlowStats, epoch_ms
+
+
+def ms(iso):
+    return int(np.datetime64(iso, 'ms').astype(np.int64))
+
+
+def test_epoch_ms_from_iso_strs():
+    assert epoch_ms('2019-12-20T17:42:08.436Z') == ms('2019-12-20T17:42:08.436')
+    assert epoch_ms('2019-12-20T17:42:08Z') == ms('2019-12-20T17:42:08')
+    assert epoch_ms('2019-12-20T17:42:08.436') == ms('2019-12-20T17:42:08.436')
+    assert epoch_ms('2019-12-20T17:42') == ms('2019-12-20T17:42')
+    # same minute again comes from the cache
+    assert epoch_ms('2019-12-20T17:42:59.999Z') == ms('2019-12-20T17:42:59.999')
+
+
+def test_epoch_ms_with_utc_offsets():
+    assert epoch_ms('2019-12-20T17:42:08.436+00:00') == ms('2019-12-20T17:42:08.436')
+    assert epoch_ms('2019-12-20T19:42:08+02:00') == ms('2019-12-20T17:42:08')
+    assert epoch_ms('2019-12-20T17:42:08-05:30') == ms('2019-12-20T23:12:08')
+
+
+def test_epoch_ms_from_numbers():
+    assert epoch_ms(1576863728) == 1576863728000
+    assert epoch_ms(1576863728436) == 1576863728436
+
+
+def flow(ts, value, flowType='Inflow', to='Bitmex', frm='Unknown'):
+    return {'timestamp': ts, 'value': value, 'flowType': flowType, 'to': [to], 'from': [frm]}
+
+
+def test_windows_age_out_flows():
+    stats = FlowStats(windows=(60,))
+    stats.update(flow('2019-12-20T17:00:00Z', 5))
+    stats.update(flow('2019-12-20T17:00:30+00:00', 3))
+    assert stats.get('Bitmex', 60)['inflow']['sum'] == 8
+
+    stats.update(flow('2019-12-20T17:01:10Z', 1, flowType='Outflow', to='Binance', frm='Bitmex'))
+    bitmex = stats.get('Bitmex', 60)
+    assert bitmex['inflow']['sum'] == 3
+    assert bitmex['outflow']['sum'] == 1
+    assert bitmex['net']['sum'] == 2
@@ -0,0 +1,76 @@
+import logging
+from LogQueue import LogQueue
+
+
+def file_logger(tmp_path, name):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(tmp_path / (name + '.log'))
+    handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+    logger.addHandler(handler)
+    return logger
+
+
+def read(tmp_path, name):
+    return (tmp_path / (name + '.log')).read_text().splitlines()
+
+
+def test_message_is_made_when_logged(tmp_path):
+    orders = file_logger(tmp_path, 'orders_args')
+    log_queue = LogQueue()
+    log_queue.attach(orders)
+
+    order = {'price': 7000}
+    orders.info("placed %s", order)
+    # changed before the writer thread gets to the record
+    order['price'] = 0
+    log_queue.start()
+    log_queue.stop()
+
+    assert read(tmp_path, 'orders_args') == ["INFO placed {'price': 7000}"]
+
+
+def test_stop_writes_everything_queued(tmp_path):
+    orders = file_logger(tmp_path, 'orders_stop')
+    log_queue = LogQueue(flush_interval=60)
+    log_queue.attach(orders)
+    log_queue.start()
+    for i in range(100):
+        orders.info("order %d", i)
+    log_queue.stop()
+
+    assert len(read(tmp_path, 'orders_stop')) == 100
+    assert log_queue.stats()['written'] == 100
+    # handlers are put back
+    assert len(orders.handlers) == 1
+
+
+def test_drops_are_reported_to_the_root_log_only(tmp_path):
+    root = logging.getLogger()
+    root_handlers, root_level = list(root.handlers), root.level
+    for handler in root_handlers:
+        root.removeHandler(handler)
+    try:
+        root.setLevel(logging.INFO)
+        debug = logging.FileHandler(tmp_path / 'debug.log')
+        debug.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        root.addHandler(debug)
+        orders = file_logger(tmp_path, 'orders_drops')
+
+        log_queue = LogQueue(maxsize=5)
+        log_queue.attach(root, orders)
+        for i in range(8):
+            orders.info("order %d", i)
+        log_queue.start()
+        log_queue.stop()
+        root.removeHandler(debug)
+        debug.close()
+    finally:
+        root.setLevel(root_level)
+        for handler in root_handlers:
+            root.addHandler(handler)
+
+    assert log_queue.stats()['dropped'] == 3
+    assert read(tmp_path, 'orders_drops') == ["INFO order %d" % i for i in range(5)]
+    assert read(tmp_path, 'debug') == ["WARNING Log queue full, dropped 3 log records."]
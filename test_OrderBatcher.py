@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from BitMEX import BitMEX
+from BitMEXServer import BitMEXServer
+from OrderBatcher import OrderBatcher
+from Exceptions import InvalidArgError
+
+
+def order(clOrdID, price, symbol='XBTUSD'):
+    return {'symbol': symbol, 'clOrdID': clOrdID, 'orderQty': 10, 'side': 'Buy', 'price': price, 'ordType': 'Limit'}
+
+
+async def _amends():
+    server = BitMEXServer()
+    base_url, ws_url = await server.start()
+    bitmex = BitMEX(server.key, server.secret, 'XBTUSD', base_url, ws_url, symbols=['XBTUSD', 'ETHUSD'])
+    batcher = OrderBatcher(bitmex, window=0.01)
+    # stand-in needs a last price per symbol
+    await server.push_trade(200, symbol='ETHUSD')
+    try:
+        placed = await asyncio.gather(
+            batcher.place(order('traderbot_a', 6000)),
+            batcher.place(order('traderbot_b', 6001)),
+            batcher.place(order('traderbot_c', 150, symbol='ETHUSD'))
+        )
+
+        # a single amend with symbol and text
+        single = await batcher.amend({'symbol': 'XBTUSD', 'origClOrdID': 'traderbot_a', 'price': 5900, 'text': 'lower'})
+
+        # no symbol, batched by the symbol of the order being amended
+        batches = batcher.batches
+        amended = await asyncio.gather(
+            batcher.amend({'orderID': placed[0]['orderID'], 'price': 5800}),
+            batcher.amend({'origClOrdID': 'traderbot_b', 'price': 5801}),
+            batcher.amend({'origClOrdID': 'traderbot_c', 'price': 140})
+        )
+        return single, amended, batcher.batches - batches
+    finally:
+        await batcher.flush()
+        await bitmex.close()
+        await server.stop()
+
+
+def test_amends_batch_by_symbol_and_drop_symbol_from_the_request():
+    single, amended, batches = asyncio.run(_amends())
+
+    assert single['price'] == 5900
+    assert [a['price'] for a in amended] == [5800, 5801, 140]
+    # XBTUSD pair as one bulk amend, ETHUSD on its own
+    assert batches == 2
+
+
+def test_amend_rejects_fields_amend_order_does_not_take():
+    async def run():
+        batcher = OrderBatcher(BitMEX("key", "secret", 'XBTUSD', "http://127.0.0.1:1/api/v1/", "ws://127.0.0.1:1"))
+        with pytest.raises(InvalidArgError):
+            batcher.amend({'orderID': 'abc', 'price': 5000, 'side': 'Sell'})
+        with pytest.raises(InvalidArgError):
+            batcher.amend({'price': 5000})
+    asyncio.run(run())
@@ -0,0 +1,138 @@
+import random
+import pytest
+from OrderBook import OrderBookL2
+
+
+def level(id, side, price, size, symbol='XBTUSD'):
+    return {'symbol': symbol, 'id': id, 'side': side, 'price': price, 'size': size}
+
+
+def msg(action, data):
+    return {'table': 'orderBookL2', 'action': action, 'data': data}
+
+
+class NaiveBook:
+    """Reference book, a dict of levels sorted on every read."""
+
+    def __init__(self):
+        self.levels = {}
+
+    def apply(self, m):
+        if m['action'] == 'partial':
+            self.levels = {}
+        for row in m['data']:
+            if m['action'] in ('partial', 'insert'):
+                self.levels[row['id']] = [row['side'], row['price'], row['size']]
+            elif m['action'] == 'update' and row['id'] in self.levels:
+                old = self.levels[row['id']]
+                self.levels[row['id']] = [row.get('side', old[0]), old[1], row.get('size', old[2])]
+            elif m['action'] == 'delete':
+                self.levels.pop(row['id'], None)
+
+    def side(self, side):
+        rows = [(price, size) for s, price, size in self.levels.values() if s == side]
+        return sorted(rows, reverse=side == 'Buy')
+
+
+def test_partial_sorts_each_side_and_skips_other_symbols():
+    book = OrderBookL2('XBTUSD')
+    assert not book.is_ready()
+    book.apply(msg('insert', [level(1, 'Buy', 7000, 10)]))
+    assert len(book) == 0
+
+    book.apply(msg('partial', [
+        level(1, 'Buy', 6999, 10), level(2, 'Buy', 7000, 20), level(3, 'Sell', 7002, 30),
+        level(4, 'Sell', 7001, 40), level(5, 'Sell', 100, 1, symbol='ETHUSD')]))
+
+    assert book.is_ready()
+    assert len(book) == 4
+    assert book.best_bid() == (7000, 20)
+    assert book.best_ask() == (7001, 40)
+    assert book.spread() == 1
+    assert book.mid_price() == 7000.5
+    assert book.levels('Buy') == [(7000, 20), (6999, 10)]
+    assert book.levels('Sell', n=1) == [(7001, 40)]
+    assert book.depth() == (30, 70)
+    assert book.depth(n=1) == (20, 40)
+
+
+def test_insert_update_delete():
+    book = OrderBookL2('XBTUSD')
+    book.apply(msg('partial', [level(1, 'Buy', 7000, 10), level(2, 'Sell', 7001, 10)]))
+
+    book.apply(msg('insert', [level(3, 'Buy', 7000.5, 5)]))
+    assert book.best_bid() == (7000.5, 5)
+
+    book.apply(msg('update', [{'symbol': 'XBTUSD', 'id': 3, 'side': 'Buy', 'size': 7}]))
+    assert book.best_bid() == (7000.5, 7)
+
+    book.apply(msg('delete', [{'symbol': 'XBTUSD', 'id': 3, 'side': 'Buy'}]))
+    assert book.best_bid() == (7000, 10)
+    assert len(book) == 2
+
+    # unknown ids are ignored
+    book.apply(msg('update', [{'symbol': 'XBTUSD', 'id': 99, 'size': 1}]))
+    book.apply(msg('delete', [{'symbol': 'XBTUSD', 'id': 99}]))
+    assert len(book) == 2
+
+
+@pytest.mark.parametrize('update', [
+    {'symbol': 'XBTUSD', 'id': 2, 'side': 'Buy', 'size': 3},
+    # side only, size stays
+    {'symbol': 'XBTUSD', 'id': 2, 'side': 'Buy'}
+])
+def test_update_that_changes_side(update):
+    book = OrderBookL2('XBTUSD')
+    book.apply(msg('partial', [level(1, 'Buy', 7000, 10), level(2, 'Sell', 7001, 10), level(3, 'Sell', 7002, 10)]))
+
+    book.apply(msg('update', [update]))
+
+    assert book.best_bid() == (7001, update.get('size', 10))
+    assert book.best_ask() == (7002, 10)
+    assert book.levels('Buy') == [(7001, update.get('size', 10)), (7000, 10)]
+
+
+def test_empty_book():
+    book = OrderBookL2('XBTUSD')
+    book.apply(msg('partial', []))
+    assert book.best_bid() is None and book.best_ask() is None
+    assert book.spread() is None and book.mid_price() is None
+    assert book.depth() == (0, 0)
+
+
+def test_matches_a_naive_book():
+    rng = random.Random(5)
+    book, naive = OrderBookL2('XBTUSD'), NaiveBook()
+    partial = msg('partial', [level(i, 'Buy' if i % 2 else 'Sell', 7000 + (i if i % 2 else -i) * 0.5, rng.randint(1, 100)) for i in range(50)])
+    book.apply(partial)
+    naive.apply(partial)
+    next_id = 50
+
+    for _ in range(2000):
+        ids = list(naive.levels)
+        action = rng.choice(('insert', 'update', 'update', 'delete'))
+        if action == 'insert' or not ids:
+            # Bitmex level ids are made from the price, a price is on the book once
+            taken = set(l[1] for l in naive.levels.values())
+            price = rng.choice([p for p in (7000 + i * 0.5 for i in range(-200, 200)) if p not in taken])
+            m = msg('insert', [level(next_id, rng.choice(('Buy', 'Sell')), price, rng.randint(1, 100))])
+            next_id += 1
+        elif action == 'update':
+            id = rng.choice(ids)
+            row = {'symbol': 'XBTUSD', 'id': id, 'size': rng.randint(1, 100)}
+            if rng.random() < 0.1:
+                row['side'] = 'Sell' if naive.levels[id][0] == 'Buy' else 'Buy'
+            m = msg('update', [row])
+        else:
+            m = msg('delete', [{'symbol': 'XBTUSD', 'id': rng.choice(ids)}])
+        book.apply(m)
+        naive.apply(m)
+
+        bids, asks = naive.side('Buy'), naive.side('Sell')
+        assert book.best_bid() == (bids[0] if bids else None)
+        assert book.best_ask() == (asks[0] if asks else None)
+        assert book.levels('Buy', n=5) == bids[:5]
+        assert book.levels('Sell', n=5) == asks[:5]
+        assert book.depth(n=5) == (sum(s for p, s in bids[:5]), sum(s for p, s in asks[:5]))
+
+    assert len(book) == len(naive.levels)
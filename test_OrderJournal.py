@@ -0,0 +1,107 @@
+import logging
+from OrderJournal import OrderJournal
+
+
+def sent(clOrdID, price=7000.0, symbol='XBTUSD'):
+    return {'symbol': symbol, 'clOrdID': clOrdID, 'orderQty': 10, 'side': 'Buy', 'price': price, 'ordType': 'Limit'}
+
+
+def execution(clOrdID, execID, ordStatus='Filled'):
+    return {
+        'table': 'execution', 'action': 'insert',
+        'data': [{
+            'symbol': 'XBTUSD', 'clOrdID': clOrdID, 'orderID': 'order-' + clOrdID, 'execID': execID,
+            'side': 'Buy', 'execType': 'Trade', 'ordStatus': ordStatus, 'ordType': 'Limit',
+            'price': 7000.0, 'orderQty': 10, 'cumQty': 10, 'leavesQty': 0, 'lastQty': 10, 'lastPx': 7000.0,
+            'transactTime': '2019-12-20T17:42:08.436Z', 'timestamp': '2019-12-20T17:42:08.436Z'
+        }]
+    }
+
+
+def test_round_trip_through_close_and_reopen(tmp_path):
+    path = str(tmp_path / 'orders.journal')
+    journal = OrderJournal(path)
+    journal.record_sent(sent('traderbot_a'))
+    journal.record_response({'symbol': 'XBTUSD', 'clOrdID': 'traderbot_a', 'orderID': 'order-traderbot_a', 'ordStatus': 'New',
+                             'price': 7000.0, 'orderQty': 10, 'timestamp': '2019-12-20T17:42:07.001Z'})
+    journal.apply(execution('traderbot_a', 'exec-1'))
+    # other tables are ignored
+    journal.apply({'table': 'order', 'action': 'insert', 'data': [sent('traderbot_b')]})
+    journal.close()
+
+    journal = OrderJournal(path)
+    rows = journal.to_dicts(journal.query())
+    journal.close()
+
+    assert [row['kind'] for row in rows] == ['sent', 'response', 'execution']
+    assert rows[0]['side'] == 'Buy' and rows[0]['ordType'] == 'Limit' and 'timestamp' not in rows[0]
+    assert rows[1]['ordStatus'] == 'New'
+    assert rows[2]['execID'] == 'exec-1' and rows[2]['lastPx'] == 7000.0 and rows[2]['leavesQty'] == 0
+
+
+def test_latest_merges_each_order_with_bitmex_timestamps(tmp_path):
+    journal = OrderJournal(str(tmp_path / 'orders.journal'))
+    journal.record_sent([sent('traderbot_a'), sent('traderbot_b', price=7001.0)])
+    journal.apply(execution('traderbot_a', 'exec-1'))
+    latest = {order['clOrdID']: order for order in journal.latest(prefix='traderbot_')}
+    journal.close()
+
+    assert latest['traderbot_a']['ordStatus'] == 'Filled'
+    # ISO like every other Bitmex record, not epoch ms
+    assert latest['traderbot_a']['timestamp'] == '2019-12-20T17:42:08.436Z'
+    assert latest['traderbot_b']['price'] == 7001.0
+    assert 'ordStatus' not in latest['traderbot_b']
+
+
+def test_index_lookups_cover_records_appended_since(tmp_path):
+    path = str(tmp_path / 'orders.journal')
+    journal = OrderJournal(path)
+    journal.record_sent([sent('traderbot_a'), sent('other_b'), sent('traderbot_c')])
+    journal.reindex()
+    # past the index
+    journal.record_sent([sent('traderbot_a', price=7002.0), sent('other_d')])
+
+    assert list(journal.query(clOrdID='traderbot_a')['price']) == [7000.0, 7002.0]
+    assert sorted(journal.query(prefix='traderbot_')['clOrdID'].tolist()) == [b'traderbot_a', b'traderbot_a', b'traderbot_c']
+    assert len(journal.query(prefix='other_', symbol='XBTUSD')) == 2
+    assert len(journal.query(clOrdID='missing')) == 0
+    journal.close()
+
+    # index written by close covers all of them
+    journal = OrderJournal(path)
+    assert journal._indexed == 5
+    assert len(journal.query(prefix='traderbot_')) == 3
+    journal.close()
+
+
+def test_query_by_time(tmp_path):
+    journal = OrderJournal(str(tmp_path / 'orders.journal'))
+    journal.record_sent(sent('traderbot_a'))
+    first = int(journal.query()['ts'][-1])
+    journal._last_ts = first + 1000
+    journal.record_sent(sent('traderbot_b'))
+
+    assert journal.query(until=first + 1)['clOrdID'].tolist() == [b'traderbot_a']
+    assert journal.query(since=first + 1)['clOrdID'].tolist() == [b'traderbot_b']
+    journal.close()
+
+
+def test_appends_are_flushed_by_the_background_thread(tmp_path):
+    path = tmp_path / 'orders.journal'
+    journal = OrderJournal(str(path), flush_interval=0.05)
+    size = path.stat().st_size
+    journal.record_sent(sent('traderbot_a'))
+    # still buffered, nothing written on the caller's thread
+    assert path.stat().st_size == size
+    journal._closed.wait(0.3)
+    assert path.stat().st_size > size
+    journal.close()
+
+
+def test_too_long_strings_are_logged(tmp_path, caplog):
+    journal = OrderJournal(str(tmp_path / 'orders.journal'))
+    with caplog.at_level(logging.WARNING):
+        journal.record_sent(sent('traderbot_' + 'x' * 40))
+    journal.close()
+
+    assert 'clOrdID' in caplog.text and 'longer than 36 bytes' in caplog.text
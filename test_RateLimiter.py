@@ -0,0 +1,78 @@
+import time
+import asyncio
+from RateLimiter import RateLimiter
+
+
+def test_acquire_takes_a_token_and_done_gives_back_the_slot():
+    async def run():
+        limiter = RateLimiter(limit=10, timeframe=60)
+        await limiter.acquire()
+        await limiter.acquire()
+        assert limiter.in_flight == 2
+        assert 7.9 < limiter.available() < 8.1
+        limiter.done()
+        limiter.done()
+        assert limiter.in_flight == 0
+        # done never goes below 0
+        limiter.done()
+        assert limiter.in_flight == 0
+    asyncio.run(run())
+
+
+def test_acquire_waits_for_a_refill():
+    async def run():
+        # 20 tokens a sec
+        limiter = RateLimiter(limit=2, timeframe=0.1)
+        await limiter.acquire()
+        await limiter.acquire()
+        start = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - start
+    waited = asyncio.run(run())
+    assert 0.03 < waited < 0.5
+
+
+def test_done_syncs_from_headers():
+    async def run():
+        limiter = RateLimiter(limit=60, timeframe=60, reserve=1)
+        await limiter.acquire()
+        await limiter.acquire()
+        limiter.done({'X-RateLimit-Limit': '120', 'X-RateLimit-Remaining': '10'})
+        return limiter
+    limiter = asyncio.run(run())
+    assert limiter.limit == 120
+    # 10 remaining, less the call still in flight and the reserve
+    assert 7.9 < limiter.available() < 8.1
+
+
+def test_done_without_rate_limit_headers_keeps_the_bucket():
+    async def run():
+        limiter = RateLimiter(limit=10, timeframe=60)
+        await limiter.acquire()
+        limiter.done({'Content-Type': 'application/json'})
+        return limiter
+    limiter = asyncio.run(run())
+    assert limiter.limit == 10
+    assert 8.9 < limiter.available() < 9.1
+
+
+def test_block_until_holds_every_caller():
+    async def run():
+        limiter = RateLimiter(limit=10, timeframe=60)
+        limiter.block_until(time.time() + 0.2)
+        start = time.monotonic()
+        await asyncio.gather(limiter.acquire(), limiter.acquire())
+        return time.monotonic() - start, limiter.in_flight
+    waited, in_flight = asyncio.run(run())
+    assert waited >= 0.15
+    assert in_flight == 2
+
+
+def test_block_until_in_the_past_does_not_block():
+    async def run():
+        limiter = RateLimiter(limit=10, timeframe=60)
+        limiter.block_until(time.time() - 5)
+        start = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - start
+    assert asyncio.run(run()) < 0.05
@@ -0,0 +1,74 @@
+import random
+import pytest
+from SignalRules import SignalRules, EXCHANGES
+from TokenAnalyst import TokenAnalyst
+from Exceptions import InvalidArgError
+
+
+def flow(flowType, value, to):
+    return {'flowType': flowType, 'value': value, 'to': list(to), 'from': ['Unknown'], 'blockNumber': 600000}
+
+
+def test_same_as_check_for_inflow_and_outflow():
+    token_analyst = TokenAnalyst(key='key')
+    rng = random.Random(11)
+    thresholds = [None, 0, 1, 5, 10.5, 100, 1000]
+
+    # ( name, flowType, threshold, exchange ), every exchange and All with each threshold
+    rules = []
+    for flowType in ('Inflow', 'Outflow'):
+        for exchange in EXCHANGES + ['All']:
+            for threshold in thresholds:
+                rules.append(('%s_%s_%s' % (flowType, exchange, threshold), flowType, threshold, exchange))
+    engine = SignalRules()
+    for name, flowType, threshold, exchange in rules:
+        engine.add(name, flowType=flowType, threshold=threshold, exchange=exchange)
+
+    # values equal to every threshold, and either side of them
+    values = [t + d for t in thresholds if t for d in (-0.5, 0, 0.5)] + [rng.uniform(0.01, 2000) for _ in range(200)]
+    flows = []
+    for value in values:
+        for flowType in ('Inflow', 'Outflow'):
+            to = rng.sample(EXCHANGES + ['Coinbase', 'Unknown'], rng.randint(0, 3))
+            flows.append(flow(flowType, value, to))
+
+    for data in flows:
+        expected = []
+        for name, flowType, threshold, exchange in rules:
+            check = token_analyst.check_for_inflow if flowType == 'Inflow' else token_analyst.check_for_outflow
+            if check(data, threshold=threshold, exchange=exchange):
+                expected.append(name)
+        assert engine.match(data) == expected, data
+
+
+def test_threshold_is_inclusive_and_max_value_caps():
+    engine = SignalRules()
+    engine.add('big', threshold=100)
+    engine.add('band', threshold=10, max_value=100)
+
+    assert engine.match(flow('Outflow', 100, ['Bitmex'])) == ['big', 'band']
+    assert engine.match(flow('Outflow', 100.5, ['Bitmex'])) == ['big']
+    assert engine.match(flow('Outflow', 9.99, ['Bitmex'])) == []
+    assert engine.match(flow('Inflow', 100, ['Bitmex'])) == []
+    assert engine.match(flow('Outflow', 100, ['Binance'])) == []
+
+
+def test_rules_fire_in_the_order_added():
+    engine = SignalRules()
+    engine.add('c', threshold=30, exchange='All')
+    engine.add('a', threshold=10, exchange=['Binance', 'Bitmex'])
+    engine.add('b', threshold=20)
+
+    assert engine.match(flow('Outflow', 50, ['Bitmex'])) == ['c', 'a', 'b']
+    engine.remove('a')
+    engine.add('c', threshold=30, exchange='Kraken')
+    assert engine.rules() == ['b', 'c']
+    assert engine.match(flow('Outflow', 50, ['Bitmex'])) == ['b']
+
+
+def test_bad_rules_are_rejected():
+    engine = SignalRules()
+    with pytest.raises(InvalidArgError):
+        engine.add('x', flowType='Sideways')
+    with pytest.raises(InvalidArgError):
+        engine.add('x', exchange='Coinbase')
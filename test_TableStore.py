@@ -0,0 +1,114 @@
+from TableStore import TableStore
+
+
+def order(orderID, symbol='XBTUSD', ordStatus='New', price=7000):
+    return {'orderID': orderID, 'symbol': symbol, 'ordStatus': ordStatus, 'price': price}
+
+
+def msg(action, data, table='order', keys=('orderID',)):
+    m = {'table': table, 'action': action, 'data': data}
+    if action == 'partial':
+        m['keys'] = list(keys)
+    return m
+
+
+def ids(rows):
+    return sorted(row['orderID'] for row in rows)
+
+
+def store():
+    return TableStore(maxlen=3, indexes={'order': ['symbol', 'ordStatus']})
+
+
+def test_rows_before_the_partial_are_skipped():
+    tables = store()
+    tables.apply(msg('insert', [order('a')]))
+    assert not tables['order'].is_ready()
+    assert len(tables['order']) == 0
+
+    tables.apply(msg('partial', [order('b')]))
+    tables.apply(msg('insert', [order('c')]))
+    assert ids(tables['order'].values()) == ['b', 'c']
+    assert tables['order'].get('c')['price'] == 7000
+
+
+def test_update_moves_a_row_between_index_values():
+    tables = store()
+    tables.apply(msg('partial', [order('a'), order('b')]))
+    tables.apply(msg('update', [{'orderID': 'a', 'ordStatus': 'Filled'}]))
+
+    table = tables['order']
+    assert ids(table.get_by('ordStatus', 'New')) == ['b']
+    assert ids(table.get_by('ordStatus', 'Filled')) == ['a']
+    assert table.get('a')['price'] == 7000
+    assert table.last()['orderID'] == 'a'
+
+    # unknown rows aren't added by an update
+    tables.apply(msg('update', [{'orderID': 'x', 'ordStatus': 'Filled'}]))
+    assert len(table) == 2
+
+
+def test_delete_removes_a_row_from_every_index():
+    tables = store()
+    tables.apply(msg('partial', [order('a'), order('b', symbol='ETHUSD')]))
+    tables.apply(msg('delete', [{'orderID': 'b', 'symbol': 'ETHUSD'}]))
+
+    table = tables['order']
+    assert table.get('b') is None
+    assert table.get_by('symbol', 'ETHUSD') == []
+    assert ids(table.get_by('ordStatus', 'New')) == ['a']
+    # empty index values are dropped, not left behind
+    assert 'ETHUSD' not in table._indexes['symbol']
+
+
+def test_trim_drops_oldest_rows_from_every_index():
+    tables = store()
+    tables.apply(msg('partial', [order('a', symbol='ETHUSD'), order('b')]))
+    tables.apply(msg('insert', [order('c'), order('d')]))
+
+    table = tables['order']
+    assert len(table) == 3
+    assert table.get('a') is None
+    assert table.get_by('symbol', 'ETHUSD') == []
+    assert ids(table.get_by('symbol', 'XBTUSD')) == ['b', 'c', 'd']
+    assert ids(table.get_by('ordStatus', 'New')) == ['b', 'c', 'd']
+
+
+def test_insert_of_a_known_key_replaces_the_row():
+    tables = store()
+    tables.apply(msg('partial', [order('a')]))
+    tables.apply(msg('insert', [order('a', symbol='ETHUSD')]))
+
+    table = tables['order']
+    assert len(table) == 1
+    assert table.get_by('symbol', 'XBTUSD') == []
+    assert ids(table.get_by('symbol', 'ETHUSD')) == ['a']
+
+
+def test_partial_again_replaces_the_contents():
+    tables = store()
+    tables.apply(msg('partial', [order('a'), order('b')]))
+    tables.apply(msg('update', [{'orderID': 'a', 'ordStatus': 'Filled'}]))
+
+    # ie resubscribed after a reconnect
+    tables.apply(msg('partial', [order('c', ordStatus='PartiallyFilled')]))
+
+    table = tables['order']
+    assert ids(table.values()) == ['c']
+    assert table.get('a') is None
+    assert table.get_by('ordStatus', 'Filled') == []
+    assert table.get_by('ordStatus', 'New') == []
+    assert ids(table.get_by('ordStatus', 'PartiallyFilled')) == ['c']
+
+
+def test_keyless_table_keeps_the_last_rows():
+    tables = store()
+    tables.apply(msg('partial', [{'trdMatchID': 't0'}], table='trade', keys=()))
+    tables.apply(msg('insert', [{'trdMatchID': 't%d' % i} for i in range(1, 5)], table='trade'))
+
+    trades = tables['trade']
+    assert trades.is_ready()
+    assert [t['trdMatchID'] for t in trades.values()] == ['t2', 't3', 't4']
+    assert trades.last()['trdMatchID'] == 't4'
+    # only tables with data or asked for exist
+    assert 'trade' in tables and 'position' not in tables
@@ -0,0 +1,117 @@
+import numpy as np
+from TradeTape import TradeTape
+from Ingest import pack_trades, unpack_trades
+
+
+def trade(ms, price, size=100, side='Buy', id=None):
+    """Bitmex trade row at 2019-12-20T17:42:08 plus `ms`."""
+    return {
+        'timestamp': '2019-12-20T17:42:%02d.%03dZ' % (8 + ms // 1000, ms % 1000),
+        'symbol': 'XBTUSD',
+        'side': side,
+        'size': size,
+        'price': price,
+        'trdMatchID': id or 'id-%d-%s' % (ms, price)
+    }
+
+
+def test_replayed_partial_is_not_double_counted():
+    tape = TradeTape(capacity=100)
+    trades = [trade(0, 7000), trade(1, 7001), trade(1, 7002, id='b'), trade(1, 7003, id='c')]
+    tape.append(trades)
+    before = tape.stats()
+
+    # resubscribe partial repeats the last trades, the last ms included
+    tape.append(trades[1:])
+
+    assert len(tape) == 4
+    assert tape.stats() == before
+    assert tape.volume() == 400
+
+
+def test_new_trades_at_the_last_timestamp_are_kept():
+    tape = TradeTape(capacity=100)
+    tape.append([trade(0, 7000), trade(5, 7001, id='a')])
+    # same ms as the last trade, a different match, plus a later one
+    tape.append([trade(5, 7001, id='a'), trade(5, 7002, id='b'), trade(6, 7003)])
+
+    assert len(tape) == 4
+    assert tape.last_price() == 7003
+    assert tape.volume() == 400
+
+    # ids at the last timestamp move on with it
+    tape.append([trade(5, 7002, id='b'), trade(6, 7003), trade(7, 7004)])
+    assert len(tape) == 5
+
+
+def test_older_trades_are_skipped():
+    tape = TradeTape(capacity=100)
+    tape.append([trade(10, 7000)])
+    tape.append([trade(5, 6000), trade(11, 7001)])
+
+    assert len(tape) == 2
+    assert tape.stats()['low'] == 7000
+
+
+def test_vwap_and_volume_by_side():
+    tape = TradeTape(capacity=100)
+    tape.append([trade(0, 100, size=1, side='Buy'), trade(1, 200, size=3, side='Sell')])
+
+    assert tape.vwap() == 175
+    assert tape.volume(side='Buy') == 1
+    assert tape.volume(side='Sell') == 3
+
+
+def test_append_columns_without_ids_keeps_trades_at_the_last_timestamp():
+    tape = TradeTape(capacity=100)
+    tape.append_columns(np.array([1, 2]), [1.0, 2.0], [10, 10], [1, 1])
+    tape.append_columns(np.array([1, 2, 3]), [1.0, 2.0, 3.0], [10, 10, 10], [1, 1, 1])
+
+    # the trade at 1 is older, the one at 2 can't be told apart from a new one without ids
+    assert len(tape) == 4
+
+
+def test_packed_trades_from_the_feed_process_are_deduped():
+    tape = TradeTape(capacity=100)
+    trades = [trade(0, 7000), trade(1, 7001, id='a'), trade(1, 7002, id='b')]
+    tape.append(trades[:2])
+
+    # live insert through Ingest at the same ms, then a partial through append
+    _, rows = unpack_trades(pack_trades('XBTUSD', trades[1:]))
+    tape.append_columns(rows['ts'], rows['price'], rows['size'], rows['side'], ids=rows['id'].astype(str))
+    tape.append(trades)
+
+    assert len(tape) == 3
+    assert tape.volume() == 300
+
+
+def test_wraps_around_keeping_the_newest():
+    tape = TradeTape(capacity=4)
+    tape.append([trade(i, 7000 + i) for i in range(6)])
+    tape.append([trade(6, 7006)])
+
+    assert len(tape) == 4
+    ts, price, size, side = tape.columns()
+    assert list(price) == [7003, 7004, 7005, 7006]
+
+
+def test_ids_at_the_last_timestamp_kept_past_capacity():
+    tape = TradeTape(capacity=3)
+    # more than capacity, the last ms holds a and b
+    tape.append([trade(0, 7000, id='x'), trade(1, 7001, id='y'), trade(2, 7002, id='z'), trade(3, 7003, id='a'), trade(3, 7004, id='b')])
+    # only the ids at the last ms, not the trades cut off for capacity
+    assert tape._last_ids == {'a', 'b'}
+    tape.append([trade(3, 7003, id='a'), trade(3, 7004, id='b'), trade(3, 7005, id='c')])
+
+    ts, price, size, side = tape.columns()
+    assert list(price) == [7003, 7004, 7005]
+
+
+def test_rows_without_ids_dont_hide_later_ones():
+    tape = TradeTape(capacity=100)
+    tape.append([trade(0, 7000), trade(5, 7001, id='a'), dict(trade(5, 7002), trdMatchID='')])
+    # no ids, at the same ms as the last trade
+    tape.append_columns(np.array([5, 5]) + tape.last_timestamp() - 5, [7003.0, 7004.0], [100, 100], [1, 1], ids=['', None])
+
+    assert len(tape) == 5
+    assert tape.last_price() == 7004
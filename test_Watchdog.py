@@ -0,0 +1,42 @@
+import asyncio
+from Watchdog import Watchdog
+from Metrics import metrics
+
+
+class Transport:
+    aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+class Websocket:
+    """Connection that never sends a frame."""
+
+    def __init__(self):
+        self.transport = Transport()
+
+    async def send(self, msg):
+        pass
+
+
+def test_starts_stale_till_resynced():
+    watchdog = Watchdog('test_start')
+    assert watchdog.stale
+
+
+def test_connection_metrics_only_where_watch_runs():
+    watchdog = Watchdog('test_metrics', stale_after=0.05, ping_interval=None)
+    # ie the strategy process with feed processes, the stale flag is all it has
+    assert 'feed="test_metrics"' in metrics.render()
+    assert 'traderbot_feed_silent_seconds{feed="test_metrics"}' not in metrics.render()
+
+    watchdog.stale = False
+    websocket = Websocket()
+    asyncio.run(watchdog.watch(websocket))
+
+    assert websocket.transport.aborted
+    assert watchdog.stale
+    rendered = metrics.render()
+    assert 'traderbot_feed_silent_seconds{feed="test_metrics"}' in rendered
+    assert 'traderbot_feed_stale_total{feed="test_metrics"} 1' in rendered